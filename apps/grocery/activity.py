@@ -0,0 +1,37 @@
+"""
+Per-list activity feed.
+
+Every change recorded with ``outbox.record_events`` that concerns a list's
+items or the list itself is also written as a ListActivity row, in the same
+transaction and with one INSERT per call, so bulk actions add their whole
+history at once. The feed is read newest first with keyset pagination over
+the ``(grocery_list, id)`` index.
+"""
+from .models import ListActivity
+
+# list.deleted is left out: the list's activity is deleted along with it.
+FEED_EVENTS = ('item.', 'list.updated')
+
+
+def activity_for(event):
+    """
+    The ListActivity row describing outbox ``event``, or None if it has no
+    place in a list's feed.
+    """
+    if event.grocery_list_id is None or not event.event_type.startswith(FEED_EVENTS):
+        return None
+    is_item = event.event_type.startswith('item.')
+    return ListActivity(
+        grocery_list_id=event.grocery_list_id,
+        verb=event.event_type,
+        actor_id=event.actor_id,
+        item_id=event.payload.get('id') if is_item else None,
+        item_name=event.payload.get('name', '') if is_item else '',
+        payload=event.payload
+    )
+
+
+def record_activity(events):
+    activities = [activity for activity in map(activity_for, events) if activity is not None]
+    if activities:
+        ListActivity.objects.bulk_create(activities)
@@ -1,5 +1,12 @@
 from django.contrib import admin
-from .models import GroceryList, GroceryItem
+from django.db.models import Count, Q
+from django.urls import reverse
+from django.utils.html import format_html
+from .models import GroceryList, GroceryItem, ListActivity, OutboxEvent, StapleTemplate, StapleTemplateItem
+
+# Lists with more items than this link to the paginated item changelist
+# instead of rendering every item inline.
+INLINE_ITEMS_LIMIT = 50
 
 
 class GroceryItemInline(admin.TabularInline):
@@ -13,22 +20,85 @@ class GroceryItemInline(admin.TabularInline):
 class GroceryListAdmin(admin.ModelAdmin):
     list_display = ['name', 'group', 'active_items_count', 'purchased_items_count', 'updated_at']
     list_filter = ['created_at', 'updated_at']
+    list_select_related = ['group']
     search_fields = ['name', 'group__name']
     raw_id_fields = ['group']
+    readonly_fields = ['items_link']
     inlines = [GroceryItemInline]
+    show_full_result_count = False
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            _active_items_count=Count('items', filter=Q(items__is_purchased=False)),
+            _purchased_items_count=Count('items', filter=Q(items__is_purchased=True)),
+        )
+    
+    def get_inlines(self, request, obj):
+        if obj is not None and obj._active_items_count + obj._purchased_items_count > INLINE_ITEMS_LIMIT:
+            return []
+        return super().get_inlines(request, obj)
     
     def active_items_count(self, obj):
-        return obj.items.filter(is_purchased=False).count()
+        return obj._active_items_count
     active_items_count.short_description = 'Active Items'
+    active_items_count.admin_order_field = '_active_items_count'
     
     def purchased_items_count(self, obj):
-        return obj.items.filter(is_purchased=True).count()
+        return obj._purchased_items_count
     purchased_items_count.short_description = 'Purchased Items'
+    purchased_items_count.admin_order_field = '_purchased_items_count'
+    
+    def items_link(self, obj):
+        if obj.pk is None:
+            return '-'
+        url = reverse('admin:grocery_groceryitem_changelist')
+        count = obj._active_items_count + obj._purchased_items_count
+        return format_html('<a href="{}?grocery_list__id__exact={}">View {} items</a>', url, obj.pk, count)
+    items_link.short_description = 'Items'
 
 
 @admin.register(GroceryItem)
 class GroceryItemAdmin(admin.ModelAdmin):
     list_display = ['name', 'grocery_list', 'quantity', 'category', 'is_purchased', 'added_by', 'created_at']
     list_filter = ['is_purchased', 'category', 'created_at']
+    list_select_related = ['grocery_list__group', 'added_by']
     search_fields = ['name', 'notes', 'grocery_list__name']
-    raw_id_fields = ['grocery_list', 'added_by', 'purchased_by']
\ No newline at end of file
+    raw_id_fields = ['grocery_list', 'added_by', 'purchased_by']
+    show_full_result_count = False
+
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ['id', 'event_type', 'group_id', 'sequence', 'status', 'attempts', 'next_attempt_at', 'created_at']
+    list_filter = ['status', 'event_type']
+    readonly_fields = [
+        'event_type', 'group_id', 'sequence', 'grocery_list_id', 'actor_id', 'payload', 'status',
+        'attempts', 'next_attempt_at', 'last_error', 'created_at', 'delivered_at'
+    ]
+    show_full_result_count = False
+
+
+@admin.register(ListActivity)
+class ListActivityAdmin(admin.ModelAdmin):
+    # Filter by list with ?grocery_list__id__exact=; a list_filter would load every list.
+    list_display = ['id', 'verb', 'item_name', 'actor', 'created_at']
+    list_filter = ['verb']
+    list_select_related = ['actor']
+    raw_id_fields = ['grocery_list', 'actor']
+    readonly_fields = ['grocery_list', 'verb', 'actor', 'item_id', 'item_name', 'payload', 'created_at']
+    show_full_result_count = False
+
+
+class StapleTemplateItemInline(admin.TabularInline):
+    model = StapleTemplateItem
+    extra = 0
+    fields = ['name', 'quantity', 'category', 'notes']
+
+
+@admin.register(StapleTemplate)
+class StapleTemplateAdmin(admin.ModelAdmin):
+    list_display = ['name', 'group', 'created_by', 'updated_at']
+    list_select_related = ['group', 'created_by']
+    search_fields = ['name', 'group__name']
+    raw_id_fields = ['group', 'created_by']
+    inlines = [StapleTemplateItemInline]
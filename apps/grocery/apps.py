@@ -1,7 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_save
 
 
 class GroceryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.grocery'
     verbose_name = 'Grocery Lists'
+
+    def ready(self):
+        from .models import provision_grocery_list
+
+        UserGroup = self.apps.get_model('usergroups', 'UserGroup')
+        post_save.connect(provision_grocery_list, sender=UserGroup, dispatch_uid='provision_grocery_list')
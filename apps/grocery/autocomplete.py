@@ -0,0 +1,45 @@
+"""
+Item-name autocomplete served from the per-group ItemNameStat table.
+"""
+from django.utils import timezone
+
+from .counters import upsert_increment
+from .models import ItemNameStat, normalize_item_name
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 25
+
+
+def record_item_names(group_id, names, used_at=None):
+    """
+    Count one use of each name in ``names`` for the group's autocomplete index.
+    """
+    used_at = used_at or timezone.now()
+    rows = [
+        {
+            'group_id': group_id,
+            'normalized_name': normalize_item_name(name),
+            'name': name.strip(),
+            'use_count': 1,
+            'last_used_at': used_at,
+        }
+        for name in names
+        if name and name.strip()
+    ]
+    upsert_increment(
+        ItemNameStat,
+        rows,
+        key_fields=['group_id', 'normalized_name'],
+        increment_fields=['use_count'],
+        replace_fields=['name', 'last_used_at'],
+    )
+
+
+def suggest_item_names(group_id, prefix, limit=DEFAULT_LIMIT):
+    """
+    Most frequently and most recently used names in the group starting with ``prefix``.
+    """
+    return ItemNameStat.objects.filter(
+        group_id=group_id,
+        normalized_name__startswith=normalize_item_name(prefix)
+    ).order_by('-use_count', '-last_used_at')[:min(limit, MAX_LIMIT)]
@@ -0,0 +1,107 @@
+"""
+Optimistic concurrency control for grocery lists and items.
+
+Every write bumps the row's ``version``. Single-object responses carry it as
+an ETag, and writes sent with a matching ``If-Match`` only apply if the row
+still has that version (a compare-and-swap UPDATE); otherwise they fail with
+412 Precondition Failed. Aggregate payloads use a content hash as their ETag
+and answer a matching ``If-None-Match`` with 304 Not Modified.
+"""
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.cache import patch_cache_control
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'The resource was modified by someone else. Reload it and try again.'
+    default_code = 'precondition_failed'
+
+
+def make_etag(version):
+    return f'"{version}"'
+
+
+def parse_etags(header):
+    """
+    Versions listed in an If-Match / If-None-Match header; weak tags are accepted.
+    """
+    tags = []
+    for tag in header.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        tags.append(tag.strip('"'))
+    return tags
+
+
+def payload_etag(data):
+    """
+    Content hash of a serializable payload, for responses without a row version.
+    """
+    body = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder)
+    return make_etag(hashlib.sha1(body.encode()).hexdigest())
+
+
+def not_modified(request, etag):
+    """
+    True when the request's If-None-Match already names ``etag``.
+    """
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    return header.strip() == '*' or etag.strip('"') in parse_etags(header)
+
+
+def conditional_response(request, data):
+    """
+    Response for ``data`` tagged with its content hash, or 304 if the client has it.
+    """
+    etag = payload_etag(data)
+    if not_modified(request, etag):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(data)
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def check_if_match(request, obj):
+    """
+    Validate ``If-Match`` against the loaded object.
+
+    Returns True when the write must be conditional on ``obj.version`` and
+    raises PreconditionFailed if the header names a different version.
+    """
+    header = request.headers.get('If-Match')
+    if not header or header.strip() == '*':
+        return False
+    if str(obj.version) not in parse_etags(header):
+        raise PreconditionFailed()
+    return True
+
+
+def save_or_fail(obj, fields, conditional):
+    """
+    Persist ``fields`` on ``obj``; conditional writes raise 412 if they lost the race.
+    """
+    if not obj.save_versioned(fields, force=not conditional):
+        raise PreconditionFailed()
+
+
+class VersionETagMixin:
+    """
+    Sets an ETag on responses that serialize a single versioned object.
+    """
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        data = getattr(response, 'data', None)
+        if isinstance(data, dict) and 'version' in data and not response.has_header('ETag'):
+            response['ETag'] = make_etag(data['version'])
+        return response
@@ -0,0 +1,84 @@
+"""
+Atomic counter upserts for the incrementally maintained summary tables.
+"""
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import F
+
+
+def upsert_increment(model, rows, key_fields, increment_fields, replace_fields=()):
+    """
+    Insert ``rows`` or, when a row with the same ``key_fields`` exists, add
+    their ``increment_fields`` to it and overwrite ``replace_fields``.
+
+    Rows sharing a key are combined first. Uses a single
+    ``INSERT ... ON CONFLICT DO UPDATE`` where the backend supports it and an
+    UPDATE-then-INSERT loop elsewhere.
+    """
+    merged = {}
+    for row in rows:
+        key = tuple(row[field] for field in key_fields)
+        if key in merged:
+            existing = merged[key]
+            for field in increment_fields:
+                existing[field] += row[field]
+            for field in replace_fields:
+                existing[field] = row[field]
+        else:
+            merged[key] = dict(row)
+    if not merged:
+        return
+
+    using = router.db_for_write(model)
+    connection = connections[using]
+    if connection.features.supports_update_conflicts_with_target:
+        _upsert_on_conflict(model, connection, list(merged.values()), key_fields, increment_fields, replace_fields)
+    else:
+        _upsert_fallback(model, using, merged.values(), key_fields, increment_fields, replace_fields)
+
+
+def _upsert_on_conflict(model, connection, rows, key_fields, increment_fields, replace_fields):
+    qn = connection.ops.quote_name
+
+    def column(name):
+        return qn(model._meta.get_field(name).column)
+
+    table = qn(model._meta.db_table)
+    names = list(rows[0])
+    fields = [model._meta.get_field(name) for name in names]
+    placeholders = '(' + ', '.join(['%s'] * len(names)) + ')'
+    assignments = [
+        f'{column(name)} = {table}.{column(name)} + EXCLUDED.{column(name)}' for name in increment_fields
+    ] + [
+        f'{column(name)} = EXCLUDED.{column(name)}' for name in replace_fields
+    ]
+    batch_size = max(connection.ops.bulk_batch_size(fields, rows), 1)
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            params = []
+            for row in batch:
+                params.extend(
+                    field.get_db_prep_save(row[name], connection) for name, field in zip(names, fields)
+                )
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(column(name) for name in names)}) "
+                f"VALUES {', '.join([placeholders] * len(batch))} "
+                f"ON CONFLICT ({', '.join(column(name) for name in key_fields)}) "
+                f"DO UPDATE SET {', '.join(assignments)}",
+                params
+            )
+
+
+def _upsert_fallback(model, using, rows, key_fields, increment_fields, replace_fields):
+    manager = model._default_manager.using(using)
+    for row in rows:
+        lookup = {field: row[field] for field in key_fields}
+        changes = {field: F(field) + row[field] for field in increment_fields}
+        changes.update({field: row[field] for field in replace_fields})
+        if manager.filter(**lookup).update(**changes):
+            continue
+        try:
+            with transaction.atomic(using=using):
+                manager.create(**row)
+        except IntegrityError:
+            manager.filter(**lookup).update(**changes)
@@ -0,0 +1,120 @@
+"""
+Idempotency keys for mutating endpoints.
+
+A request sent with an ``Idempotency-Key`` header claims the key for the
+user before it runs. The response it produced is stored with the claim, in
+the same transaction as the mutation, and a retry with the same key is
+answered from the stored copy by a single indexed lookup. Keys are kept
+for ``IDEMPOTENCY_KEY_TTL_HOURS``; ``purge_idempotency_records`` sweeps
+expired ones.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyRecord
+from grocery_manager.sharding import current_shard
+
+HEADER = 'Idempotency-Key'
+REPLAY_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = IdempotencyRecord._meta.get_field('key').max_length
+# A claim without a response older than this belongs to a request that
+# died mid-way and may be taken over.
+CLAIM_TIMEOUT = timedelta(minutes=1)
+
+
+def request_fingerprint(request):
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    payload = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(f'{request.method} {request.get_full_path()}\n{payload}'.encode()).hexdigest()
+
+
+def _claim(request, key, fingerprint):
+    """
+    Claim ``key`` for this request. Returns the new record, or a response to
+    send instead when the key is already taken.
+    """
+    now = timezone.now()
+    records = IdempotencyRecord.objects.filter(user=request.user, key=key)
+    record = records.first()
+    if record is not None:
+        taken_over = record.status_code is None and record.created_at < now - CLAIM_TIMEOUT
+        if record.expires_at > now and not taken_over:
+            return _replay(record, fingerprint)
+        records.filter(pk=record.pk).delete()
+
+    try:
+        with transaction.atomic(using=current_shard()):
+            return IdempotencyRecord.objects.create(
+                user=request.user,
+                key=key,
+                fingerprint=fingerprint,
+                expires_at=now + timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+            )
+    except IntegrityError:
+        # A concurrent request with the same key claimed it first.
+        return _replay(records.get(), fingerprint)
+
+
+def _replay(record, fingerprint):
+    if record.fingerprint != fingerprint:
+        return Response(
+            {'detail': f'{HEADER} was already used for a different request.'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    if record.status_code is None:
+        return Response(
+            {'detail': f'A request with this {HEADER} is still being processed.'},
+            status=status.HTTP_409_CONFLICT
+        )
+    response = Response(record.response_body, status=record.status_code)
+    response[REPLAY_HEADER] = 'true'
+    return response
+
+
+def idempotent(view_method):
+    """
+    Make a viewset method replayable with an ``Idempotency-Key`` header.
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {'detail': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        claim = _claim(request, key, request_fingerprint(request))
+        if isinstance(claim, Response):
+            return claim
+
+        try:
+            with transaction.atomic(using=current_shard()):
+                response = view_method(self, request, *args, **kwargs)
+                if response.status_code < 500:
+                    IdempotencyRecord.objects.filter(pk=claim.pk).update(
+                        status_code=response.status_code,
+                        response_body=response.data
+                    )
+                    return response
+        except Exception:
+            IdempotencyRecord.objects.filter(pk=claim.pk).delete()
+            raise
+        # Server errors are not stored, so the client can retry them.
+        IdempotencyRecord.objects.filter(pk=claim.pk).delete()
+        return response
+
+    return wrapper
@@ -0,0 +1,32 @@
+from apps.grocery.merging import claim_merge_keys
+from apps.grocery.models import GroceryItem
+from grocery_manager.sharding import ShardedCommand
+
+
+class Command(ShardedCommand):
+    help = (
+        'Give active items without a merge key their normalized name as key, oldest first, '
+        'so merge mode matches them. Duplicates of an item already holding the key are left without one.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        items = GroceryItem.objects.filter(is_purchased=False, merge_key__isnull=True).order_by('id')
+
+        checked = claimed = 0
+        last_id = 0
+        while True:
+            batch = list(items.filter(id__gt=last_id).only(
+                'grocery_list_id', 'name', 'category', 'is_purchased', 'merge_key'
+            )[:batch_size])
+            if not batch:
+                break
+            claim_merge_keys(batch)
+            checked += len(batch)
+            claimed += sum(item.merge_key is not None for item in batch)
+            last_id = batch[-1].id
+
+        self.stdout.write(self.style.SUCCESS(f'Set merge keys on {claimed} of {checked} active items.'))
@@ -0,0 +1,67 @@
+import json
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.grocery.models import GroceryItem
+from apps.grocery.serializers import GroceryItemSerializer
+from apps.users.models import User
+from grocery_manager.middleware import CODECS, INSTALLED
+
+NAMES = ['Milk', 'Whole wheat bread', 'Eggs (dozen)', 'Bananas', 'Chicken thighs', 'Greek yogurt', 'Coffee beans']
+
+
+class Command(BaseCommand):
+    help = 'Report compressed size and CPU time per response for typical grocery list payloads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 50, 200, 1000, 5000])
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        codecs = [CODECS[name] for name in settings.COMPRESSION_ENCODINGS if INSTALLED.get(name)]
+        missing = [name for name in settings.COMPRESSION_ENCODINGS if not INSTALLED.get(name)]
+        if missing:
+            self.stdout.write(f'Not installed, skipped: {", ".join(missing)}')
+
+        self.stdout.write(f'{"items":>6} {"encoding":>8} {"bytes":>10} {"ratio":>6} {"ms/response":>12}')
+        for size in options['sizes']:
+            body = json.dumps(GroceryItemSerializer(self.sample_items(size), many=True).data).encode()
+            self.stdout.write(f'{size:>6} {"identity":>8} {len(body):>10} {1:>6.2f} {0:>12.3f}')
+            for codec in codecs:
+                start = time.process_time()
+                for _ in range(options['repeat']):
+                    compressed = codec.compress(body)
+                elapsed = (time.process_time() - start) / options['repeat'] * 1000
+                self.stdout.write(
+                    f'{size:>6} {codec.name:>8} {len(compressed):>10} '
+                    f'{len(body) / len(compressed):>6.2f} {elapsed:>12.3f}'
+                )
+
+    def sample_items(self, count):
+        """
+        Unsaved items shaped like real list contents, so no database is needed.
+        """
+        now = timezone.now()
+        user = User(id=1, username='alex', email='alex@example.com', first_name='Alex', last_name='Doe')
+        categories = [choice for choice, _ in GroceryItem.Category.choices]
+        return [
+            GroceryItem(
+                id=index + 1,
+                name=NAMES[index % len(NAMES)],
+                quantity=Decimal(index % 5 + 1),
+                category=categories[index % len(categories)],
+                notes='organic if possible' if index % 3 == 0 else '',
+                is_purchased=index % 4 == 0,
+                purchased_at=now if index % 4 == 0 else None,
+                purchased_by=user if index % 4 == 0 else None,
+                added_by=user,
+                version=index % 3 + 1,
+                created_at=now,
+                updated_at=now
+            )
+            for index in range(count)
+        ]
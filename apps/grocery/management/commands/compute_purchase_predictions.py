@@ -0,0 +1,140 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Max
+
+from apps.grocery.models import ItemPrediction, PredictionRun, PurchaseEvent
+from grocery_manager.sharding import ShardedCommand, current_shard
+
+SECONDS_PER_DAY = 86400
+# Fewer intervals than this is too little history to predict from.
+MIN_INTERVALS = 2
+# Purchases closer together than this count as the same shopping trip.
+MIN_INTERVAL_DAYS = 0.5
+# Ids are handed out before commit, so an event can become visible after a
+# run has moved the watermark past it. Each run re-reads this many ids
+# below the watermark to pick such late commits up.
+DEFAULT_OVERLAP = 1000
+
+
+def interval_stats(key_index, times, key_count):
+    """
+    Per-key purchase count, interval count, mean and standard deviation of
+    the intervals (in days) and latest purchase time, for events sorted by
+    key and then time.
+    """
+    same_key = key_index[1:] == key_index[:-1]
+    gaps = np.diff(times) / SECONDS_PER_DAY
+    valid = same_key & (gaps >= MIN_INTERVAL_DAYS)
+    owners = key_index[1:][valid]
+    gaps = gaps[valid]
+
+    intervals = np.bincount(owners, minlength=key_count)
+    total = np.bincount(owners, weights=gaps, minlength=key_count)
+    squares = np.bincount(owners, weights=gaps ** 2, minlength=key_count)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = total / intervals
+        std = np.sqrt(np.maximum(squares / intervals - mean ** 2, 0))
+
+    purchases = np.bincount(key_index, minlength=key_count)
+    latest = np.full(key_count, -np.inf)
+    np.maximum.at(latest, key_index, times)
+    return purchases, intervals, mean, std, latest
+
+
+class Command(ShardedCommand):
+    help = 'Update repeat-purchase predictions for items with purchases since the last run.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recompute every prediction.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Items per batch.')
+        parser.add_argument(
+            '--overlap',
+            type=int,
+            default=DEFAULT_OVERLAP,
+            help='Event ids below the watermark to re-read for late commits.'
+        )
+
+    def handle(self, *args, **options):
+        last_run = PredictionRun.objects.first()
+        watermark = 0 if options['full'] or last_run is None else last_run.last_event_id
+        high = PurchaseEvent.objects.aggregate(high=Max('id'))['high'] or watermark
+
+        keys = set(
+            PurchaseEvent.objects.filter(
+                id__gt=max(watermark - options['overlap'], 0),
+                id__lte=high
+            ).values_list(
+                'group_id', 'normalized_name'
+            ).distinct()
+        )
+        predictions = ItemPrediction.objects.all() if options['full'] else ItemPrediction.objects.filter(stale=True)
+        keys.update(predictions.values_list('group_id', 'normalized_name'))
+        keys = sorted(keys)
+
+        updated = 0
+        batch_size = options['batch_size']
+        for start in range(0, len(keys), batch_size):
+            updated += self.update_predictions(keys[start:start + batch_size])
+
+        PredictionRun.objects.create(last_event_id=high, updated_count=updated)
+        self.stdout.write(self.style.SUCCESS(f'Updated {updated} predictions from {len(keys)} items.'))
+
+    def update_predictions(self, keys):
+        index = {key: position for position, key in enumerate(keys)}
+        events = PurchaseEvent.objects.filter(
+            group_id__in={group_id for group_id, _ in keys},
+            normalized_name__in={name for _, name in keys}
+        ).order_by('group_id', 'normalized_name', 'purchased_at').values_list(
+            'group_id', 'normalized_name', 'name', 'category', 'purchased_at'
+        )
+
+        key_index, times, labels = [], [], {}
+        for group_id, normalized_name, name, category, purchased_at in events.iterator():
+            position = index.get((group_id, normalized_name))
+            if position is None:
+                continue
+            key_index.append(position)
+            times.append(purchased_at.timestamp())
+            labels[position] = (name, category)
+
+        purchases, intervals, mean, std, latest = interval_stats(
+            np.array(key_index, dtype=np.int64),
+            np.array(times, dtype=np.float64),
+            len(keys)
+        )
+
+        fresh, obsolete = [], {}
+        for position, (group_id, normalized_name) in enumerate(keys):
+            if intervals[position] < MIN_INTERVALS:
+                obsolete.setdefault(group_id, []).append(normalized_name)
+                continue
+            last_purchased_at = datetime.fromtimestamp(latest[position], tz=dt_timezone.utc)
+            name, category = labels[position]
+            fresh.append(ItemPrediction(
+                group_id=group_id,
+                normalized_name=normalized_name,
+                name=name,
+                category=category,
+                purchase_count=int(purchases[position]),
+                mean_interval_days=float(mean[position]),
+                interval_std_days=float(std[position]),
+                last_purchased_at=last_purchased_at,
+                next_due_at=last_purchased_at + timedelta(days=float(mean[position])),
+                stale=False
+            ))
+
+        with transaction.atomic(using=current_shard()):
+            ItemPrediction.objects.bulk_create(
+                fresh,
+                update_conflicts=True,
+                unique_fields=['group', 'normalized_name'],
+                update_fields=[
+                    'name', 'category', 'purchase_count', 'mean_interval_days',
+                    'interval_std_days', 'last_purchased_at', 'next_due_at', 'stale',
+                ]
+            )
+            for group_id, names in obsolete.items():
+                ItemPrediction.objects.filter(group_id=group_id, normalized_name__in=names).delete()
+        return len(fresh)
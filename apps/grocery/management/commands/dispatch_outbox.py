@@ -0,0 +1,91 @@
+import json
+import time
+from datetime import timedelta
+from http.server import ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.grocery.models import OutboxEvent
+from apps.grocery.outbox import BATCH_SIZE, StandInHandler, dispatch_batch, get_sink
+from grocery_manager.sharding import shards, use_shard
+
+
+class Command(BaseCommand):
+    help = 'Deliver pending outbox events to the configured sink.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--shard', choices=shards(), help='Only drain this shard.')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new events.')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds between polls with --loop.')
+        parser.add_argument('--retry-failed', action='store_true', help='Requeue events that ran out of attempts.')
+        parser.add_argument(
+            '--purge-days', type=int, default=None,
+            help='Delete delivered events older than this many days.'
+        )
+        parser.add_argument(
+            '--stand-in', metavar='PORT', type=int, default=None,
+            help='Instead of dispatching, run a local HTTP receiver that prints the events it is sent.'
+        )
+
+    def handle(self, *args, **options):
+        if options['stand_in'] is not None:
+            return self.run_stand_in(options['stand_in'])
+
+        aliases = [options['shard']] if options['shard'] else shards()
+        for alias in aliases:
+            with use_shard(alias):
+                self.maintain(options)
+
+        # Each shard has its own outbox; every pass drains them all in turn.
+        sink = get_sink()
+        delivered = failed = 0
+        while True:
+            pass_delivered = 0
+            for alias in aliases:
+                with use_shard(alias):
+                    while True:
+                        batch_delivered, batch_failed = dispatch_batch(sink, options['batch_size'])
+                        pass_delivered += batch_delivered
+                        failed += batch_failed
+                        if not batch_delivered:
+                            break
+            delivered += pass_delivered
+            if not options['loop']:
+                break
+            if not pass_delivered:
+                time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'Delivered {delivered} events; {failed} failed.'))
+
+    def maintain(self, options):
+        if options['retry_failed']:
+            requeued = OutboxEvent.objects.filter(status=OutboxEvent.FAILED).update(
+                status=OutboxEvent.PENDING,
+                attempts=0,
+                next_attempt_at=timezone.now()
+            )
+            self.stdout.write(f'Requeued {requeued} failed events.')
+
+        if options['purge_days'] is not None:
+            purged, _ = OutboxEvent.objects.filter(
+                status=OutboxEvent.DELIVERED,
+                delivered_at__lt=timezone.now() - timedelta(days=options['purge_days'])
+            ).delete()
+            self.stdout.write(f'Purged {purged} delivered events.')
+
+    def run_stand_in(self, port):
+        server = ThreadingHTTPServer(('127.0.0.1', port), StandInHandler)
+        server.on_events = self.print_events
+        self.stdout.write(f'Receiving outbox events on http://127.0.0.1:{server.server_port}/')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+    def print_events(self, events):
+        for event in events:
+            self.stdout.write(json.dumps(event))
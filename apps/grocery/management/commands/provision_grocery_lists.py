@@ -0,0 +1,26 @@
+from apps.grocery.models import GroceryList
+from apps.usergroups.models import UserGroup
+from grocery_manager.sharding import ShardedCommand
+
+
+class Command(ShardedCommand):
+    help = 'Create the grocery list for every group that does not have one yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        groups = UserGroup.objects.filter(grocery_list__isnull=True).order_by('id').only('id', 'name')
+
+        created = 0
+        batch = []
+        for group in groups.iterator(chunk_size=batch_size):
+            batch.append(GroceryList(group=group, name=GroceryList.default_name(group)))
+            if len(batch) >= batch_size:
+                created += len(GroceryList.objects.bulk_create(batch, ignore_conflicts=True))
+                batch = []
+        if batch:
+            created += len(GroceryList.objects.bulk_create(batch, ignore_conflicts=True))
+
+        self.stdout.write(self.style.SUCCESS(f'Provisioned {created} grocery lists.'))
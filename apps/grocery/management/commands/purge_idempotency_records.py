@@ -0,0 +1,24 @@
+from django.utils import timezone
+
+from apps.grocery.models import IdempotencyRecord
+from grocery_manager.sharding import ShardedCommand
+
+
+class Command(ShardedCommand):
+    help = 'Delete idempotency records past their retention window.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        expired = IdempotencyRecord.objects.filter(expires_at__lte=timezone.now())
+
+        deleted = 0
+        while True:
+            ids = list(expired.values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            deleted += IdempotencyRecord.objects.filter(id__in=ids).delete()[0]
+
+        self.stdout.write(self.style.SUCCESS(f'Purged {deleted} idempotency records.'))
@@ -0,0 +1,41 @@
+from django.db import transaction
+
+from apps.grocery.models import GroceryItem, ItemNameStat, normalize_item_name
+from grocery_manager.sharding import ShardedCommand, current_shard
+
+
+class Command(ShardedCommand):
+    help = 'Rebuild the per-group item-name autocomplete index from existing grocery items.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        stats = {}
+        items = GroceryItem.objects.order_by('created_at').values_list(
+            'grocery_list__group_id', 'name', 'created_at'
+        ).iterator(chunk_size=batch_size)
+        for group_id, name, created_at in items:
+            key = (group_id, normalize_item_name(name))
+            if not key[1]:
+                continue
+            stat = stats.get(key)
+            if stat is None:
+                stats[key] = ItemNameStat(
+                    group_id=group_id,
+                    normalized_name=key[1],
+                    name=name.strip(),
+                    use_count=1,
+                    last_used_at=created_at
+                )
+            else:
+                stat.use_count += 1
+                stat.name = name.strip()
+                stat.last_used_at = created_at
+
+        with transaction.atomic(using=current_shard()):
+            ItemNameStat.objects.all().delete()
+            ItemNameStat.objects.bulk_create(stats.values(), batch_size=batch_size)
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {len(stats)} item name entries.'))
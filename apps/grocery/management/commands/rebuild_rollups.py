@@ -0,0 +1,41 @@
+from django.db import transaction
+
+from apps.grocery.models import GroceryItem, PurchaseRollup, TopItemRollup
+from apps.grocery.rollups import apply_purchase_facts, purchase_facts
+from grocery_manager.sharding import ShardedCommand, current_shard
+
+
+class Command(ShardedCommand):
+    help = (
+        'Rebuild the purchase analytics rollups from the purchased items still stored. '
+        'Purchases whose items have since been deleted are dropped from the totals.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        items = GroceryItem.objects.filter(
+            is_purchased=True,
+            purchased_at__isnull=False
+        ).select_related('grocery_list').only(
+            'name', 'category', 'quantity', 'is_purchased', 'purchased_at',
+            'purchased_by_id', 'created_at', 'grocery_list__group_id'
+        ).order_by('purchased_at', 'id')
+
+        counted = 0
+        with transaction.atomic(using=current_shard()):
+            PurchaseRollup.objects.all().delete()
+            TopItemRollup.objects.all().delete()
+            batch = []
+            for item in items.iterator(chunk_size=batch_size):
+                batch.append(purchase_facts(item))
+                if len(batch) >= batch_size:
+                    apply_purchase_facts(added=batch, log=False)
+                    counted += len(batch)
+                    batch = []
+            apply_purchase_facts(added=batch, log=False)
+            counted += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rollups from {counted} purchased items.'))
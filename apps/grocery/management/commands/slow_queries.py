@@ -0,0 +1,40 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from grocery_manager.querylog import SlowQueryStore
+
+
+class Command(BaseCommand):
+    help = 'Report slow queries from the slow-query log, grouped by SQL fingerprint.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=24, help='Only include queries from the last N hours.')
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--explain', action='store_true', help='Show the latest captured plan for each query.')
+        parser.add_argument('--clear', action='store_true', help='Empty the log instead of reporting.')
+
+    def handle(self, *args, **options):
+        store = SlowQueryStore()
+        if options['clear']:
+            store.clear()
+            self.stdout.write(self.style.SUCCESS('Cleared the slow-query log.'))
+            return
+
+        entries = store.summary(since=time.time() - options['hours'] * 3600, limit=options['limit'])
+        if not entries:
+            self.stdout.write('No slow queries logged.')
+            return
+
+        for entry in entries:
+            last_seen = datetime.fromtimestamp(entry['last_seen']).isoformat(timespec='seconds')
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{entry['fingerprint']}  {entry['count']}x  total {entry['total_ms']:.0f} ms  "
+                f"avg {entry['total_ms'] / entry['count']:.1f} ms  max {entry['max_ms']:.1f} ms  last {last_seen}"
+            ))
+            self.stdout.write(f"  from: {entry['origins']}")
+            self.stdout.write(f"  sql:  {entry['sql']}")
+            if options['explain'] and entry['explain']:
+                for line in entry['explain'].splitlines():
+                    self.stdout.write(f'    {line}')
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.grocery.stress import create_scratch_list, remove_scratch_list, run_stress
+
+
+class Command(BaseCommand):
+    help = (
+        'Have many members of a scratch group write to its list at once through the API, '
+        'then report throughput, latency and lock waits and check the list is consistent.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, default=8)
+        parser.add_argument('--items', type=int, default=50)
+        parser.add_argument('--threads', type=int, default=8, help='Threads per process.')
+        parser.add_argument('--processes', type=int, default=1)
+        parser.add_argument('--operations', type=int, default=100, help='Requests per thread.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--throttle', action='store_true', help='Apply the API throttles, as in production.')
+        parser.add_argument('--keep', action='store_true', help='Keep the scratch group and users afterwards.')
+
+    def handle(self, *args, **options):
+        grocery_list, users = create_scratch_list(options['members'], options['items'])
+        try:
+            report = run_stress(
+                grocery_list,
+                users,
+                threads=options['threads'],
+                processes=options['processes'],
+                operations=options['operations'],
+                seed=options['seed'],
+                throttle=options['throttle']
+            )
+        finally:
+            if not options['keep']:
+                remove_scratch_list(grocery_list, users)
+
+        self.stdout.write(
+            f"{report['requests']} requests in {report['seconds']:.2f}s ({report['throughput']:.0f}/s), "
+            f"{report['errors']} errors"
+        )
+        for op, latency in report['latency_ms'].items():
+            statuses = report['statuses'].get(op)
+            self.stdout.write(
+                f"{op:<16} p50 {latency['p50']:7.1f} ms  p95 {latency['p95']:7.1f} ms  "
+                f"p99 {latency['p99']:7.1f} ms  max {latency['max']:7.1f} ms"
+                + (f'  {statuses}' if statuses else '')
+            )
+        if report['lock_waits'] is not None:
+            waits = report['lock_waits']
+            self.stdout.write(
+                f"lock waits: {waits['waiting_samples']}/{waits['samples']} samples, "
+                f"up to {waits['max_waiting']} sessions, ~{waits['wait_seconds']}s waiting"
+            )
+
+        if report['violations'] or report['errors']:
+            for violation in report['violations']:
+                self.stderr.write(violation)
+            raise CommandError(
+                f"{len(report['violations'])} invariants failed and {report['errors']} requests errored."
+            )
+        self.stdout.write(self.style.SUCCESS('All invariants held.'))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from grocery_manager.warmup import STEPS, connect, measure_imports, warm_up
+
+
+class Command(BaseCommand):
+    help = 'Do the one-off work a new worker would do on its first requests, and report how long it takes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-connect', action='store_true', help='Skip opening database connections.')
+        parser.add_argument(
+            '--import-times', type=int, nargs='?', const=20, metavar='N',
+            help='Also list the N slowest imports of a fresh worker (default 20).'
+        )
+
+    def handle(self, *args, **options):
+        steps = STEPS if options['no_connect'] else STEPS + [('connections', connect)]
+        timings = warm_up(steps)
+        for name, count, seconds in timings:
+            self.stdout.write(f'{name:<14} {count:>5}  {seconds * 1000:8.1f} ms')
+        total = sum(seconds for _, _, seconds in timings)
+        self.stdout.write(self.style.SUCCESS(f'Warmed up in {total * 1000:.1f} ms.'))
+
+        if options['import_times']:
+            rows = measure_imports()
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'Imports: {sum(row[1] for row in rows) / 1000:.1f} ms over {len(rows)} modules; '
+                f'slowest by own time:'
+            ))
+            for module, self_us, cumulative_us, _ in sorted(rows, key=lambda row: -row[1])[:options['import_times']]:
+                self.stdout.write(f'{self_us / 1000:8.1f} ms  {cumulative_us / 1000:8.1f} ms total  {module}')
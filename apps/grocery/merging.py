@@ -0,0 +1,206 @@
+"""
+Duplicate-aware item creation.
+
+Active items carry a ``merge_key`` (their normalized name) however they were
+added: merge mode inserts it, and every other path that adds or restores an
+item calls ``claim_merge_keys``. The partial unique index on
+(grocery_list, merge_key, category) over active items lets a single
+``INSERT ... ON CONFLICT DO UPDATE`` either insert the item or add its
+quantity to the matching active one. Duplicates added outside merge mode
+keep a NULL key, and merge mode adds to the item holding it.
+"""
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.sql import Query
+from django.utils import timezone
+
+from .models import GroceryItem, normalize_item_name
+
+INSERT_FIELDS = [
+    'grocery_list_id', 'name', 'merge_key', 'quantity', 'category', 'notes',
+    'is_purchased', 'added_by_id', 'version', 'created_at', 'updated_at',
+]
+
+
+def conflict_target(connection):
+    """
+    The ``ON CONFLICT`` target and predicate SQL, with its params, of the
+    partial unique index on active items' merge keys.
+    """
+    qn = connection.ops.quote_name
+    opts = GroceryItem._meta
+    constraint = next(
+        constraint for constraint in opts.constraints
+        if constraint.name == 'uniq_active_item_merge_key'
+    )
+    query = Query(model=GroceryItem, alias_cols=False)
+    condition, params = query.build_where(constraint.condition).as_sql(
+        query.get_compiler(connection=connection), connection
+    )
+    target = ', '.join(qn(opts.get_field(name).column) for name in constraint.fields)
+    return f'({target}) WHERE {condition}', list(params)
+
+
+def claim_merge_keys(items, using=None):
+    """
+    Set the merge key of each active, keyless item in ``items`` unless
+    another active item of its list already holds that key and category.
+    """
+    pending = {}
+    for item in items:
+        key = normalize_item_name(item.name)
+        if key and not item.is_purchased and item.merge_key is None:
+            pending.setdefault((item.grocery_list_id, key, item.category), item)
+    if not pending:
+        return
+
+    using = using or router.db_for_write(GroceryItem)
+    manager = GroceryItem.objects.using(using)
+    held = set(manager.filter(
+        grocery_list_id__in={list_id for list_id, _, _ in pending},
+        merge_key__in={key for _, key, _ in pending},
+        is_purchased=False
+    ).values_list('grocery_list_id', 'merge_key', 'category'))
+    claims = {item.pk: slot[1] for slot, item in pending.items() if slot not in held}
+    if not claims:
+        return
+
+    keyless = manager.filter(merge_key__isnull=True, is_purchased=False)
+    try:
+        with transaction.atomic(using=using):
+            keyless.filter(pk__in=claims).update(
+                merge_key=Case(*[When(pk=pk, then=Value(key)) for pk, key in claims.items()])
+            )
+        claimed = set(claims)
+    except IntegrityError:
+        # A concurrent writer took one of the keys; claim the rest one by one.
+        claimed = set()
+        for pk, key in claims.items():
+            try:
+                with transaction.atomic(using=using):
+                    if keyless.filter(pk=pk).update(merge_key=key):
+                        claimed.add(pk)
+            except IntegrityError:
+                continue
+    for item in pending.values():
+        if item.pk in claimed:
+            item.merge_key = claims[item.pk]
+
+
+def _combine(grocery_list, items, user, now):
+    """
+    Fold duplicates within the request itself; ON CONFLICT can't touch a row twice.
+    """
+    rows = {}
+    for data in items:
+        merge_key = normalize_item_name(data['name'])
+        category = data.get('category', GroceryItem.Category.OTHER)
+        quantity = data.get('quantity', 1)
+        key = (merge_key, category)
+        if key in rows:
+            rows[key]['quantity'] += quantity
+            continue
+        rows[key] = {
+            'grocery_list_id': grocery_list.id,
+            'name': data['name'],
+            'merge_key': merge_key,
+            'quantity': quantity,
+            'category': category,
+            'notes': data.get('notes', ''),
+            'is_purchased': False,
+            'added_by_id': user.id if user else None,
+            'version': 1,
+            'created_at': now,
+            'updated_at': now,
+        }
+    return list(rows.values())
+
+
+def merge_items(grocery_list, items, user):
+    """
+    Add validated item data to ``grocery_list`` in merge mode.
+
+    Returns a list of ``(item_id, created)`` pairs, one per distinct
+    normalized name and category.
+    """
+    now = timezone.now()
+    rows = _combine(grocery_list, items, user, now)
+    if not rows:
+        return []
+
+    using = router.db_for_write(GroceryItem)
+    connection = connections[using]
+    features = connection.features
+    if features.supports_update_conflicts_with_target and features.can_return_rows_from_bulk_insert:
+        return _merge_on_conflict(connection, rows)
+    return _merge_fallback(using, rows)
+
+
+def _merge_on_conflict(connection, rows):
+    qn = connection.ops.quote_name
+    opts = GroceryItem._meta
+    table = qn(opts.db_table)
+    fields = [opts.get_field(name) for name in INSERT_FIELDS]
+    target, target_params = conflict_target(connection)
+    quantity = qn(opts.get_field('quantity').column)
+    updated_at = qn(opts.get_field('updated_at').column)
+    version = qn(opts.get_field('version').column)
+    placeholders = '(' + ', '.join(['%s'] * len(fields)) + ')'
+
+    results = {}
+    batch_size = max(connection.ops.bulk_batch_size(fields, rows), 1)
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            params = []
+            for row in batch:
+                params.extend(
+                    field.get_db_prep_save(row[name], connection) for name, field in zip(INSERT_FIELDS, fields)
+                )
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(qn(field.column) for field in fields)}) "
+                f"VALUES {', '.join([placeholders] * len(batch))} "
+                f"ON CONFLICT {target} "
+                f"DO UPDATE SET {quantity} = {table}.{quantity} + EXCLUDED.{quantity}, "
+                f"{updated_at} = EXCLUDED.{updated_at}, {version} = {table}.{version} + 1 "
+                f"RETURNING {qn(opts.pk.column)}, {qn(opts.get_field('merge_key').column)}, "
+                f"{qn(opts.get_field('category').column)}, {version}",
+                params + target_params
+            )
+            # An inserted row has the version it was written with; a merged
+            # one was bumped past it.
+            for item_id, merge_key, category, row_version in cursor.fetchall():
+                results[(merge_key, category)] = (item_id, row_version == 1)
+
+    return [results[(row['merge_key'], row['category'])] for row in rows]
+
+
+def _merge_fallback(using, rows):
+    manager = GroceryItem.objects.using(using)
+    results = []
+    for row in rows:
+        active = manager.filter(
+            grocery_list_id=row['grocery_list_id'],
+            merge_key=row['merge_key'],
+            category=row['category'],
+            is_purchased=False
+        )
+        for _ in range(2):
+            item_id = active.values_list('id', flat=True).first()
+            if item_id is not None:
+                manager.filter(id=item_id).update(
+                    quantity=F('quantity') + row['quantity'],
+                    updated_at=row['updated_at'],
+                    version=F('version') + 1
+                )
+                results.append((item_id, False))
+                break
+            try:
+                with transaction.atomic(using=using):
+                    results.append((manager.create(**row).id, True))
+                break
+            except IntegrityError:
+                continue
+        else:
+            raise IntegrityError('Could not merge item into the list.')
+    return results
@@ -1,9 +1,65 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
 from apps.usergroups.models import UserGroup
 
 
-class GroceryList(models.Model):
+def normalize_item_name(name):
+    """
+    Case- and whitespace-insensitive form of an item name used for matching.
+    """
+    return ' '.join(name.split()).lower()
+
+
+class VersionedModel(models.Model):
+    """
+    Adds a row version bumped on every write, for optimistic concurrency control.
+    """
+    version = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        """
+        Plain saves bump the version as well, so writes from the admin or
+        scripts invalidate ETags handed out before them.
+        """
+        update_fields = kwargs.get('update_fields')
+        if self._state.adding or (update_fields is not None and not update_fields):
+            return super().save(*args, **kwargs)
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'version'}
+        self.version = models.F('version') + 1
+        super().save(*args, **kwargs)
+        self.refresh_from_db(fields=['version'])
+
+    def save_versioned(self, fields, force=False):
+        """
+        Write ``fields`` only if the row still has the version loaded into this
+        instance, bumping it. With ``force`` a lost race falls back to a plain
+        overwrite. Returns False if the write was rejected.
+        """
+        self.updated_at = timezone.now()
+        values = {
+            self._meta.get_field(name).attname: getattr(self, self._meta.get_field(name).attname)
+            for name in fields
+        }
+        values['updated_at'] = self.updated_at
+        values['version'] = models.F('version') + 1
+
+        rows = type(self)._default_manager.filter(pk=self.pk)
+        if rows.filter(version=self.version).update(**values):
+            self.version += 1
+            return True
+        if not force or not rows.update(**values):
+            return False
+        self.version = rows.values_list('version', flat=True).get()
+        return True
+
+
+class GroceryList(VersionedModel):
     """
     Represents a grocery list for a user group.
     One list per group.
@@ -14,6 +70,9 @@ class GroceryList(models.Model):
         related_name='grocery_list'
     )
     name = models.CharField(max_length=100, default='Grocery List')
+    # Set when the list's deletion is queued; detached lists and their items
+    # are left out of every query until the deletion job removes them.
+    detached_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -24,8 +83,37 @@ class GroceryList(models.Model):
     def __str__(self):
         return f"{self.name} ({self.group.name})"
 
+    @staticmethod
+    def default_name(group):
+        return f"{group.name}'s Grocery List"
+
+    @classmethod
+    def for_group(cls, group, using=None):
+        """
+        The group's list, created with the default name if it has none yet.
+        """
+        grocery_list, _ = cls.objects.db_manager(using).get_or_create(
+            group=group,
+            defaults={'name': cls.default_name(group)}
+        )
+        return grocery_list
 
-class GroceryItem(models.Model):
+
+def provision_grocery_list(sender, instance, created, raw=False, using=None, **kwargs):
+    """
+    Give every new group its list, however the group was created. A fixture
+    may bring the list along, so for loaded groups this waits for the load
+    to commit.
+    """
+    if not created:
+        return
+    if raw:
+        transaction.on_commit(lambda: GroceryList.for_group(instance, using), using=using)
+    else:
+        GroceryList.for_group(instance, using)
+
+
+class GroceryItem(VersionedModel):
     """
     Represents an item in a grocery list.
     """
@@ -49,6 +137,10 @@ class GroceryItem(models.Model):
         related_name='items'
     )
     name = models.CharField(max_length=200)
+    # Normalized name of active items, unless another active item of the list
+    # with the same category holds it; cleared on purchase or rename so the
+    # partial unique index stays valid. See apps.grocery.merging.
+    merge_key = models.CharField(max_length=200, null=True, blank=True, editable=False)
     quantity = models.DecimalField(max_digits=10, decimal_places=2, default=1)
     category = models.CharField(
         max_length=20,
@@ -77,7 +169,405 @@ class GroceryItem(models.Model):
     class Meta:
         db_table = 'grocery_items'
         ordering = ['is_purchased', '-created_at']
+        indexes = [
+            models.Index(fields=['grocery_list', 'is_purchased', 'created_at'], name='grocery_item_list_status_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['grocery_list', 'merge_key', 'category'],
+                condition=models.Q(is_purchased=False, merge_key__isnull=False),
+                name='uniq_active_item_merge_key'
+            ),
+        ]
 
     def __str__(self):
         status = '✓' if self.is_purchased else '○'
-        return f"{status} {self.name} ({self.quantity})"
\ No newline at end of file
+        return f"{status} {self.name} ({self.quantity})"
+
+    def save(self, *args, **kwargs):
+        from .merging import claim_merge_keys
+
+        super().save(*args, **kwargs)
+        claim_merge_keys([self], using=self._state.db)
+
+    def set_purchased(self, is_purchased, user=None):
+        """
+        Update the purchase fields. Purchasing retires the item's merge key.
+        """
+        self.is_purchased = is_purchased
+        if is_purchased:
+            self.purchased_at = timezone.now()
+            self.purchased_by = user
+            self.merge_key = None
+        else:
+            self.purchased_at = None
+            self.purchased_by = None
+
+
+class ItemNameStat(models.Model):
+    """
+    Per-group usage counts for item names, maintained as items are added.
+    Backs item-name autocomplete without scanning grocery_items.
+    """
+    group = models.ForeignKey(
+        UserGroup,
+        on_delete=models.CASCADE,
+        related_name='item_name_stats'
+    )
+    normalized_name = models.CharField(max_length=200)
+    name = models.CharField(max_length=200)
+    use_count = models.PositiveIntegerField(default=0)
+    last_used_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'grocery_item_name_stats'
+        constraints = [
+            models.UniqueConstraint(fields=['group', 'normalized_name'], name='uniq_item_name_stat'),
+        ]
+        indexes = [
+            # Pattern ops let PostgreSQL serve `LIKE 'prefix%'` from the index
+            # regardless of the database collation.
+            models.Index(
+                fields=['group', 'normalized_name'],
+                name='item_name_stat_prefix_idx',
+                opclasses=['int8_ops', 'varchar_pattern_ops']
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} x{self.use_count}"
+
+
+class PurchaseRollup(models.Model):
+    """
+    Weekly purchase totals per group, category and purchaser, maintained as
+    items are purchased and un-purchased. Backs the analytics endpoint.
+    """
+    group = models.ForeignKey(
+        UserGroup,
+        on_delete=models.CASCADE,
+        related_name='purchase_rollups'
+    )
+    # Monday of the week the items were purchased in.
+    week = models.DateField()
+    category = models.CharField(max_length=20, choices=GroceryItem.Category.choices)
+    # Purchaser's user id, 0 when unknown; a nullable column would never
+    # match itself in the unique key the counters are upserted against.
+    member_id = models.PositiveBigIntegerField(default=0)
+    item_count = models.IntegerField(default=0)
+    quantity = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # Sum of created_at -> purchased_at over the counted items.
+    wait_seconds = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'grocery_purchase_rollups'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['group', 'week', 'category', 'member_id'],
+                name='uniq_purchase_rollup'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.week} {self.category} x{self.item_count}"
+
+
+class TopItemRollup(models.Model):
+    """
+    All-time purchase counts per group and item name.
+    """
+    group = models.ForeignKey(
+        UserGroup,
+        on_delete=models.CASCADE,
+        related_name='top_item_rollups'
+    )
+    normalized_name = models.CharField(max_length=200)
+    name = models.CharField(max_length=200)
+    purchase_count = models.IntegerField(default=0)
+    quantity = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    last_purchased_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'grocery_top_item_rollups'
+        constraints = [
+            models.UniqueConstraint(fields=['group', 'normalized_name'], name='uniq_top_item_rollup'),
+        ]
+        indexes = [
+            models.Index(fields=['group', '-purchase_count'], name='top_item_rollup_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} x{self.purchase_count}"
+
+
+class PurchaseEvent(models.Model):
+    """
+    Append-only log of purchases, kept after the items themselves are
+    cleared. Input to the repeat-purchase predictions.
+    """
+    group = models.ForeignKey(
+        UserGroup,
+        on_delete=models.CASCADE,
+        related_name='purchase_events'
+    )
+    # Plain id rather than a foreign key: the log outlives the item.
+    item_id = models.BigIntegerField()
+    normalized_name = models.CharField(max_length=200)
+    name = models.CharField(max_length=200)
+    category = models.CharField(max_length=20, choices=GroceryItem.Category.choices)
+    purchased_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'grocery_purchase_events'
+        indexes = [
+            models.Index(fields=['group', 'normalized_name', 'purchased_at'], name='purchase_event_history_idx'),
+            models.Index(fields=['item_id'], name='purchase_event_item_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} @ {self.purchased_at}"
+
+
+class ItemPrediction(models.Model):
+    """
+    When a group is next expected to buy an item, from its purchase intervals.
+    Computed in batches by ``compute_purchase_predictions``.
+    """
+    group = models.ForeignKey(
+        UserGroup,
+        on_delete=models.CASCADE,
+        related_name='item_predictions'
+    )
+    normalized_name = models.CharField(max_length=200)
+    name = models.CharField(max_length=200)
+    category = models.CharField(max_length=20, choices=GroceryItem.Category.choices)
+    purchase_count = models.PositiveIntegerField()
+    mean_interval_days = models.FloatField()
+    interval_std_days = models.FloatField()
+    last_purchased_at = models.DateTimeField()
+    next_due_at = models.DateTimeField()
+    # Set when a purchase behind this prediction is undone; the next batch
+    # run recomputes it.
+    stale = models.BooleanField(default=False)
+
+    class Meta:
+        db_table = 'grocery_item_predictions'
+        constraints = [
+            models.UniqueConstraint(fields=['group', 'normalized_name'], name='uniq_item_prediction'),
+        ]
+        indexes = [
+            models.Index(fields=['group', 'next_due_at'], name='item_prediction_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} due {self.next_due_at}"
+
+
+class PredictionRun(models.Model):
+    """
+    One batch run of the prediction job; the latest run's ``last_event_id``
+    is the watermark the next run continues from.
+    """
+    last_event_id = models.BigIntegerField()
+    updated_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'grocery_prediction_runs'
+        ordering = ['-id']
+
+    def __str__(self):
+        return f"Run {self.pk} up to event {self.last_event_id}"
+
+
+class IdempotencyRecord(models.Model):
+    """
+    The stored response to a mutating request sent with an Idempotency-Key,
+    replayed when the client retries it.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='idempotency_records'
+    )
+    key = models.CharField(max_length=255)
+    # Hash of the method, path and payload; a reused key must match it.
+    fingerprint = models.CharField(max_length=64)
+    # Null while the original request is still being processed.
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(encoder=DjangoJSONEncoder, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'grocery_idempotency_records'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='uniq_idempotency_key'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='idempotency_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.status_code or 'pending'})"
+
+
+class OutboxEvent(models.Model):
+    """
+    A change to a group's list or membership, written in the same
+    transaction as the change and delivered later by dispatch_outbox.
+    """
+    PENDING = 'pending'
+    DELIVERED = 'delivered'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (DELIVERED, 'Delivered'),
+        (FAILED, 'Failed'),
+    ]
+
+    event_type = models.CharField(max_length=50)
+    # Plain ids rather than foreign keys: events outlive the rows they describe.
+    # Events of one group (and so of its list) are numbered by OutboxSequence
+    # in commit order and delivered in that order.
+    group_id = models.BigIntegerField()
+    sequence = models.PositiveBigIntegerField()
+    grocery_list_id = models.BigIntegerField(null=True, blank=True)
+    actor_id = models.BigIntegerField(null=True, blank=True)
+    payload = models.JSONField(encoder=DjangoJSONEncoder, default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'grocery_outbox_events'
+        constraints = [
+            models.UniqueConstraint(fields=['group_id', 'sequence'], name='uniq_outbox_event_sequence'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at', 'id'], name='outbox_event_due_idx'),
+            models.Index(fields=['group_id', 'status', 'sequence'], name='outbox_event_group_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} #{self.pk} ({self.status})"
+
+
+class OutboxSequence(models.Model):
+    """
+    The last sequence number given to a group's outbox events. Numbering
+    events locks the row until their transaction commits, so a group's
+    numbers become visible in order.
+    """
+    group_id = models.BigIntegerField(primary_key=True)
+    last_sequence = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'grocery_outbox_sequences'
+
+    def __str__(self):
+        return f"Group {self.group_id}: {self.last_sequence}"
+
+
+class StapleTemplate(models.Model):
+    """
+    A named set of staples a group re-adds to its list, e.g. "Weekly shop".
+    """
+    group = models.ForeignKey(
+        UserGroup,
+        on_delete=models.CASCADE,
+        related_name='staple_templates'
+    )
+    name = models.CharField(max_length=100)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='staple_templates'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'grocery_staple_templates'
+        ordering = ['name']
+        constraints = [
+            models.UniqueConstraint(fields=['group', 'name'], name='uniq_staple_template_name'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.group.name})"
+
+
+class StapleTemplateItem(models.Model):
+    template = models.ForeignKey(
+        StapleTemplate,
+        on_delete=models.CASCADE,
+        related_name='items'
+    )
+    name = models.CharField(max_length=200)
+    # Matched against the merge keys of active items when the template is applied.
+    normalized_name = models.CharField(max_length=200, editable=False)
+    quantity = models.DecimalField(max_digits=10, decimal_places=2, default=1)
+    category = models.CharField(
+        max_length=20,
+        choices=GroceryItem.Category.choices,
+        default=GroceryItem.Category.OTHER
+    )
+    notes = models.TextField(blank=True, default='')
+
+    class Meta:
+        db_table = 'grocery_staple_template_items'
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['template', 'normalized_name'], name='uniq_staple_template_item'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.normalized_name = normalize_item_name(self.name)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return self.name
+
+
+class ListActivity(models.Model):
+    """
+    Append-only history of changes to a grocery list, for its activity feed.
+
+    Rows are written in the transaction of the change they describe and keep
+    the item's name, so the feed reads neither the items table nor depends
+    on the item still existing.
+    """
+    grocery_list = models.ForeignKey(
+        GroceryList,
+        on_delete=models.CASCADE,
+        related_name='activities',
+        # Covered by list_activity_feed_idx.
+        db_index=False
+    )
+    verb = models.CharField(max_length=50)
+    actor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='+'
+    )
+    # A plain id: activity outlives the item it describes.
+    item_id = models.BigIntegerField(null=True, blank=True)
+    item_name = models.CharField(max_length=200, blank=True)
+    payload = models.JSONField(encoder=DjangoJSONEncoder, default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'grocery_list_activities'
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['grocery_list', 'id'], name='list_activity_feed_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.verb} #{self.pk}"
@@ -0,0 +1,284 @@
+"""
+Transactional outbox for grocery and membership changes.
+
+Views record OutboxEvent rows with ``record_events`` inside the transaction
+that makes the change, so an event exists exactly when its change was
+committed. ``manage.py dispatch_outbox`` drains pending events in batches to
+the sink configured by ``OUTBOX_SINK`` and retries failed batches with
+exponential backoff. Delivery is at least once: consumers should ignore
+event ids they have already seen.
+
+Each group numbers its events through its OutboxSequence row, which stays
+locked until the numbering transaction commits, so a group's sequence
+numbers become visible in order, which ids, taken at INSERT, need not.
+Events of one group, and so of its list, are delivered in sequence order:
+the dispatcher sends a group's pending events from its first one up to the
+first gap, such as an event waiting to be retried or being delivered by
+another dispatcher. An event that fails ``MAX_ATTEMPTS`` times is marked
+failed and stops holding back the ones after it.
+"""
+import json
+import logging
+import urllib.request
+from collections import Counter
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, transaction
+from django.db.models import Exists, Min, OuterRef
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .activity import record_activity
+from .models import OutboxEvent, OutboxSequence
+from grocery_manager.sharding import current_shard
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+MAX_ATTEMPTS = 10
+RETRY_BASE = timedelta(seconds=5)
+RETRY_MAX = timedelta(hours=1)
+ITEM_FIELDS = ['id', 'name', 'quantity', 'category', 'notes', 'is_purchased', 'version']
+
+
+def item_payload(item):
+    return {field: getattr(item, field) for field in ITEM_FIELDS}
+
+
+def build_event(event_type, group_id, grocery_list_id=None, actor=None, payload=None):
+    return OutboxEvent(
+        event_type=event_type,
+        group_id=group_id,
+        grocery_list_id=grocery_list_id,
+        actor_id=getattr(actor, 'pk', actor),
+        payload=payload or {}
+    )
+
+
+def item_events(event_type, items, actor):
+    """
+    One event per item; each item's ``grocery_list`` should already be loaded.
+    """
+    return [
+        build_event(event_type, item.grocery_list.group_id, item.grocery_list_id, actor, item_payload(item))
+        for item in items
+    ]
+
+
+def _advance_sequence(group_id, count):
+    """
+    Add ``count`` to the group's last sequence number and return the new one.
+    """
+    connection = connections[current_shard()]
+    if connection.features.supports_update_conflicts_with_target:
+        opts = OutboxSequence._meta
+        qn = connection.ops.quote_name
+        table, key, last = qn(opts.db_table), qn(opts.pk.column), qn(opts.get_field('last_sequence').column)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ({key}, {last}) VALUES (%s, %s) '
+                f'ON CONFLICT ({key}) DO UPDATE SET {last} = {table}.{last} + EXCLUDED.{last} '
+                f'RETURNING {last}',
+                [group_id, count]
+            )
+            return cursor.fetchone()[0]
+    sequence, _ = OutboxSequence.objects.select_for_update().get_or_create(group_id=group_id)
+    sequence.last_sequence += count
+    sequence.save(update_fields=['last_sequence'])
+    return sequence.last_sequence
+
+
+def number_events(events):
+    """
+    Give ``events`` the next sequence numbers of their groups. Each group's
+    OutboxSequence row stays locked until the transaction ends; groups are
+    locked in id order so writers to several groups cannot deadlock.
+    """
+    counts = Counter(event.group_id for event in events)
+    for group_id in sorted(counts):
+        next_sequence = _advance_sequence(group_id, counts[group_id]) - counts[group_id] + 1
+        for event in events:
+            if event.group_id == group_id:
+                event.sequence = next_sequence
+                next_sequence += 1
+
+
+def record_events(events):
+    """
+    Write ``events``, and the list activity they describe, with one INSERT
+    each. Call inside the mutation's transaction, after its other writes:
+    the groups' sequences stay locked from here until it commits.
+    """
+    if events:
+        with transaction.atomic(using=current_shard(), savepoint=False):
+            number_events(events)
+            OutboxEvent.objects.bulk_create(events)
+            record_activity(events)
+
+
+def record_event(*args, **kwargs):
+    record_events([build_event(*args, **kwargs)])
+
+
+def message(event):
+    """
+    The JSON-serializable form of ``event`` handed to sinks.
+    """
+    return {
+        'id': event.id,
+        'type': event.event_type,
+        'group_id': event.group_id,
+        'sequence': event.sequence,
+        'grocery_list_id': event.grocery_list_id,
+        'actor_id': event.actor_id,
+        'payload': event.payload,
+        'created_at': event.created_at,
+    }
+
+
+def _dumps(value):
+    return json.dumps(value, cls=DjangoJSONEncoder)
+
+
+class FileSink:
+    """
+    Appends each event to ``path`` as a line of JSON.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, messages):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(''.join(_dumps(m) + '\n' for m in messages))
+
+
+class HttpSink:
+    """
+    POSTs each batch to ``url`` as ``{"events": [...]}``. Error responses and
+    connection failures fail the batch.
+    """
+
+    def __init__(self, url, timeout=10, headers=None):
+        self.url = url
+        self.timeout = timeout
+        self.headers = headers or {}
+
+    def send(self, messages):
+        request = urllib.request.Request(
+            self.url,
+            data=_dumps({'events': messages}).encode(),
+            headers={'Content-Type': 'application/json', **self.headers},
+            method='POST'
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class CallableSink:
+    """
+    Calls ``callable`` (or the dotted path to one) with each batch.
+    """
+
+    def __init__(self, callable):
+        self.callable = import_string(callable) if isinstance(callable, str) else callable
+
+    def send(self, messages):
+        self.callable(messages)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Local stand-in for an HTTP consumer: accepts POSTed batches and hands
+    their events to ``self.server.on_events``.
+    """
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        try:
+            events = json.loads(body)['events']
+        except (ValueError, KeyError, TypeError):
+            self.send_error(400, 'Expected {"events": [...]}')
+            return
+        self.server.on_events(events)
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+def get_sink(config=None):
+    config = config or settings.OUTBOX_SINK
+    return import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+
+
+def retry_delay(attempts):
+    return min(RETRY_BASE * 2 ** (attempts - 1), RETRY_MAX)
+
+
+def dispatch_batch(sink, batch_size=BATCH_SIZE):
+    """
+    Deliver one batch of due events to ``sink``. Returns the number of
+    events delivered and failed.
+    """
+    now = timezone.now()
+    with transaction.atomic(using=current_shard()):
+        backing_off = OutboxEvent.objects.filter(
+            status=OutboxEvent.PENDING,
+            group_id=OuterRef('group_id'),
+            sequence__lt=OuterRef('sequence'),
+            next_attempt_at__gt=now
+        )
+        # Within a group ids follow sequence numbers, as the next number is
+        # only handed out once the previous event has committed, so a batch
+        # cut short by id still starts each group at its first events.
+        events = list(
+            OutboxEvent.objects.filter(status=OutboxEvent.PENDING, next_attempt_at__lte=now)
+            .exclude(Exists(backing_off))
+            .select_for_update(skip_locked=True)
+            .order_by('id')[:batch_size]
+        )
+        if not events:
+            return 0, 0
+
+        # Send each group's events from its first pending one and stop at the
+        # first gap: an event locked by another dispatcher, backing off, or
+        # left out of the batch.
+        next_sequence = dict(
+            OutboxEvent.objects.filter(
+                status=OutboxEvent.PENDING,
+                group_id__in={event.group_id for event in events}
+            ).values('group_id').annotate(first=Min('sequence')).values_list('group_id', 'first')
+        )
+        ready = []
+        for event in events:
+            if event.sequence == next_sequence.get(event.group_id):
+                ready.append(event)
+                next_sequence[event.group_id] += 1
+        if not ready:
+            return 0, 0
+
+        try:
+            sink.send([message(event) for event in ready])
+        except Exception as exc:
+            logger.warning('Outbox delivery of %d events failed: %s', len(ready), exc)
+            for event in ready:
+                event.attempts += 1
+                event.last_error = f'{type(exc).__name__}: {exc}'
+                if event.attempts >= MAX_ATTEMPTS:
+                    event.status = OutboxEvent.FAILED
+                else:
+                    event.next_attempt_at = now + retry_delay(event.attempts)
+            OutboxEvent.objects.bulk_update(ready, ['attempts', 'last_error', 'status', 'next_attempt_at'])
+            return 0, len(ready)
+
+        OutboxEvent.objects.filter(id__in=[event.id for event in ready]).update(
+            status=OutboxEvent.DELIVERED,
+            delivered_at=timezone.now(),
+            last_error=''
+        )
+        return len(ready), 0
@@ -0,0 +1,22 @@
+from rest_framework.pagination import CursorPagination
+
+
+class ItemCursorPagination(CursorPagination):
+    """
+    Keyset pagination over items, newest first; no COUNT query per page.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class ActivityCursorPagination(CursorPagination):
+    """
+    Keyset pagination over a list's activity, newest first, served by the
+    (grocery_list, id) index.
+    """
+    ordering = ('-id',)
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
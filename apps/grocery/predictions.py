@@ -0,0 +1,65 @@
+"""
+Repeat-purchase predictions.
+
+Purchases are appended to PurchaseEvent as they happen. The
+``compute_purchase_predictions`` command turns each item's purchase
+intervals into an expected next purchase time, revisiting only items with
+purchases logged or undone since its last run. Suggestions are then a single
+indexed read of ItemPrediction.
+"""
+from datetime import timedelta
+
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import GroceryItem, ItemPrediction, PurchaseEvent
+
+DEFAULT_HORIZON_DAYS = 3
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+# Items overdue for longer than this are assumed to no longer be bought.
+MAX_OVERDUE_DAYS = 30
+
+
+def log_purchases(added=(), removed=()):
+    """
+    Drop the ``removed`` purchase facts from the log and append the ``added``
+    ones. Removals go first: editing a purchased item replaces its entry
+    with one for the same purchase.
+    """
+    for facts in removed:
+        PurchaseEvent.objects.filter(item_id=facts['item_id'], purchased_at=facts['purchased_at']).delete()
+        ItemPrediction.objects.filter(
+            group_id=facts['group_id'],
+            normalized_name=facts['normalized_name']
+        ).update(stale=True)
+    PurchaseEvent.objects.bulk_create([
+        PurchaseEvent(
+            group_id=facts['group_id'],
+            item_id=facts['item_id'],
+            normalized_name=facts['normalized_name'],
+            name=facts['name'],
+            category=facts['category'],
+            purchased_at=facts['purchased_at']
+        )
+        for facts in added
+        if facts['normalized_name']
+    ])
+
+
+def due_items(grocery_list, horizon_days=DEFAULT_HORIZON_DAYS, limit=DEFAULT_LIMIT):
+    """
+    Items the list's group is expected to buy within ``horizon_days`` and
+    that aren't already on the list, soonest (or most overdue) first.
+    """
+    now = timezone.now()
+    on_list = GroceryItem.objects.filter(
+        grocery_list=grocery_list,
+        is_purchased=False,
+        merge_key=OuterRef('normalized_name')
+    )
+    return ItemPrediction.objects.filter(
+        group_id=grocery_list.group_id,
+        next_due_at__gte=now - timedelta(days=MAX_OVERDUE_DAYS),
+        next_due_at__lte=now + timedelta(days=horizon_days)
+    ).exclude(Exists(on_list)).order_by('next_due_at')[:min(limit, MAX_LIMIT)]
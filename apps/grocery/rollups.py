@@ -0,0 +1,190 @@
+"""
+Purchase analytics maintained incrementally in rollup tables.
+
+Each purchase write path takes an item's contribution before and after the
+change (``purchase_facts``) and applies the difference with atomic counter
+upserts, so un-purchasing or editing a purchased item is reversed exactly.
+The analytics endpoint reads only the rollups; ``rebuild_rollups``
+recomputes them from the stored items.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Sum
+from django.utils import timezone
+
+from .counters import upsert_increment
+from .models import GroceryItem, PurchaseRollup, TopItemRollup, normalize_item_name
+from .predictions import log_purchases
+from apps.users.models import User
+
+DEFAULT_WEEKS = 12
+DEFAULT_TOP_ITEMS = 10
+
+PURCHASE_KEY = ['group_id', 'week', 'category', 'member_id']
+TOP_ITEM_KEY = ['group_id', 'normalized_name']
+PURCHASE_FACT_FIELDS = [
+    'is_purchased', 'purchased_at', 'purchased_by_id', 'name', 'category', 'quantity', 'created_at'
+]
+
+
+def week_start(moment):
+    day = timezone.localtime(moment).date()
+    return day - timedelta(days=day.weekday())
+
+
+def purchase_facts(item):
+    """
+    What ``item`` contributes to the rollups in its current state, or None
+    if it isn't purchased. Needs ``item.grocery_list`` loaded.
+    """
+    if not item.is_purchased or item.purchased_at is None:
+        return None
+    return {
+        'item_id': item.pk,
+        'group_id': item.grocery_list.group_id,
+        'week': week_start(item.purchased_at),
+        'category': item.category,
+        'member_id': item.purchased_by_id or 0,
+        'normalized_name': normalize_item_name(item.name),
+        'name': item.name.strip(),
+        'quantity': item.quantity,
+        'wait_seconds': max(int((item.purchased_at - item.created_at).total_seconds()), 0),
+        'purchased_at': item.purchased_at,
+    }
+
+
+def lock_purchase_state(item):
+    """
+    Reload the fields ``purchase_facts`` reads under a row lock, so the
+    contribution taken before a change matches the stored row and concurrent
+    changes of the same item are counted once. Call inside a transaction.
+    """
+    state = GroceryItem.objects.select_for_update().filter(pk=item.pk).values(*PURCHASE_FACT_FIELDS).first()
+    for attr, value in (state or {}).items():
+        setattr(item, attr, value)
+
+
+def update_rollups(before, after):
+    """
+    Apply the change of one item's contribution from ``before`` to ``after``.
+    """
+    if before == after:
+        return
+    apply_purchase_facts(
+        added=[after] if after else [],
+        removed=[before] if before else []
+    )
+
+
+def apply_purchase_facts(added=(), removed=(), log=True):
+    """
+    Count the ``added`` contributions and subtract the ``removed`` ones.
+    With ``log`` they are also recorded in the purchase history.
+    """
+    if log:
+        log_purchases(added, removed)
+    signed = [(facts, 1) for facts in added] + [(facts, -1) for facts in removed]
+    upsert_increment(
+        PurchaseRollup,
+        [
+            {
+                **{field: facts[field] for field in PURCHASE_KEY},
+                'item_count': sign,
+                'quantity': sign * facts['quantity'],
+                'wait_seconds': sign * facts['wait_seconds'],
+            }
+            for facts, sign in signed
+        ],
+        key_fields=PURCHASE_KEY,
+        increment_fields=['item_count', 'quantity', 'wait_seconds'],
+    )
+    # Only new purchases move the display name and last purchase time.
+    upsert_increment(
+        TopItemRollup,
+        [_top_item_row(facts, 1) for facts in added if facts['normalized_name']],
+        key_fields=TOP_ITEM_KEY,
+        increment_fields=['purchase_count', 'quantity'],
+        replace_fields=['name', 'last_purchased_at'],
+    )
+    upsert_increment(
+        TopItemRollup,
+        [_top_item_row(facts, -1) for facts in removed if facts['normalized_name']],
+        key_fields=TOP_ITEM_KEY,
+        increment_fields=['purchase_count', 'quantity'],
+    )
+
+
+def _top_item_row(facts, sign):
+    row = {
+        'group_id': facts['group_id'],
+        'normalized_name': facts['normalized_name'],
+        'name': facts['name'],
+        'purchase_count': sign,
+        'quantity': sign * facts['quantity'],
+    }
+    if sign > 0:
+        row['last_purchased_at'] = facts['purchased_at']
+    return row
+
+
+def group_analytics(group_id, weeks=DEFAULT_WEEKS, top_items=DEFAULT_TOP_ITEMS):
+    """
+    Purchase totals for the group's last ``weeks`` weeks and its all-time top items.
+    """
+    since = week_start(timezone.now()) - timedelta(weeks=weeks - 1)
+    rollups = PurchaseRollup.objects.filter(group_id=group_id, week__gte=since)
+
+    def breakdown(field):
+        rows = rollups.values(field).annotate(
+            total_items=Sum('item_count'),
+            total_quantity=Sum('quantity'),
+            total_wait=Sum('wait_seconds')
+        ).filter(total_items__gt=0).order_by(field)
+        return [{field: row[field], **_totals(row)} for row in rows]
+
+    members = breakdown('member_id')
+    usernames = dict(
+        User.objects.filter(id__in=[row['member_id'] for row in members]).values_list('id', 'username')
+    )
+    top = TopItemRollup.objects.filter(
+        group_id=group_id,
+        purchase_count__gt=0
+    ).order_by('-purchase_count', '-last_purchased_at')[:top_items]
+
+    return {
+        'since': since,
+        'totals': _totals(rollups.aggregate(
+            total_items=Sum('item_count'),
+            total_quantity=Sum('quantity'),
+            total_wait=Sum('wait_seconds')
+        )),
+        'weeks': breakdown('week'),
+        'categories': breakdown('category'),
+        'members': [
+            {
+                'user_id': row['member_id'] or None,
+                'username': usernames.get(row['member_id']),
+                **{key: value for key, value in row.items() if key != 'member_id'},
+            }
+            for row in members
+        ],
+        'top_items': [
+            {
+                'name': item.name,
+                'purchase_count': item.purchase_count,
+                'quantity': str(item.quantity),
+                'last_purchased_at': item.last_purchased_at,
+            }
+            for item in top
+        ],
+    }
+
+
+def _totals(row):
+    items = row['total_items'] or 0
+    return {
+        'item_count': items,
+        'quantity': str(Decimal(row['total_quantity'] or 0).quantize(Decimal('0.01'))),
+        'avg_seconds_to_purchase': round((row['total_wait'] or 0) / items) if items > 0 else None,
+    }
@@ -1,7 +1,21 @@
 from rest_framework import serializers
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
-from .models import GroceryList, GroceryItem
+from .concurrency import check_if_match, save_or_fail
+from .merging import claim_merge_keys
+from .models import (
+    GroceryList, GroceryItem, ItemNameStat, ItemPrediction, ListActivity, StapleTemplate, StapleTemplateItem,
+    normalize_item_name
+)
+from .outbox import item_events, record_event, record_events
+from .predictions import DEFAULT_HORIZON_DAYS
+from .rollups import DEFAULT_TOP_ITEMS, DEFAULT_WEEKS, lock_purchase_state, purchase_facts, update_rollups
+from apps.usergroups.models import UserGroup
 from apps.users.serializers import UserMinimalSerializer
+from grocery_manager.sharding import current_shard
+
+MAX_TEMPLATE_ITEMS = 200
 
 
 class GroceryItemSerializer(serializers.ModelSerializer):
@@ -14,9 +28,17 @@ class GroceryItemSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'name', 'quantity', 'category', 'category_display',
             'notes', 'is_purchased', 'purchased_at',
-            'purchased_by', 'added_by', 'created_at', 'updated_at'
+            'purchased_by', 'added_by', 'version', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'added_by', 'purchased_by', 'purchased_at', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'added_by', 'purchased_by', 'purchased_at', 'version', 'created_at', 'updated_at']
+
+
+class MyGroceryItemSerializer(GroceryItemSerializer):
+    group = serializers.IntegerField(source='grocery_list.group_id', read_only=True)
+    
+    class Meta(GroceryItemSerializer.Meta):
+        fields = GroceryItemSerializer.Meta.fields + ['grocery_list', 'group']
+        read_only_fields = GroceryItemSerializer.Meta.read_only_fields + ['grocery_list']
 
 
 class GroceryItemCreateSerializer(serializers.ModelSerializer):
@@ -25,21 +47,43 @@ class GroceryItemCreateSerializer(serializers.ModelSerializer):
         fields = ['name', 'quantity', 'category', 'notes']
 
 
+class BulkItemCreateSerializer(serializers.Serializer):
+    grocery_list_id = serializers.IntegerField()
+    items = GroceryItemCreateSerializer(many=True, allow_empty=False)
+    merge = serializers.BooleanField(required=False, default=False)
+
+
 class GroceryItemUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = GroceryItem
-        fields = ['name', 'quantity', 'category', 'notes', 'is_purchased']
+        fields = ['name', 'quantity', 'category', 'notes', 'is_purchased', 'version']
+        read_only_fields = ['version']
     
     def update(self, instance, validated_data):
-        is_purchased = validated_data.get('is_purchased')
-        if is_purchased is not None and is_purchased != instance.is_purchased:
-            if is_purchased:
-                validated_data['purchased_at'] = timezone.now()
-                validated_data['purchased_by'] = self.context['request'].user
-            else:
-                validated_data['purchased_at'] = None
-                validated_data['purchased_by'] = None
-        return super().update(instance, validated_data)
+        conditional = check_if_match(self.context['request'], instance)
+        with transaction.atomic(using=current_shard()):
+            lock_purchase_state(instance)
+            before = purchase_facts(instance)
+            is_purchased = validated_data.get('is_purchased')
+            if is_purchased is not None and is_purchased != instance.is_purchased:
+                if is_purchased:
+                    validated_data['purchased_at'] = timezone.now()
+                    validated_data['purchased_by'] = self.context['request'].user
+                    validated_data['merge_key'] = None
+                else:
+                    validated_data['purchased_at'] = None
+                    validated_data['purchased_by'] = None
+            for field in ('name', 'category'):
+                if field in validated_data and validated_data[field] != getattr(instance, field):
+                    validated_data['merge_key'] = None
+            
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            save_or_fail(instance, list(validated_data), conditional)
+            claim_merge_keys([instance])
+            update_rollups(before, purchase_facts(instance))
+            record_events(item_events('item.updated', [instance], self.context['request'].user))
+        return instance
 
 
 class GroceryListSerializer(serializers.ModelSerializer):
@@ -48,8 +92,18 @@ class GroceryListSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = GroceryList
-        fields = ['id', 'name', 'group', 'active_items_count', 'purchased_items_count', 'created_at', 'updated_at']
-        read_only_fields = ['id', 'group', 'created_at', 'updated_at']
+        fields = ['id', 'name', 'group', 'active_items_count', 'purchased_items_count', 'version', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'group', 'version', 'created_at', 'updated_at']
+    
+    def update(self, instance, validated_data):
+        request = self.context['request']
+        conditional = check_if_match(request, instance)
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        with transaction.atomic(using=current_shard()):
+            save_or_fail(instance, list(validated_data), conditional)
+            record_event('list.updated', instance.group_id, instance.id, request.user, {'name': instance.name})
+        return instance
     
     def get_active_items_count(self, obj):
         return obj.items.filter(is_purchased=False).count()
@@ -74,9 +128,154 @@ class GroceryListDetailSerializer(GroceryListSerializer):
         return GroceryItemSerializer(items, many=True).data
 
 
+class ListActivitySerializer(serializers.ModelSerializer):
+    actor = UserMinimalSerializer(read_only=True)
+    
+    class Meta:
+        model = ListActivity
+        fields = ['id', 'verb', 'item_id', 'item_name', 'actor', 'payload', 'created_at']
+        read_only_fields = fields
+
+
+class BootstrapListSerializer(serializers.ModelSerializer):
+    active_items = GroceryItemSerializer(many=True, read_only=True)
+    
+    class Meta:
+        model = GroceryList
+        fields = ['id', 'name', 'version', 'active_items', 'created_at', 'updated_at']
+        read_only_fields = fields
+
+
+class BootstrapGroupSerializer(serializers.ModelSerializer):
+    """
+    Group with its list and active items, read from annotations and prefetches.
+    """
+    created_by = UserMinimalSerializer(read_only=True)
+    members_count = serializers.IntegerField(read_only=True)
+    grocery_list = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = UserGroup
+        fields = ['id', 'name', 'description', 'created_by', 'members_count', 'grocery_list', 'created_at', 'updated_at']
+        read_only_fields = fields
+    
+    def get_grocery_list(self, obj):
+        grocery_list = getattr(obj, 'grocery_list', None)
+        if grocery_list is None or grocery_list.detached_at:
+            return None
+        return BootstrapListSerializer(grocery_list).data
+
+
 class MarkPurchasedSerializer(serializers.Serializer):
     is_purchased = serializers.BooleanField()
 
 
+class AdjustQuantitySerializer(serializers.Serializer):
+    AT_ZERO_CHOICES = ['keep', 'delete', 'purchase']
+    
+    delta = serializers.DecimalField(max_digits=10, decimal_places=2)
+    at_zero = serializers.ChoiceField(choices=AT_ZERO_CHOICES, required=False)
+    
+    def validate_delta(self, value):
+        if value == 0:
+            raise serializers.ValidationError("Delta must not be zero.")
+        return value
+    
+    def validate(self, attrs):
+        attrs.setdefault('at_zero', settings.GROCERY_QUANTITY_AT_ZERO)
+        return attrs
+
+
 class BulkItemIdsSerializer(serializers.Serializer):
-    item_ids = serializers.ListField(child=serializers.IntegerField(), min_length=1)
\ No newline at end of file
+    item_ids = serializers.ListField(child=serializers.IntegerField(), min_length=1)
+
+
+class ItemNameSuggestionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ItemNameStat
+        fields = ['name', 'use_count', 'last_used_at']
+        read_only_fields = fields
+
+
+class AutocompleteQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=200)
+    group_id = serializers.IntegerField()
+    limit = serializers.IntegerField(min_value=1, max_value=25, required=False, default=10)
+
+
+class AnalyticsQuerySerializer(serializers.Serializer):
+    weeks = serializers.IntegerField(min_value=1, max_value=104, required=False, default=DEFAULT_WEEKS)
+    top = serializers.IntegerField(min_value=1, max_value=50, required=False, default=DEFAULT_TOP_ITEMS)
+
+
+class ItemPredictionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ItemPrediction
+        fields = [
+            'name', 'category', 'purchase_count', 'mean_interval_days',
+            'last_purchased_at', 'next_due_at'
+        ]
+        read_only_fields = fields
+
+
+class SuggestionsQuerySerializer(serializers.Serializer):
+    horizon_days = serializers.IntegerField(min_value=0, max_value=30, required=False, default=DEFAULT_HORIZON_DAYS)
+    limit = serializers.IntegerField(min_value=1, max_value=50, required=False, default=10)
+
+
+class StapleTemplateItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = StapleTemplateItem
+        fields = ['id', 'name', 'quantity', 'category', 'notes']
+        read_only_fields = ['id']
+
+
+class StapleTemplateSerializer(serializers.ModelSerializer):
+    items = StapleTemplateItemSerializer(many=True)
+    
+    class Meta:
+        model = StapleTemplate
+        fields = ['id', 'group', 'name', 'items', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'created_at', 'updated_at']
+    
+    def validate_group(self, group):
+        if not group.members.filter(id=self.context['request'].user.id).exists():
+            raise serializers.ValidationError('You are not a member of this group.')
+        return group
+    
+    def validate_items(self, items):
+        if len(items) > MAX_TEMPLATE_ITEMS:
+            raise serializers.ValidationError(f'A template can have at most {MAX_TEMPLATE_ITEMS} items.')
+        seen = set()
+        for item in items:
+            key = normalize_item_name(item['name'])
+            if key in seen:
+                raise serializers.ValidationError(f'"{item["name"]}" is listed more than once.')
+            seen.add(key)
+        return items
+    
+    def create(self, validated_data):
+        items = validated_data.pop('items')
+        with transaction.atomic(using=current_shard()):
+            template = StapleTemplate.objects.create(created_by=self.context['request'].user, **validated_data)
+            self._set_items(template, items)
+        return template
+    
+    def update(self, instance, validated_data):
+        items = validated_data.pop('items', None)
+        with transaction.atomic(using=current_shard()):
+            instance = super().update(instance, validated_data)
+            if items is not None:
+                instance.items.all().delete()
+                self._set_items(instance, items)
+        return instance
+    
+    def _set_items(self, template, items):
+        StapleTemplateItem.objects.bulk_create([
+            StapleTemplateItem(template=template, normalized_name=normalize_item_name(item['name']), **item)
+            for item in items
+        ])
+
+
+class ApplyTemplateSerializer(serializers.Serializer):
+    template_id = serializers.IntegerField()
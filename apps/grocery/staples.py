@@ -0,0 +1,104 @@
+"""
+Copying staple templates into a grocery list.
+
+The template's items that aren't already active on the list are inserted
+with a single ``INSERT ... SELECT ... RETURNING`` that reads the template
+rows inside the database. Items are matched on the stored normalized name:
+a template item's ``normalized_name`` against the ``merge_key`` of the
+list's active items, which the new rows take as their own. A concurrent
+write that claims the same key first wins, and the staple is skipped.
+Backends that can't return rows from an insert fall back to a
+``bulk_create`` of the selected rows.
+"""
+from django.db import connections, router
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+
+from .merging import conflict_target
+from .models import GroceryItem, StapleTemplateItem
+
+# Columns filled from the template item; the rest are the same for every row.
+COPIED_FIELDS = ['name', 'quantity', 'category', 'notes']
+# Item columns filled from differently named template columns.
+MAPPED_FIELDS = {'merge_key': 'normalized_name'}
+FIXED_FIELDS = ['grocery_list_id', 'is_purchased', 'added_by_id', 'version', 'created_at', 'updated_at']
+
+
+def copy_template(template, grocery_list, user):
+    """
+    Add ``template``'s items to ``grocery_list``, skipping those already
+    active on it. Returns the ids of the new items.
+    """
+    now = timezone.now()
+    fixed = {
+        'grocery_list_id': grocery_list.id,
+        'is_purchased': False,
+        'added_by_id': user.id if user else None,
+        'version': 1,
+        'created_at': now,
+        'updated_at': now,
+    }
+    using = router.db_for_write(GroceryItem)
+    connection = connections[using]
+    if connection.features.can_return_rows_from_bulk_insert:
+        return _insert_select(connection, template, grocery_list, fixed)
+
+    on_list = GroceryItem.objects.using(using).filter(
+        grocery_list=grocery_list,
+        is_purchased=False,
+        merge_key=OuterRef('normalized_name')
+    )
+    rows = StapleTemplateItem.objects.using(using).filter(template=template).exclude(
+        Exists(on_list)
+    ).values(*COPIED_FIELDS, **{name: F(column) for name, column in MAPPED_FIELDS.items()})
+    created = GroceryItem.objects.using(using).bulk_create(
+        [GroceryItem(**row, **fixed) for row in rows],
+        ignore_conflicts=True
+    )
+    # Without returned ids, find the new rows by the timestamps they were saved with.
+    return list(GroceryItem.objects.using(using).filter(
+        grocery_list=grocery_list,
+        created_at__in={item.created_at for item in created}
+    ).order_by('id').values_list('id', flat=True))
+
+
+def _insert_select(connection, template, grocery_list, fixed):
+    qn = connection.ops.quote_name
+    items = GroceryItem._meta
+    staples = StapleTemplateItem._meta
+
+    def items_column(name):
+        return qn(items.get_field(name).column)
+
+    def staples_column(name):
+        return f'staple.{qn(staples.get_field(name).column)}'
+
+    columns = [items_column(name) for name in FIXED_FIELDS + COPIED_FIELDS + list(MAPPED_FIELDS)]
+    params = [
+        items.get_field(name).get_db_prep_save(fixed[name], connection) for name in FIXED_FIELDS
+    ]
+    select = (
+        ['%s'] * len(FIXED_FIELDS)
+        + [staples_column(name) for name in COPIED_FIELDS + list(MAPPED_FIELDS.values())]
+    )
+    target, target_params = conflict_target(connection)
+    sql = (
+        f"INSERT INTO {qn(items.db_table)} ({', '.join(columns)}) "
+        f"SELECT {', '.join(select)} FROM {qn(staples.db_table)} staple "
+        f"WHERE {staples_column('template')} = %s AND NOT EXISTS ("
+        f"SELECT 1 FROM {qn(items.db_table)} item "
+        f"WHERE item.{items_column('grocery_list')} = %s AND item.{items_column('is_purchased')} = %s "
+        f"AND item.{items_column('merge_key')} = {staples_column('normalized_name')}"
+        f") ORDER BY {staples_column('id')} "
+        f"ON CONFLICT {target} DO NOTHING "
+        f"RETURNING {qn(items.pk.column)}"
+    )
+    params += [
+        template.id,
+        grocery_list.id,
+        items.get_field('is_purchased').get_db_prep_save(False, connection),
+        *target_params,
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
@@ -0,0 +1,381 @@
+"""
+Concurrency stress harness for one grocery list.
+
+``run_stress`` has the members of a group write to the group's list at the
+same time, through the real API: toggles, quantity adjustments, additions,
+bulk purchases, bulk deletes and ``clear_purchased``, picked from a weighted
+mix. Each thread has its own client and database connection; with
+``processes`` above one, that many forked processes each run ``threads``
+threads. The report has throughput, latency percentiles per operation,
+response statuses, lock waits sampled from ``pg_stat_activity`` on
+PostgreSQL, and the invariants that did not hold afterwards:
+
+- every surviving item's quantity is its starting quantity plus the
+  adjustments that succeeded (no lost updates);
+- purchased items, and only those, have ``purchased_at`` and
+  ``purchased_by`` set, and no merge key;
+- the number of items is the starting count plus those added, minus the
+  deletions reported;
+- the group's purchase rollups moved by exactly the purchases and
+  un-purchases reported.
+
+``manage.py stress_list`` runs it against a scratch group.
+"""
+import multiprocessing
+import random
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+from decimal import Decimal
+
+from django.db import connection, connections
+from django.db.models import Q, Sum
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from apps.usergroups.models import GroupMembership, UserGroup
+from apps.users.models import User
+from grocery_manager.throttling import BucketThrottle
+from .merging import claim_merge_keys
+from .models import GroceryItem, GroceryList, PurchaseRollup
+
+DEFAULT_MIX = {
+    'toggle': 30,
+    'adjust': 30,
+    'add': 15,
+    'bulk_mark': 10,
+    'bulk_delete': 8,
+    'clear_purchased': 7,
+}
+BULK_SIZE = 5
+START_QUANTITY = Decimal(5)
+LOCK_SAMPLE_INTERVAL = 0.01
+PERCENTILES = [50, 95, 99]
+
+
+class ItemPool:
+    """
+    Ids of the items a process's threads pick from, shared between them.
+    """
+
+    def __init__(self, item_ids):
+        self.item_ids = list(item_ids)
+        self._lock = threading.Lock()
+
+    def add(self, item_id):
+        with self._lock:
+            self.item_ids.append(item_id)
+
+    def discard(self, item_ids):
+        with self._lock:
+            self.item_ids = [item_id for item_id in self.item_ids if item_id not in item_ids]
+
+    def sample(self, rng, count=1):
+        with self._lock:
+            return rng.sample(self.item_ids, min(count, len(self.item_ids)))
+
+
+def create_scratch_list(members=8, items=50):
+    """
+    A throwaway group of ``members`` new users whose list has ``items``
+    items. Returns the list and the users.
+    """
+    token = uuid.uuid4().hex[:8]
+    users = [
+        User.objects.create_user(username=f'stress-{token}-{n}', email=f'stress-{token}-{n}@example.invalid')
+        for n in range(members)
+    ]
+    group = UserGroup.objects.create(name=f'Stress {token}', created_by=users[0])
+    GroupMembership.objects.bulk_create([GroupMembership(group=group, user=user) for user in users])
+    grocery_list = GroceryList.for_group(group)
+    claim_merge_keys(GroceryItem.objects.bulk_create([
+        GroceryItem(grocery_list=grocery_list, name=f'Item {n}', quantity=START_QUANTITY, added_by=users[0])
+        for n in range(items)
+    ]))
+    return grocery_list, users
+
+
+def remove_scratch_list(grocery_list, users):
+    grocery_list.group.delete()
+    User.objects.filter(id__in=[user.id for user in users]).delete()
+
+
+def _request(client, op, grocery_list, pool, rng):
+    """
+    Make one request. Returns the response and what it changed, if anything.
+    """
+    if op == 'add':
+        response = client.post(reverse('groceryitem-list'), {
+            'grocery_list_id': grocery_list.id,
+            'name': f'Stress {rng.randrange(10 ** 9)}',
+            'quantity': str(START_QUANTITY),
+        }, format='json')
+        if response.status_code == 201:
+            pool.add(response.data['id'])
+            return response, ('added', response.data['id'])
+        return response, None
+    if op == 'clear_purchased':
+        response = client.post(reverse('grocerylist-clear-purchased', args=[grocery_list.id]))
+        return response, ('deleted', response.data['deleted_count']) if response.status_code == 200 else None
+
+    item_ids = pool.sample(rng, BULK_SIZE if op.startswith('bulk') else 1)
+    if not item_ids:
+        return _request(client, 'add', grocery_list, pool, rng)
+    response, effect = _item_request(client, op, item_ids, rng)
+    # Stop picking items that are gone, so the load stays on live rows.
+    if response.status_code == 404 or op == 'bulk_delete' and effect:
+        pool.discard(item_ids)
+    return response, effect
+
+
+def _item_request(client, op, item_ids, rng):
+    if op == 'toggle':
+        response = client.post(reverse('groceryitem-toggle-purchased', args=[item_ids[0]]))
+        if response.status_code == 200:
+            return response, ('purchases', 1 if response.data['is_purchased'] else -1)
+        return response, None
+    if op == 'adjust':
+        delta = Decimal(rng.choice([-1, 1]))
+        response = client.post(
+            reverse('groceryitem-adjust-quantity', args=[item_ids[0]]),
+            {'delta': str(delta), 'at_zero': 'keep'},
+            format='json'
+        )
+        return response, ('adjusted', item_ids[0], delta) if response.status_code == 200 else None
+    if op == 'bulk_mark':
+        response = client.post(reverse('groceryitem-bulk-mark-purchased'), {'item_ids': item_ids}, format='json')
+        return response, ('purchases', response.data['updated_count']) if response.status_code == 200 else None
+    if op == 'bulk_delete':
+        response = client.post(reverse('groceryitem-bulk-delete'), {'item_ids': item_ids}, format='json')
+        return response, ('deleted', response.data['deleted_count']) if response.status_code == 200 else None
+    raise ValueError(f'Unknown operation: {op}')
+
+
+def _worker(user, grocery_list, pool, operations, mix, seed, samples):
+    rng = random.Random(seed)
+    client = APIClient()
+    client.raise_request_exception = False
+    client.force_authenticate(user=user)
+    ops, weights = zip(*mix.items())
+    try:
+        for op in rng.choices(ops, weights, k=operations):
+            if op not in ('add', 'clear_purchased') and not pool.item_ids:
+                # Everything was deleted; refill the list.
+                op = 'add'
+            start = time.perf_counter()
+            try:
+                response, effect = _request(client, op, grocery_list, pool, rng)
+            except Exception as exc:
+                samples.append((op, f'error: {type(exc).__name__}', time.perf_counter() - start, None))
+                continue
+            samples.append((op, response.status_code, time.perf_counter() - start, effect))
+    finally:
+        connections.close_all()
+
+
+def _run_threads(users, grocery_list, item_ids, threads, operations, mix, seed):
+    pool = ItemPool(item_ids)
+    samples = []
+    workers = [
+        threading.Thread(
+            target=_worker,
+            args=(users[index % len(users)], grocery_list, pool, operations, mix, seed + index, samples)
+        )
+        for index in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return samples
+
+
+def _run_process(queue, *args):
+    # The parent closed its connections before forking, so each thread here
+    # opens its own.
+    try:
+        queue.put(('ok', _run_threads(*args)))
+    except Exception as exc:
+        queue.put(('error', repr(exc)))
+
+
+class LockWaitSampler(threading.Thread):
+    """
+    Counts sessions on the current database waiting for a lock, every
+    ``LOCK_SAMPLE_INTERVAL`` seconds until stopped. PostgreSQL only.
+    """
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.samples = []
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            with connection.cursor() as cursor:
+                while not self.stopped.is_set():
+                    cursor.execute(
+                        "SELECT COUNT(*) FROM pg_stat_activity "
+                        "WHERE datname = current_database() AND wait_event_type = 'Lock'"
+                    )
+                    self.samples.append(cursor.fetchone()[0])
+                    self.stopped.wait(LOCK_SAMPLE_INTERVAL)
+        finally:
+            connection.close()
+
+    def summary(self):
+        return {
+            'samples': len(self.samples),
+            'waiting_samples': sum(1 for waiting in self.samples if waiting),
+            'max_waiting': max(self.samples, default=0),
+            # Session-seconds spent waiting for locks, estimated from the samples.
+            'wait_seconds': round(sum(self.samples) * LOCK_SAMPLE_INTERVAL, 3),
+        }
+
+
+@contextmanager
+def throttles_disabled():
+    rates = BucketThrottle.THROTTLE_RATES
+    BucketThrottle.THROTTLE_RATES = {}
+    try:
+        yield
+    finally:
+        BucketThrottle.THROTTLE_RATES = rates
+
+
+def percentiles(latencies):
+    """
+    Nearest-rank percentiles of ``latencies`` (seconds), in milliseconds.
+    """
+    ordered = sorted(latencies)
+    if not ordered:
+        return {}
+    result = {f'p{p}': ordered[max(-(-len(ordered) * p // 100) - 1, 0)] * 1000 for p in PERCENTILES}
+    result['max'] = ordered[-1] * 1000
+    return result
+
+
+def snapshot(grocery_list):
+    """
+    The state of ``grocery_list`` the invariants are checked against.
+    """
+    return {
+        'quantities': dict(GroceryItem.objects.filter(grocery_list=grocery_list).values_list('id', 'quantity')),
+        'purchases': PurchaseRollup.objects.filter(group_id=grocery_list.group_id).aggregate(
+            total=Sum('item_count')
+        )['total'] or 0,
+    }
+
+
+def check_invariants(grocery_list, before, samples):
+    """
+    Descriptions of the invariants that don't hold after ``samples``
+    ran against a list that was in state ``before``.
+    """
+    expected = dict(before['quantities'])
+    added = deleted = purchases = 0
+    for _, _, _, effect in samples:
+        if effect is None:
+            continue
+        if effect[0] == 'added':
+            expected[effect[1]] = START_QUANTITY
+            added += 1
+        elif effect[0] == 'adjusted':
+            expected[effect[1]] += effect[2]
+        elif effect[0] == 'deleted':
+            deleted += effect[1]
+        elif effect[0] == 'purchases':
+            purchases += effect[1]
+
+    after = snapshot(grocery_list)
+    violations = []
+    for item_id, quantity in after['quantities'].items():
+        if quantity != expected.get(item_id):
+            violations.append(f'Item {item_id} has quantity {quantity}, expected {expected.get(item_id)}.')
+
+    inconsistent = GroceryItem.objects.filter(grocery_list=grocery_list).filter(
+        Q(is_purchased=True, purchased_at__isnull=True)
+        | Q(is_purchased=True, purchased_by__isnull=True)
+        | Q(is_purchased=True, merge_key__isnull=False)
+        | Q(is_purchased=False, purchased_at__isnull=False)
+        | Q(is_purchased=False, purchased_by__isnull=False)
+    ).values_list('id', flat=True)
+    violations += [f'Item {item_id} has inconsistent purchase fields.' for item_id in inconsistent]
+
+    expected_count = len(before['quantities']) + added - deleted
+    if len(after['quantities']) != expected_count:
+        violations.append(f"The list has {len(after['quantities'])} items, expected {expected_count}.")
+    if after['purchases'] != before['purchases'] + purchases:
+        violations.append(
+            f"The rollups count {after['purchases']} purchases, expected {before['purchases'] + purchases}."
+        )
+    return violations
+
+
+def run_stress(grocery_list, users, threads=8, processes=1, operations=100, mix=None, seed=0, throttle=False):
+    """
+    Drive ``grocery_list`` from ``threads`` threads in each of ``processes``
+    processes, each making ``operations`` requests as one of ``users`` (who
+    must be members of its group). Data must be committed for the workers
+    to see it, so don't call this inside a transaction.
+    """
+    mix = mix or DEFAULT_MIX
+    before = snapshot(grocery_list)
+    item_ids = list(before['quantities'])
+    args = (users, grocery_list, item_ids, threads, operations, mix)
+
+    sampler = LockWaitSampler() if connection.vendor == 'postgresql' else None
+    with nullcontext() if throttle else throttles_disabled():
+        connections.close_all()
+        start = time.perf_counter()
+        if processes > 1:
+            context = multiprocessing.get_context('fork')
+            queue = context.Queue()
+            children = [
+                context.Process(target=_run_process, args=(queue, *args, seed + index * threads))
+                for index in range(processes)
+            ]
+            for child in children:
+                child.start()
+            if sampler:
+                sampler.start()
+            results = [queue.get() for _ in children]
+            for child in children:
+                child.join()
+            failures = [detail for outcome, detail in results if outcome != 'ok']
+            if failures:
+                raise RuntimeError(f'Stress worker processes failed: {failures}')
+            samples = [sample for _, process_samples in results for sample in process_samples]
+        else:
+            if sampler:
+                sampler.start()
+            samples = _run_threads(*args, seed)
+        elapsed = time.perf_counter() - start
+        if sampler:
+            sampler.stopped.set()
+            sampler.join()
+
+    latencies = defaultdict(list)
+    statuses = defaultdict(Counter)
+    for op, status_code, seconds, _ in samples:
+        latencies[op].append(seconds)
+        statuses[op][status_code] += 1
+    errors = sum(
+        count for counter in statuses.values() for status_code, count in counter.items()
+        if not isinstance(status_code, int) or status_code >= 500
+    )
+    return {
+        'requests': len(samples),
+        'seconds': elapsed,
+        'throughput': len(samples) / elapsed if elapsed else 0,
+        'latency_ms': {
+            'all': percentiles([sample[2] for sample in samples]),
+            **{op: percentiles(values) for op, values in sorted(latencies.items())},
+        },
+        'statuses': {op: dict(counter) for op, counter in sorted(statuses.items())},
+        'errors': errors,
+        'lock_waits': sampler.summary() if sampler else None,
+        'violations': check_invariants(grocery_list, before, samples),
+    }
@@ -1,12 +1,38 @@
+import gzip
+import json
+import os
+import tempfile
+import threading
+import unittest
+from datetime import timedelta
+from http.server import ThreadingHTTPServer
 from decimal import Decimal
-from django.test import TestCase
+from io import StringIO
+from unittest import mock
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.db.models import F
+from django.contrib.admin.sites import site as admin_site
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 from rest_framework import status
-from rest_framework.test import APITestCase, APIClient
-from .models import GroceryList, GroceryItem
+from rest_framework.test import APITestCase, APIClient, APIRequestFactory
+from .admin import INLINE_ITEMS_LIMIT, GroceryListAdmin
+from .autocomplete import record_item_names
+from .merging import merge_items
+from .models import (
+    GroceryList, GroceryItem, IdempotencyRecord, ItemNameStat, ItemPrediction, ListActivity, OutboxEvent,
+    PurchaseEvent, PurchaseRollup, StapleTemplate, TopItemRollup
+)
+from .serializers import GroceryItemUpdateSerializer
+from . import outbox, stress
 from apps.usergroups.models import UserGroup, GroupMembership
 from apps.users.models import User
+from grocery_manager import middleware as compression, querylog, warmup
+from grocery_manager.throttling import BucketThrottle, CacheBucketStore, LocalBucketStore
 
 
 class GroceryListModelTests(TestCase):
@@ -23,17 +49,32 @@ class GroceryListModelTests(TestCase):
         )
 
     def test_create_grocery_list(self):
-        """Test creating a grocery list."""
-        grocery_list = GroceryList.objects.create(
-            group=self.group,
-            name='Weekly Groceries'
-        )
-        self.assertEqual(grocery_list.name, 'Weekly Groceries')
+        """Test that creating a group creates its grocery list."""
+        grocery_list = GroceryList.objects.get(group=self.group)
+        self.assertEqual(grocery_list.name, "Test Family's Grocery List")
         self.assertEqual(grocery_list.group, self.group)
 
+    def test_fixture_groups_get_lists_after_loading(self):
+        """Test that groups loaded from a fixture get a list unless the fixture brings one."""
+        now = timezone.now().isoformat()
+        stamps = {'created_at': now, 'updated_at': now}
+        fixture = [
+            {'model': 'usergroups.usergroup', 'pk': 9001, 'fields': {'name': 'Loaded', **stamps}},
+            {'model': 'usergroups.usergroup', 'pk': 9002, 'fields': {'name': 'Listed', **stamps}},
+            {'model': 'grocery.grocerylist', 'pk': 9002, 'fields': {'group': 9002, 'name': 'From fixture', **stamps}},
+        ]
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as f:
+            json.dump(fixture, f)
+            f.flush()
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command('loaddata', f.name, verbosity=0)
+
+        self.assertEqual(GroceryList.objects.get(group_id=9001).name, "Loaded's Grocery List")
+        self.assertEqual(GroceryList.objects.get(group_id=9002).name, 'From fixture')
+
     def test_cascade_delete_on_group(self):
         """Test that grocery list is deleted when group is deleted."""
-        grocery_list = GroceryList.objects.create(group=self.group)
+        grocery_list = self.group.grocery_list
         list_id = grocery_list.id
         
         self.group.delete()
@@ -52,10 +93,7 @@ class GroceryItemModelTests(TestCase):
             name='Test Family',
             created_by=self.user
         )
-        self.grocery_list = GroceryList.objects.create(
-            group=self.group,
-            name='Weekly Groceries'
-        )
+        self.grocery_list = self.group.grocery_list
 
     def test_create_grocery_item(self):
         """Test creating a grocery item."""
@@ -106,7 +144,6 @@ class GroceryListAPITests(APITestCase):
 
     def test_list_grocery_lists(self):
         """Test listing grocery lists."""
-        GroceryList.objects.create(group=self.group, name='My List')
         
         self.client.force_authenticate(user=self.user)
         url = reverse('grocerylist-list')
@@ -117,7 +154,7 @@ class GroceryListAPITests(APITestCase):
 
     def test_retrieve_list_with_items(self):
         """Test retrieving a list includes items separated by status."""
-        grocery_list = GroceryList.objects.create(group=self.group)
+        grocery_list = self.group.grocery_list
         GroceryItem.objects.create(grocery_list=grocery_list, name='Active Item 1')
         GroceryItem.objects.create(grocery_list=grocery_list, name='Active Item 2')
         GroceryItem.objects.create(
@@ -137,7 +174,7 @@ class GroceryListAPITests(APITestCase):
 
     def test_clear_purchased_items(self):
         """Test deleting all purchased items."""
-        grocery_list = GroceryList.objects.create(group=self.group)
+        grocery_list = self.group.grocery_list
         GroceryItem.objects.create(grocery_list=grocery_list, name='Active')
         GroceryItem.objects.create(grocery_list=grocery_list, name='Purchased 1', is_purchased=True)
         GroceryItem.objects.create(grocery_list=grocery_list, name='Purchased 2', is_purchased=True)
@@ -176,7 +213,7 @@ class GroceryItemAPITests(APITestCase):
             created_by=self.user
         )
         GroupMembership.objects.create(user=self.user, group=self.group)
-        self.grocery_list = GroceryList.objects.create(group=self.group)
+        self.grocery_list = self.group.grocery_list
         self.client = APIClient()
 
     def test_create_item(self):
@@ -263,4 +300,1728 @@ class GroceryItemAPITests(APITestCase):
         response = self.client.delete(url)
         
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
-        self.assertFalse(GroceryItem.objects.filter(id=item.id).exists())
\ No newline at end of file
+        self.assertFalse(GroceryItem.objects.filter(id=item.id).exists())
+
+
+class GroceryListTransferTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.group = UserGroup.objects.create(
+            name='Test Family',
+            created_by=self.user
+        )
+        GroupMembership.objects.create(user=self.user, group=self.group)
+        self.grocery_list = self.group.grocery_list
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_export_csv_streams_items(self):
+        """Test exporting a list as CSV streams a header and one row per item."""
+        GroceryItem.objects.create(grocery_list=self.grocery_list, name='Milk', category='dairy', added_by=self.user)
+        GroceryItem.objects.create(grocery_list=self.grocery_list, name='Bread', category='bakery')
+
+        url = reverse('grocerylist-export', kwargs={'pk': self.grocery_list.pk})
+        response = self.client.get(url, {'file_format': 'csv'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'name', 'quantity'])
+        self.assertEqual(len(lines), 3)
+        self.assertIn('testuser', lines[1])
+
+    def test_export_ndjson(self):
+        """Test exporting a list as NDJSON yields one JSON object per line."""
+        GroceryItem.objects.create(grocery_list=self.grocery_list, name='Milk', quantity=2)
+
+        url = reverse('grocerylist-export', kwargs={'pk': self.grocery_list.pk})
+        response = self.client.get(url, {'file_format': 'ndjson'})
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['name'], 'Milk')
+        self.assertEqual(Decimal(rows[0]['quantity']), Decimal('2'))
+
+    def test_import_csv_in_batches_reports_invalid_rows(self):
+        """Test importing a CSV creates valid rows and reports invalid ones."""
+        content = 'name,quantity,category,notes\nMilk,2,dairy,2%\nApples,,produce,\n,1,other,\nEggs,12,nonsense,\n'
+        upload = SimpleUploadedFile('items.csv', content.encode(), content_type='text/csv')
+
+        url = reverse('grocerylist-import', kwargs={'pk': self.grocery_list.pk})
+        with mock.patch('apps.grocery.transfer.IMPORT_BATCH_SIZE', 1):
+            response = self.client.post(url, {'file': upload}, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['created_count'], 2)
+        self.assertEqual(response.data['error_count'], 2)
+        self.assertEqual([error['line'] for error in response.data['errors']], [4, 5])
+        self.assertEqual(
+            set(self.grocery_list.items.values_list('name', flat=True)),
+            {'Milk', 'Apples'}
+        )
+        self.assertEqual(self.grocery_list.items.get(name='Apples').added_by, self.user)
+
+    def test_import_ndjson(self):
+        """Test importing NDJSON detected from the file extension."""
+        content = '{"name": "Milk", "quantity": "1.5"}\n\nnot json\n{"name": "Tea", "category": "beverages"}\n'
+        upload = SimpleUploadedFile('items.ndjson', content.encode())
+
+        url = reverse('grocerylist-import', kwargs={'pk': self.grocery_list.pk})
+        response = self.client.post(url, {'file': upload}, format='multipart')
+
+        self.assertEqual(response.data['created_count'], 2)
+        self.assertEqual(response.data['errors'][0]['line'], 3)
+        self.assertEqual(self.grocery_list.items.get(name='Milk').quantity, Decimal('1.5'))
+
+
+class ItemNameAutocompleteTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.other_user = User.objects.create_user(
+            username='otheruser',
+            email='other@example.com',
+            password='otherpass123'
+        )
+        self.group = UserGroup.objects.create(
+            name='Test Family',
+            created_by=self.user
+        )
+        GroupMembership.objects.create(user=self.user, group=self.group)
+        self.grocery_list = self.group.grocery_list
+        self.client = APIClient()
+
+    def test_created_items_feed_the_index(self):
+        """Test that adding items counts name usage per group, case-insensitively."""
+        self.client.force_authenticate(user=self.user)
+        url = reverse('groceryitem-list')
+        for name in ['Milk', 'milk ', 'Mint', 'Bread']:
+            self.client.post(url, {'grocery_list_id': self.grocery_list.id, 'name': name})
+
+        stat = ItemNameStat.objects.get(group=self.group, normalized_name='milk')
+        self.assertEqual(stat.use_count, 2)
+        self.assertEqual(ItemNameStat.objects.filter(group=self.group).count(), 3)
+
+    def test_autocomplete_ranks_by_frequency_and_survives_deletes(self):
+        """Test suggestions are prefix matched, ranked by use and kept after items are removed."""
+        record_item_names(self.group.id, ['Mint', 'Milk', 'Milk', 'Bread'])
+        GroceryItem.objects.all().delete()
+
+        self.client.force_authenticate(user=self.user)
+        url = reverse('groceryitem-autocomplete')
+        response = self.client.get(url, {'q': 'MI', 'group_id': self.group.id})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['name'] for row in response.data], ['Milk', 'Mint'])
+        self.assertEqual(response.data[0]['use_count'], 2)
+
+    def test_autocomplete_requires_membership(self):
+        """Test that non-members cannot read a group's suggestions."""
+        record_item_names(self.group.id, ['Milk'])
+        self.client.force_authenticate(user=self.other_user)
+        url = reverse('groceryitem-autocomplete')
+        response = self.client.get(url, {'q': 'mi', 'group_id': self.group.id})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_rebuild_command_backfills_from_items(self):
+        """Test the rebuild command recomputes counts from existing items."""
+        GroceryItem.objects.create(grocery_list=self.grocery_list, name='Eggs')
+        GroceryItem.objects.create(grocery_list=self.grocery_list, name='EGGS')
+
+        call_command('rebuild_item_name_stats', stdout=StringIO())
+
+        stat = ItemNameStat.objects.get(group=self.group)
+        self.assertEqual((stat.normalized_name, stat.use_count), ('eggs', 2))
+
+
+class GroceryItemMergeTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.group = UserGroup.objects.create(
+            name='Test Family',
+            created_by=self.user
+        )
+        GroupMembership.objects.create(user=self.user, group=self.group)
+        self.grocery_list = self.group.grocery_list
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_create_with_merge_adds_quantity(self):
+        """Test that merge mode folds a duplicate name into the active item."""
+        url = reverse('groceryitem-list')
+        first = self.client.post(url, {'grocery_list_id': self.grocery_list.id, 'name': 'Milk', 'quantity': 1, 'merge': True})
+        second = self.client.post(url, {'grocery_list_id': self.grocery_list.id, 'name': ' MILK', 'quantity': 2, 'merge': True})
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.data['id'], first.data['id'])
+        self.assertEqual(Decimal(second.data['quantity']), Decimal('3'))
+        self.assertEqual(self.grocery_list.items.count(), 1)
+
+    def test_create_without_merge_keeps_duplicates(self):
+        """Test that duplicates are still allowed when merge mode is off."""
+        url = reverse('groceryitem-list')
+        self.client.post(url, {'grocery_list_id': self.grocery_list.id, 'name': 'Milk', 'merge': True})
+        self.client.post(url, {'grocery_list_id': self.grocery_list.id, 'name': 'Milk'})
+        self.assertEqual(self.grocery_list.items.count(), 2)
+
+    def test_merge_ignores_other_categories_and_purchased_items(self):
+        """Test that merging only matches active items with the same category."""
+        url = reverse('groceryitem-list')
+        milk = self.client.post(url, {'grocery_list_id': self.grocery_list.id, 'name': 'Milk', 'category': 'dairy', 'merge': True})
+        self.client.post(reverse('groceryitem-toggle-purchased', kwargs={'pk': milk.data['id']}))
+        self.client.post(url, {'grocery_list_id': self.grocery_list.id, 'name': 'Milk', 'category': 'dairy', 'merge': True})
+        self.client.post(url, {'grocery_list_id': self.grocery_list.id, 'name': 'Milk', 'category': 'beverages', 'merge': True})
+
+        self.assertEqual(self.grocery_list.items.count(), 3)
+        # Restoring the purchased item must not collide with the new active one.
+        response = self.client.post(reverse('groceryitem-toggle-purchased', kwargs={'pk': milk.data['id']}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_bulk_create_with_merge(self):
+        """Test bulk create merges into existing items and within the request."""
+        self.client.post(
+            reverse('groceryitem-list'),
+            {'grocery_list_id': self.grocery_list.id, 'name': 'Eggs', 'quantity': 6, 'merge': True}
+        )
+        url = reverse('groceryitem-bulk-create')
+        response = self.client.post(url, {
+            'grocery_list_id': self.grocery_list.id,
+            'merge': True,
+            'items': [
+                {'name': 'eggs', 'quantity': 6},
+                {'name': 'Bread'},
+                {'name': 'bread', 'quantity': 2},
+            ]
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created_count'], 1)
+        self.assertEqual(response.data['merged_count'], 1)
+        self.assertEqual(self.grocery_list.items.get(name='Eggs').quantity, Decimal('12'))
+        self.assertEqual(self.grocery_list.items.get(name='Bread').quantity, Decimal('3'))
+
+    def test_bulk_create_without_merge(self):
+        """Test plain bulk create inserts every item."""
+        url = reverse('groceryitem-bulk-create')
+        response = self.client.post(url, {
+            'grocery_list_id': self.grocery_list.id,
+            'items': [{'name': 'Tea'}, {'name': 'Tea'}]
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['items']), 2)
+        # The first Tea holds the merge key; its duplicate is left without one.
+        self.assertEqual(self.grocery_list.items.filter(merge_key='tea').count(), 1)
+
+    def test_merge_matches_items_added_without_merge(self):
+        """Test that merge mode folds into items added plainly, imported or restored."""
+        url = reverse('groceryitem-list')
+        plain = self.client.post(url, {'grocery_list_id': self.grocery_list.id, 'name': 'Milk'})
+        merged = self.client.post(url, {'grocery_list_id': self.grocery_list.id, 'name': 'milk', 'merge': True})
+        self.assertEqual(merged.status_code, status.HTTP_200_OK)
+        self.assertEqual(merged.data['id'], plain.data['id'])
+
+        upload = SimpleUploadedFile('items.csv', b'name,quantity\nOlive  Oil,1\n', content_type='text/csv')
+        self.client.post(
+            reverse('grocerylist-import', kwargs={'pk': self.grocery_list.pk}), {'file': upload}, format='multipart'
+        )
+        merged = self.client.post(url, {'grocery_list_id': self.grocery_list.id, 'name': 'olive oil', 'merge': True})
+        self.assertEqual(merged.status_code, status.HTTP_200_OK)
+
+        toggle_url = reverse('groceryitem-toggle-purchased', kwargs={'pk': plain.data['id']})
+        self.client.post(toggle_url)
+        self.client.post(toggle_url)
+        merged = self.client.post(url, {'grocery_list_id': self.grocery_list.id, 'name': 'MILK', 'merge': True})
+        self.assertEqual(merged.data['id'], plain.data['id'])
+        self.assertEqual(self.grocery_list.items.count(), 2)
+
+    def test_backfill_merge_keys(self):
+        """Test that existing keyless items get merge keys and duplicates are left alone."""
+        items = GroceryItem.objects.bulk_create([
+            GroceryItem(grocery_list=self.grocery_list, name=name) for name in ['Rice', 'rice', 'Beans']
+        ])
+        out = StringIO()
+        call_command('backfill_merge_keys', stdout=out)
+
+        self.assertIn('Set merge keys on 2 of 3 active items.', out.getvalue())
+        self.assertEqual(
+            dict(self.grocery_list.items.values_list('id', 'merge_key')),
+            {items[0].id: 'rice', items[1].id: None, items[2].id: 'beans'}
+        )
+
+    def test_merge_fallback_without_upsert_support(self):
+        """Test the update-then-insert fallback merges the same way."""
+        features = type(connection.features)
+        with mock.patch.object(features, 'supports_update_conflicts_with_target', False):
+            merge_items(self.grocery_list, [{'name': 'Rice', 'quantity': Decimal('1')}], self.user)
+            results = merge_items(self.grocery_list, [{'name': 'rice', 'quantity': Decimal('2')}], self.user)
+
+        self.assertEqual(results[0][1], False)
+        self.assertEqual(self.grocery_list.items.get().quantity, Decimal('3'))
+
+
+class AdjustQuantityTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.group = UserGroup.objects.create(
+            name='Test Family',
+            created_by=self.user
+        )
+        GroupMembership.objects.create(user=self.user, group=self.group)
+        self.grocery_list = self.group.grocery_list
+        self.item = GroceryItem.objects.create(grocery_list=self.grocery_list, name='Eggs', quantity=2)
+        self.url = reverse('groceryitem-adjust-quantity', kwargs={'pk': self.item.pk})
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_increment_and_decrement(self):
+        """Test applying signed deltas to the stored quantity."""
+        self.client.post(self.url, {'delta': '1.5'})
+        response = self.client.post(self.url, {'delta': '-0.5'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Decimal(response.data['quantity']), Decimal('3'))
+
+    def test_adjust_applies_to_current_value(self):
+        """Test that a delta is applied to the database value, not a stale copy."""
+        GroceryItem.objects.filter(pk=self.item.pk).update(quantity=10)
+        self.client.post(self.url, {'delta': '1'})
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.quantity, Decimal('11'))
+
+    def test_bounds_are_enforced(self):
+        """Test that quantities cannot go negative or overflow the column."""
+        below = self.client.post(self.url, {'delta': '-3'})
+        above = self.client.post(self.url, {'delta': '99999999.99'})
+        zero = self.client.post(self.url, {'delta': '0'})
+
+        self.assertEqual(below.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(above.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(zero.status_code, status.HTTP_400_BAD_REQUEST)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.quantity, Decimal('2'))
+
+    def test_at_zero_delete_and_purchase(self):
+        """Test the configured behaviour when an item reaches zero."""
+        response = self.client.post(self.url, {'delta': '-2', 'at_zero': 'purchase'})
+        self.assertTrue(response.data['is_purchased'])
+        self.assertEqual(response.data['purchased_by']['id'], self.user.id)
+
+        GroceryItem.objects.filter(pk=self.item.pk).update(quantity=1)
+        with self.settings(GROCERY_QUANTITY_AT_ZERO='delete'):
+            response = self.client.post(self.url, {'delta': '-1'})
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(GroceryItem.objects.filter(pk=self.item.pk).exists())
+
+
+class OptimisticConcurrencyTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.group = UserGroup.objects.create(
+            name='Test Family',
+            created_by=self.user
+        )
+        GroupMembership.objects.create(user=self.user, group=self.group)
+        self.grocery_list = self.group.grocery_list
+        self.item = GroceryItem.objects.create(grocery_list=self.grocery_list, name='Milk')
+        self.url = reverse('groceryitem-detail', kwargs={'pk': self.item.pk})
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_retrieve_exposes_version_etag(self):
+        """Test that item responses carry the row version as an ETag."""
+        response = self.client.get(self.url)
+        self.assertEqual(response['ETag'], '"1"')
+        self.assertEqual(response.data['version'], 1)
+
+    def test_update_with_matching_if_match(self):
+        """Test that a write with the current ETag succeeds and bumps the version."""
+        response = self.client.patch(self.url, {'name': 'Oat Milk'}, HTTP_IF_MATCH='"1"')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['ETag'], '"2"')
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.name, self.item.version), ('Oat Milk', 2))
+
+    def test_stale_if_match_is_rejected(self):
+        """Test that a write based on an old version fails with 412 and changes nothing."""
+        self.client.patch(self.url, {'quantity': 3})
+        response = self.client.patch(self.url, {'name': 'Oat Milk'}, HTTP_IF_MATCH='"1"')
+
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.name, 'Milk')
+
+    def test_compare_and_swap_detects_concurrent_write(self):
+        """Test that a write racing another one loses instead of overwriting it."""
+        stale = GroceryItem.objects.get(pk=self.item.pk)
+        GroceryItem.objects.filter(pk=self.item.pk).update(version=F('version') + 1, name='Soy Milk')
+
+        stale.name = 'Oat Milk'
+        self.assertFalse(stale.save_versioned(['name']))
+        self.assertTrue(stale.save_versioned(['name'], force=True))
+        self.assertEqual(stale.version, 3)
+
+    def test_plain_save_bumps_version(self):
+        """Test that a save outside the API invalidates the ETag clients hold."""
+        item = GroceryItem.objects.get(pk=self.item.pk)
+        item.notes = 'Changed in the admin'
+        item.save()
+        self.assertEqual(item.version, 2)
+        item.save(update_fields=['notes'])
+        self.assertEqual(item.version, 3)
+
+        response = self.client.patch(self.url, {'name': 'Oat Milk'}, HTTP_IF_MATCH='"1"')
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+
+    def test_purchase_actions_honour_if_match(self):
+        """Test toggle and delete respect If-Match and every write bumps the version."""
+        toggle_url = reverse('groceryitem-toggle-purchased', kwargs={'pk': self.item.pk})
+        response = self.client.post(toggle_url, HTTP_IF_MATCH='W/"1"')
+        self.assertEqual(response.data['version'], 2)
+
+        response = self.client.post(toggle_url, HTTP_IF_MATCH='"1"')
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+
+        response = self.client.delete(self.url, HTTP_IF_MATCH='"1"')
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        response = self.client.delete(self.url, HTTP_IF_MATCH='"2"')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_list_update_uses_versions(self):
+        """Test that grocery lists are versioned the same way."""
+        url = reverse('grocerylist-detail', kwargs={'pk': self.grocery_list.pk})
+        response = self.client.patch(url, {'name': 'Weekly'}, HTTP_IF_MATCH='"1"')
+        self.assertEqual(response['ETag'], '"2"')
+
+        response = self.client.patch(url, {'name': 'Monthly'}, HTTP_IF_MATCH='"1"')
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+
+
+class BootstrapAPITests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.other_user = User.objects.create_user(
+            username='otheruser',
+            email='other@example.com',
+            password='otherpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('bootstrap')
+
+    def add_group(self, name, members):
+        group = UserGroup.objects.create(name=name, created_by=self.user)
+        for member in members:
+            GroupMembership.objects.create(user=member, group=group)
+        grocery_list = group.grocery_list
+        GroceryItem.objects.create(grocery_list=grocery_list, name='Milk', added_by=self.user)
+        GroceryItem.objects.create(grocery_list=grocery_list, name='Bread', is_purchased=True)
+        return group
+
+    def test_bootstrap_payload(self):
+        """Test the combined payload of user, groups, member counts and active items."""
+        group = self.add_group('Home', [self.user, self.other_user])
+        self.add_group('Not mine', [self.other_user])
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['user']['username'], 'testuser')
+        self.assertEqual(len(response.data['groups']), 1)
+        payload = response.data['groups'][0]
+        self.assertEqual(payload['id'], group.id)
+        self.assertEqual(payload['members_count'], 2)
+        self.assertEqual([item['name'] for item in payload['grocery_list']['active_items']], ['Milk'])
+
+    def test_bootstrap_query_count_is_fixed(self):
+        """Test that the number of queries doesn't grow with the number of groups."""
+        self.add_group('Home', [self.user])
+        with self.assertNumQueries(2):
+            self.client.get(self.url)
+
+        self.add_group('Parents', [self.user, self.other_user])
+        self.add_group('Cabin', [self.user])
+        UserGroup.objects.create(name='No list yet').members.add(self.user)
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.data['groups']), 4)
+
+    def test_bootstrap_etag_revalidation(self):
+        """Test that an unchanged payload answers If-None-Match with 304."""
+        group = self.add_group('Home', [self.user])
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        GroceryItem.objects.create(grocery_list=group.grocery_list, name='Eggs')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class ByGroupTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.group = UserGroup.objects.create(
+            name='Test Family',
+            created_by=self.user
+        )
+        GroupMembership.objects.create(user=self.user, group=self.group)
+        self.url = reverse('grocerylist-by-group', kwargs={'group_id': self.group.id})
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_by_group_does_not_create_lists(self):
+        """Test that by_group is a pure read and 404s for an unprovisioned group."""
+        GroceryList.objects.filter(group=self.group).delete()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(GroceryList.objects.exists())
+
+    def test_by_group_supports_revalidation(self):
+        """Test that by_group returns the list with an ETag honoured by If-None-Match."""
+        grocery_list = self.group.grocery_list
+        GroceryItem.objects.create(grocery_list=grocery_list, name='Milk')
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['id'], grocery_list.id)
+        self.assertEqual(len(response.data['active_items']), 1)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_provision_command_backfills_missing_lists(self):
+        """Test the backfill command creates lists only for groups without one."""
+        GroceryList.objects.filter(group=self.group).delete()
+        other = UserGroup.objects.create(name='Cabin', created_by=self.user)
+        existing = other.grocery_list
+        GroceryList.objects.filter(pk=existing.pk).update(name='Keep me')
+
+        call_command('provision_grocery_lists', stdout=StringIO())
+
+        self.assertEqual(GroceryList.objects.get(group=self.group).name, "Test Family's Grocery List")
+        self.assertEqual(GroceryList.objects.get(group=other), existing)
+        self.assertEqual(GroceryList.objects.get(group=other).name, 'Keep me')
+
+
+class MyItemsAPITests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.other_user = User.objects.create_user(
+            username='otheruser',
+            email='other@example.com',
+            password='otherpass123'
+        )
+        self.home = self.add_group('Home', [self.user])
+        self.parents = self.add_group('Parents', [self.user, self.other_user])
+        self.strangers = self.add_group('Strangers', [self.other_user])
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('groceryitem-mine')
+
+    def add_group(self, name, members):
+        group = UserGroup.objects.create(name=name)
+        for member in members:
+            GroupMembership.objects.create(user=member, group=group)
+        return group
+
+    def add_item(self, group, name, **kwargs):
+        return GroceryItem.objects.create(grocery_list=group.grocery_list, name=name, **kwargs)
+
+    def test_merges_active_items_across_groups(self):
+        """Test that active items from every group of the user are returned."""
+        self.add_item(self.home, 'Milk', category='dairy')
+        self.add_item(self.parents, 'Tea', category='beverages')
+        self.add_item(self.parents, 'Cheese', category='dairy', is_purchased=True)
+        self.add_item(self.strangers, 'Secret')
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual({item['name'] for item in response.data['results']}, {'Milk', 'Tea'})
+        tea = next(item for item in response.data['results'] if item['name'] == 'Tea')
+        self.assertEqual(tea['group'], self.parents.id)
+
+    def test_filters_by_category_and_group(self):
+        """Test category and group filters."""
+        self.add_item(self.home, 'Milk', category='dairy')
+        self.add_item(self.parents, 'Yoghurt', category='dairy')
+        self.add_item(self.parents, 'Tea', category='beverages')
+
+        response = self.client.get(self.url, {'category': 'dairy'})
+        self.assertEqual(len(response.data['results']), 2)
+        response = self.client.get(self.url, {'category': 'dairy', 'group_id': self.parents.id})
+        self.assertEqual([item['name'] for item in response.data['results']], ['Yoghurt'])
+
+    def test_keyset_pagination_with_fixed_query_count(self):
+        """Test that pages are walked with cursors in one query each."""
+        for index in range(5):
+            self.add_item(self.home if index % 2 else self.parents, f'Item {index}')
+
+        names = []
+        url = f'{self.url}?page_size=2'
+        while url:
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            names.extend(item['name'] for item in response.data['results'])
+            url = response.data['next']
+
+        self.assertEqual(names, [f'Item {index}' for index in reversed(range(5))])
+
+
+class GroceryAdminTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='admin',
+            email='admin@example.com',
+            password='adminpass123'
+        )
+        self.client.force_login(self.admin)
+
+    def add_list(self, name, items=0):
+        group = UserGroup.objects.create(name=name)
+        grocery_list = group.grocery_list
+        GroceryItem.objects.bulk_create([
+            GroceryItem(grocery_list=grocery_list, name=f'Item {index}', is_purchased=index % 2 == 0)
+            for index in range(items)
+        ])
+        return grocery_list
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_changelists_do_not_query_per_row(self):
+        """Test that list and item changelists use a fixed number of queries."""
+        self.add_list('First', items=3)
+        list_url = reverse('admin:grocery_grocerylist_changelist')
+        item_url = reverse('admin:grocery_groceryitem_changelist')
+        list_queries, _ = self.count_queries(list_url)
+        item_queries, _ = self.count_queries(item_url)
+
+        for index in range(4):
+            self.add_list(f'List {index}', items=3)
+        self.assertEqual(self.count_queries(list_url)[0], list_queries)
+        self.assertEqual(self.count_queries(item_url)[0], item_queries)
+
+    def test_annotated_counts(self):
+        """Test the changelist counts come from the annotation."""
+        grocery_list = self.add_list('Counts', items=5)
+        obj = GroceryListAdmin(GroceryList, admin_site).get_queryset(None).get(pk=grocery_list.pk)
+        self.assertEqual((obj._active_items_count, obj._purchased_items_count), (2, 3))
+
+    def test_large_list_links_instead_of_inlining(self):
+        """Test that large lists link to the item changelist instead of rendering every item."""
+        small = self.add_list('Small', items=2)
+        large = self.add_list('Large', items=INLINE_ITEMS_LIMIT + 1)
+
+        _, response = self.count_queries(reverse('admin:grocery_grocerylist_change', args=[small.pk]))
+        self.assertContains(response, 'Item 1')
+
+        _, response = self.count_queries(reverse('admin:grocery_grocerylist_change', args=[large.pk]))
+        self.assertNotContains(response, 'value="Item 1"')
+        self.assertContains(response, f'?grocery_list__id__exact={large.pk}')
+
+
+class PurchaseAnalyticsTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.group = UserGroup.objects.create(name='Test Family', created_by=self.user)
+        GroupMembership.objects.create(user=self.user, group=self.group)
+        self.grocery_list = self.group.grocery_list
+        self.milk = GroceryItem.objects.create(
+            grocery_list=self.grocery_list, name='Milk', category='dairy', quantity=2, added_by=self.user
+        )
+        self.bread = GroceryItem.objects.create(
+            grocery_list=self.grocery_list, name='Bread', category='bakery', added_by=self.user
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def rollup_totals(self):
+        return {
+            row.category: (row.item_count, row.quantity, row.member_id)
+            for row in PurchaseRollup.objects.filter(group=self.group)
+        }
+
+    def test_toggle_updates_and_reverses_rollups(self):
+        """Test that purchasing counts an item and un-purchasing removes it again."""
+        url = reverse('groceryitem-toggle-purchased', kwargs={'pk': self.milk.pk})
+
+        self.client.post(url)
+        self.assertEqual(self.rollup_totals(), {'dairy': (1, Decimal('2'), self.user.id)})
+        top = TopItemRollup.objects.get(group=self.group)
+        self.assertEqual((top.name, top.purchase_count), ('Milk', 1))
+
+        self.client.post(url)
+        self.assertEqual(self.rollup_totals(), {'dairy': (0, Decimal('0'), self.user.id)})
+        self.assertEqual(TopItemRollup.objects.get(group=self.group).purchase_count, 0)
+
+    def test_update_serializer_moves_purchased_item(self):
+        """Test that editing a purchased item moves its contribution between categories."""
+        self.client.post(reverse('groceryitem-mark-purchased', kwargs={'pk': self.milk.pk}), {'is_purchased': True})
+        self.client.patch(
+            reverse('groceryitem-detail', kwargs={'pk': self.milk.pk}),
+            {'category': 'beverages', 'quantity': '3'},
+            format='json'
+        )
+
+        self.assertEqual(self.rollup_totals(), {
+            'dairy': (0, Decimal('0'), self.user.id),
+            'beverages': (1, Decimal('3'), self.user.id),
+        })
+
+    def test_adjusting_purchased_quantity_moves_rollups(self):
+        """Test that adjusting a purchased item's quantity is reflected and reversed exactly."""
+        toggle_url = reverse('groceryitem-toggle-purchased', kwargs={'pk': self.milk.pk})
+        self.client.post(toggle_url)
+        response = self.client.post(
+            reverse('groceryitem-adjust-quantity', kwargs={'pk': self.milk.pk}), {'delta': '3'}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.rollup_totals(), {'dairy': (1, Decimal('5'), self.user.id)})
+        self.assertEqual(PurchaseEvent.objects.filter(item_id=self.milk.pk).count(), 1)
+
+        self.client.post(toggle_url)
+        self.assertEqual(self.rollup_totals(), {'dairy': (0, Decimal('0'), self.user.id)})
+        self.assertEqual(TopItemRollup.objects.get(group=self.group).quantity, 0)
+        analytics = self.client.get(reverse('grocerylist-analytics', kwargs={'pk': self.grocery_list.pk}))
+        self.assertEqual(analytics.data['totals']['quantity'], '0.00')
+
+    def test_update_serializer_reads_stored_state_under_lock(self):
+        """Test that editing a stale copy of a purchased item subtracts what was actually counted."""
+        self.client.post(reverse('groceryitem-toggle-purchased', kwargs={'pk': self.milk.pk}))
+        stale = GroceryItem.objects.select_related('grocery_list').get(pk=self.milk.pk)
+        self.client.post(
+            reverse('groceryitem-adjust-quantity', kwargs={'pk': self.milk.pk}), {'delta': '3'}, format='json'
+        )
+
+        request = APIRequestFactory().patch('/')
+        request.user = self.user
+        serializer = GroceryItemUpdateSerializer(
+            stale, data={'category': 'beverages'}, partial=True, context={'request': request}
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        self.assertEqual(self.rollup_totals(), {
+            'dairy': (0, Decimal('0'), self.user.id),
+            'beverages': (1, Decimal('5'), self.user.id),
+        })
+
+    def test_bulk_mark_counts_only_unpurchased_items(self):
+        """Test that bulk marking skips items that were already purchased."""
+        self.client.post(reverse('groceryitem-toggle-purchased', kwargs={'pk': self.milk.pk}))
+        milk_purchased_at = GroceryItem.objects.get(pk=self.milk.pk).purchased_at
+
+        response = self.client.post(
+            reverse('groceryitem-bulk-mark-purchased'),
+            {'item_ids': [self.milk.id, self.bread.id]},
+            format='json'
+        )
+
+        self.assertEqual(response.data['updated_count'], 1)
+        self.assertEqual(GroceryItem.objects.get(pk=self.milk.pk).purchased_at, milk_purchased_at)
+        self.assertEqual(self.rollup_totals(), {
+            'dairy': (1, Decimal('2'), self.user.id),
+            'bakery': (1, Decimal('1'), self.user.id),
+        })
+
+    def test_analytics_reads_rollups(self):
+        """Test the analytics payload and that it never touches grocery_items."""
+        self.client.post(
+            reverse('groceryitem-bulk-mark-purchased'),
+            {'item_ids': [self.milk.id, self.bread.id]},
+            format='json'
+        )
+        url = reverse('grocerylist-analytics', kwargs={'pk': self.grocery_list.pk})
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'weeks': 4})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(any('grocery_items' in query['sql'] for query in queries.captured_queries))
+        self.assertEqual(response.data['totals']['item_count'], 2)
+        self.assertEqual(response.data['totals']['quantity'], '3.00')
+        self.assertEqual(len(response.data['weeks']), 1)
+        self.assertEqual([row['category'] for row in response.data['categories']], ['bakery', 'dairy'])
+        self.assertEqual(response.data['members'][0]['username'], 'testuser')
+        self.assertEqual({item['name'] for item in response.data['top_items']}, {'Milk', 'Bread'})
+
+    def test_rebuild_rollups_matches_incremental_totals(self):
+        """Test that rebuild_rollups reproduces the incrementally maintained rollups."""
+        self.client.post(reverse('groceryitem-toggle-purchased', kwargs={'pk': self.milk.pk}))
+        self.client.post(reverse('groceryitem-toggle-purchased', kwargs={'pk': self.bread.pk}))
+        incremental = self.rollup_totals()
+
+        PurchaseRollup.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_rollups', stdout=out)
+
+        self.assertIn('Rebuilt rollups from 2 purchased items.', out.getvalue())
+        self.assertEqual(self.rollup_totals(), incremental)
+
+
+class RepeatPurchasePredictionTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.group = UserGroup.objects.create(name='Test Family', created_by=self.user)
+        GroupMembership.objects.create(user=self.user, group=self.group)
+        self.grocery_list = self.group.grocery_list
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('grocerylist-suggestions', kwargs={'pk': self.grocery_list.pk})
+
+    def log(self, name, days_ago):
+        return PurchaseEvent.objects.create(
+            group=self.group,
+            item_id=0,
+            normalized_name=name.lower(),
+            name=name,
+            category='dairy',
+            purchased_at=timezone.now() - timedelta(days=days_ago)
+        )
+
+    def compute(self, *args):
+        out = StringIO()
+        call_command('compute_purchase_predictions', *args, stdout=out)
+        return out.getvalue()
+
+    def test_purchases_are_logged_and_undone(self):
+        """Test that purchasing logs an event and un-purchasing removes it."""
+        item = GroceryItem.objects.create(grocery_list=self.grocery_list, name='Milk', added_by=self.user)
+        url = reverse('groceryitem-toggle-purchased', kwargs={'pk': item.pk})
+
+        self.client.post(url)
+        self.assertEqual(list(PurchaseEvent.objects.values_list('item_id', 'normalized_name')), [(item.id, 'milk')])
+
+        self.client.post(url)
+        self.assertFalse(PurchaseEvent.objects.exists())
+
+    def test_prediction_from_intervals(self):
+        """Test that the mean interval predicts the next purchase and same-trip repeats are ignored."""
+        for days_ago in (20, 13, 13, 6):
+            self.log('Milk', days_ago)
+        self.log('Cheese', 3)
+
+        self.assertIn('Updated 1 predictions from 2 items.', self.compute())
+
+        prediction = ItemPrediction.objects.get(group=self.group)
+        self.assertEqual(prediction.normalized_name, 'milk')
+        self.assertEqual(prediction.purchase_count, 4)
+        self.assertAlmostEqual(prediction.mean_interval_days, 7, places=3)
+        self.assertAlmostEqual(prediction.interval_std_days, 0, places=3)
+        self.assertEqual(prediction.next_due_at, prediction.last_purchased_at + timedelta(days=prediction.mean_interval_days))
+
+    def test_runs_are_incremental(self):
+        """Test that later runs only revisit items with new or undone purchases."""
+        for days_ago in (20, 13, 6):
+            self.log('Milk', days_ago)
+            self.log('Eggs', days_ago)
+        self.compute()
+
+        self.assertIn('Updated 0 predictions from 0 items.', self.compute('--overlap', '0'))
+
+        self.log('Eggs', 1)
+        self.assertIn('Updated 1 predictions from 1 items.', self.compute('--overlap', '0'))
+
+        ItemPrediction.objects.filter(normalized_name='milk').update(stale=True)
+        PurchaseEvent.objects.filter(normalized_name='milk').first().delete()
+        self.compute('--overlap', '0')
+        self.assertFalse(ItemPrediction.objects.filter(normalized_name='milk').exists())
+
+    def test_late_commits_are_picked_up(self):
+        """Test that an event committed after a run, below its watermark, is still counted."""
+        for days_ago in (20, 13):
+            self.log('Milk', days_ago)
+        late = self.log('Milk', 6)
+        late_id = late.id
+        late.delete()
+        self.log('Bread', 1)
+        self.compute()
+        self.assertFalse(ItemPrediction.objects.filter(normalized_name='milk').exists())
+
+        # The lower id commits once the run has read past it.
+        late.id = late_id
+        late.save(force_insert=True)
+        self.assertIn('Updated 1 predictions', self.compute())
+        self.assertEqual(ItemPrediction.objects.get(normalized_name='milk').purchase_count, 3)
+
+    def test_suggestions_endpoint(self):
+        """Test that due items are suggested unless they are already on the list."""
+        for days_ago in (20, 13, 6):
+            self.log('Milk', days_ago)
+        for days_ago in (13, 7, 1):
+            self.log('Eggs', days_ago)
+        self.compute()
+
+        # The list lookup, the membership check and the predictions read.
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['name'] for item in response.data], ['Milk'])
+
+        GroceryItem.objects.create(grocery_list=self.grocery_list, name='milk', added_by=self.user)
+        response = self.client.get(self.url)
+        self.assertEqual(response.data, [])
+
+    def test_suggestions_match_name_variants_on_the_list(self):
+        """Test that an item on the list under a spacing or case variant hides its suggestion."""
+        for days_ago in (20, 13, 6):
+            self.log('Olive oil', days_ago)
+        self.compute()
+        self.assertEqual([item['name'] for item in self.client.get(self.url).data], ['Olive oil'])
+
+        GroceryItem.objects.create(grocery_list=self.grocery_list, name=' Olive  OIL', added_by=self.user)
+        response = self.client.get(self.url)
+        self.assertEqual(response.data, [])
+
+
+class TokenBucketThrottleTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.other_user = User.objects.create_user(
+            username='otheruser',
+            email='other@example.com',
+            password='otherpass123'
+        )
+        self.group = UserGroup.objects.create(name='Test Family', created_by=self.user)
+        GroupMembership.objects.create(user=self.user, group=self.group)
+        GroupMembership.objects.create(user=self.other_user, group=self.group)
+        self.grocery_list = self.group.grocery_list
+        self.item = GroceryItem.objects.create(grocery_list=self.grocery_list, name='Milk', added_by=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        store = mock.patch('grocery_manager.throttling.get_store', return_value=LocalBucketStore())
+        store.start()
+        self.addCleanup(store.stop)
+
+    def set_rates(self, **rates):
+        patcher = mock.patch.object(BucketThrottle, 'THROTTLE_RATES', rates)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assert_bucket(self, store):
+        # Three tokens refilling one per second.
+        self.assertEqual([store.consume('k', 100.0, 1.0, 3) for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(store.consume('k', 100.0, 1.0, 3), 1.0, places=2)
+        self.assertEqual(store.consume('k', 101.0, 1.0, 3), 0)
+        self.assertGreater(store.consume('k', 101.0, 1.0, 3), 0)
+        self.assertEqual(store.consume('other', 101.0, 1.0, 3), 0)
+
+    def test_local_store_token_bucket(self):
+        """Test burst, rejection and refill with the in-memory store."""
+        self.assert_bucket(LocalBucketStore())
+
+    def test_cache_store_token_bucket(self):
+        """Test burst, rejection and refill with the shared cache store."""
+        store = CacheBucketStore()
+        store.cache.clear()
+        self.assert_bucket(store)
+
+    def test_action_throttle(self):
+        """Test that an action with its own rate is limited per user."""
+        self.set_rates(**{'action.toggle_purchased': '2/min'})
+        url = reverse('groceryitem-toggle-purchased', kwargs={'pk': self.item.pk})
+
+        codes = [self.client.post(url).status_code for _ in range(3)]
+
+        self.assertEqual(codes, [200, 200, 429])
+        self.client.force_authenticate(user=self.other_user)
+        self.assertEqual(self.client.post(url).status_code, status.HTTP_200_OK)
+
+    def test_group_throttle_is_shared_by_members(self):
+        """Test that the group bucket counts writes from every member."""
+        self.set_rates(group='2/min')
+        url = reverse('groceryitem-detail', kwargs={'pk': self.item.pk})
+
+        self.assertEqual(self.client.patch(url, {'notes': 'a'}, format='json').status_code, 200)
+        self.client.force_authenticate(user=self.other_user)
+        self.assertEqual(self.client.patch(url, {'notes': 'b'}, format='json').status_code, 200)
+        response = self.client.patch(url, {'notes': 'c'}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+        # Reads are not counted against the group.
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+    def test_user_throttle_covers_listing(self):
+        """Test that the per-user bucket applies to plain list endpoints."""
+        self.set_rates(user='1/min')
+        url = reverse('user-list')
+
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+
+class IdempotencyKeyTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.group = UserGroup.objects.create(name='Test Family', created_by=self.user)
+        GroupMembership.objects.create(user=self.user, group=self.group)
+        self.grocery_list = self.group.grocery_list
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.create_url = reverse('groceryitem-list')
+
+    def test_create_retry_is_replayed(self):
+        """Test that retrying a create with the same key returns the original item."""
+        payload = {'grocery_list_id': self.grocery_list.id, 'name': 'Milk'}
+        first = self.client.post(self.create_url, payload, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+        retry = self.client.post(self.create_url, payload, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.data, json.loads(json.dumps(first.data)))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(GroceryItem.objects.count(), 1)
+
+    def test_retry_costs_one_lookup(self):
+        """Test that a replay doesn't run the mutation again."""
+        payload = {'grocery_list_id': self.grocery_list.id, 'name': 'Milk'}
+        self.client.post(self.create_url, payload, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(self.create_url, payload, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(len(queries), 1)
+
+    def test_key_reused_for_different_request(self):
+        """Test that reusing a key with another payload is rejected."""
+        self.client.post(
+            self.create_url, {'grocery_list_id': self.grocery_list.id, 'name': 'Milk'},
+            format='json', HTTP_IDEMPOTENCY_KEY='abc'
+        )
+        response = self.client.post(
+            self.create_url, {'grocery_list_id': self.grocery_list.id, 'name': 'Bread'},
+            format='json', HTTP_IDEMPOTENCY_KEY='abc'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(GroceryItem.objects.count(), 1)
+
+    def test_bulk_delete_retry_reports_original_count(self):
+        """Test that a retried bulk delete reports what the first attempt deleted."""
+        items = [GroceryItem.objects.create(grocery_list=self.grocery_list, name=name) for name in ('A', 'B')]
+        url = reverse('groceryitem-bulk-delete')
+        payload = {'item_ids': [item.id for item in items]}
+
+        self.client.post(url, payload, format='json', HTTP_IDEMPOTENCY_KEY='del-1')
+        retry = self.client.post(url, payload, format='json', HTTP_IDEMPOTENCY_KEY='del-1')
+
+        self.assertEqual(retry.data['deleted_count'], 2)
+
+    def test_request_in_progress_conflicts(self):
+        """Test that a retry while the original is still running gets 409."""
+        IdempotencyRecord.objects.create(
+            user=self.user, key='abc', fingerprint='f', expires_at=timezone.now() + timedelta(hours=1)
+        )
+        with mock.patch('apps.grocery.idempotency.request_fingerprint', return_value='f'):
+            response = self.client.post(
+                self.create_url, {'grocery_list_id': self.grocery_list.id, 'name': 'Milk'},
+                format='json', HTTP_IDEMPOTENCY_KEY='abc'
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(GroceryItem.objects.exists())
+
+    def test_expired_keys_are_reused_and_purged(self):
+        """Test that expired keys no longer replay and are swept by the purge command."""
+        payload = {'grocery_list_id': self.grocery_list.id, 'name': 'Milk'}
+        self.client.post(self.create_url, payload, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+        IdempotencyRecord.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        response = self.client.post(self.create_url, payload, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(GroceryItem.objects.count(), 2)
+
+        IdempotencyRecord.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        out = StringIO()
+        call_command('purge_idempotency_records', stdout=out)
+        self.assertIn('Purged 1 idempotency records.', out.getvalue())
+
+
+class CompressionMiddlewareTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.group = UserGroup.objects.create(name='Test Family', created_by=self.user)
+        GroupMembership.objects.create(user=self.user, group=self.group)
+        self.grocery_list = self.group.grocery_list
+        GroceryItem.objects.bulk_create([
+            GroceryItem(grocery_list=self.grocery_list, name=f'Item number {index}', added_by=self.user)
+            for index in range(40)
+        ])
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('grocerylist-by-group', kwargs={'group_id': self.group.id})
+
+    def test_large_response_is_gzipped(self):
+        """Test that a large payload is compressed and decodes to the same JSON."""
+        plain = self.client.get(self.url)
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertLess(len(response.content), len(plain.content))
+        self.assertEqual(json.loads(gzip.decompress(response.content)), json.loads(plain.content))
+
+    def test_small_response_is_not_compressed(self):
+        """Test that responses under the size threshold go out as they are."""
+        item = GroceryItem.objects.first()
+        response = self.client.get(
+            reverse('groceryitem-detail', kwargs={'pk': item.pk}),
+            HTTP_ACCEPT_ENCODING='gzip'
+        )
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_weakened_etag_still_revalidates(self):
+        """Test that the weak ETag of a compressed response answers If-None-Match with 304."""
+        etag = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_streaming_export_is_compressed(self):
+        """Test that the streamed export is compressed incrementally."""
+        url = reverse('grocerylist-export', kwargs={'pk': self.grocery_list.pk})
+        response = self.client.get(url, {'file_format': 'ndjson'}, HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertFalse(response.has_header('Content-Length'))
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(len(lines), 40)
+
+    def test_negotiation(self):
+        """Test that the best installed encoding the client accepts is chosen."""
+        with mock.patch.dict(compression.INSTALLED, {'br': True, 'zstd': False}):
+            self.assertEqual(compression.negotiate('gzip, br', ['zstd', 'br', 'gzip']).name, 'br')
+            self.assertEqual(compression.negotiate('gzip, br;q=0', ['zstd', 'br', 'gzip']).name, 'gzip')
+            self.assertEqual(compression.negotiate('zstd', ['zstd', 'br', 'gzip']), None)
+            self.assertEqual(compression.negotiate('identity', ['zstd', 'br', 'gzip']), None)
+
+    @unittest.skipUnless(compression.zstandard and compression.brotli, 'brotli and zstandard are not installed')
+    def test_brotli_and_zstd_streams(self):
+        """Test that the optional codecs round-trip whole and streamed payloads."""
+        chunks = [f'{{"line": {index}}}\n'.encode() for index in range(100)]
+        body = b''.join(chunks)
+
+        brotli_codec, zstd_codec = compression.CODECS['br'], compression.CODECS['zstd']
+        self.assertEqual(compression.brotli.decompress(brotli_codec.compress(body)), body)
+        self.assertEqual(compression.brotli.decompress(b''.join(brotli_codec.compress_stream(iter(chunks)))), body)
+        reader = compression.zstandard.ZstdDecompressor()
+        self.assertEqual(reader.decompressobj().decompress(zstd_codec.compress(body)), body)
+        self.assertEqual(reader.decompressobj().decompress(b''.join(zstd_codec.compress_stream(iter(chunks)))), body)
+
+
+class SlowQueryLogTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.group = UserGroup.objects.create(name='Test Family', created_by=self.user)
+        GroupMembership.objects.create(user=self.user, group=self.group)
+        self.grocery_list = self.group.grocery_list
+        GroceryItem.objects.create(grocery_list=self.grocery_list, name='Milk', added_by=self.user)
+        handle, self.path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+
+    def test_fingerprint_ignores_values(self):
+        """Test that queries differing only in literals and IN-list length share a fingerprint."""
+        first = querylog.normalize_sql("SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'x' LIMIT 21")
+        second = querylog.normalize_sql("SELECT *\n FROM t WHERE id IN (%s) AND name = 'it''s' LIMIT 5")
+
+        self.assertEqual(first, 'SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?')
+        self.assertEqual(querylog.fingerprint(first), querylog.fingerprint(second))
+
+    def test_middleware_logs_queries_with_origin_and_plan(self):
+        """Test that slow queries are stored with their view, fingerprint and a sampled plan."""
+        with override_settings(
+            SLOW_QUERY_LOG_ENABLED=True,
+            SLOW_QUERY_THRESHOLD_MS=0,
+            SLOW_QUERY_EXPLAIN_SAMPLE_RATE=1,
+            SLOW_QUERY_LOG_PATH=self.path
+        ):
+            client = APIClient()
+            client.force_authenticate(user=self.user)
+            with self.assertLogs('grocery_manager.querylog', 'WARNING'):
+                response = client.get(reverse('groceryitem-list'), {'search': 'mil'})
+
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            entries = querylog.SlowQueryStore().summary()
+            items_query = next(entry for entry in entries if 'FROM "grocery_items"' in entry['sql'])
+            self.assertEqual(items_query['origins'], 'GET groceryitem-list')
+            self.assertTrue(items_query['explain'])
+
+            out = StringIO()
+            call_command('slow_queries', '--explain', stdout=out)
+            self.assertIn(items_query['fingerprint'], out.getvalue())
+
+    def test_middleware_is_off_by_default(self):
+        """Test that nothing is logged unless the log is enabled."""
+        with override_settings(SLOW_QUERY_LOG_PATH=self.path):
+            client = APIClient()
+            client.force_authenticate(user=self.user)
+            client.get(reverse('groceryitem-list'))
+            self.assertEqual(querylog.SlowQueryStore().summary(), [])
+
+    def test_store_is_bounded(self):
+        """Test that the store trims itself back to its row cap."""
+        store = querylog.SlowQueryStore(path=self.path, max_rows=5)
+        with mock.patch.object(querylog, 'TRIM_EVERY', 1):
+            for index in range(12):
+                store.add(f'f{index}', 'SELECT ?', 1.0, 'GET test', 'default')
+
+        self.assertEqual(len(store.summary(limit=100)), 5)
+
+
+
+class TransactionalOutboxTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.other = User.objects.create_user(username='other', email='other@example.com', password='testpass123')
+        self.group = UserGroup.objects.create(name='Test Family', created_by=self.user)
+        GroupMembership.objects.create(user=self.user, group=self.group)
+        self.grocery_list = self.group.grocery_list
+        self.item = GroceryItem.objects.create(grocery_list=self.grocery_list, name='Milk', added_by=self.user)
+        self.client.force_authenticate(user=self.user)
+        self.sent = []
+
+    def events(self):
+        return list(OutboxEvent.objects.order_by('id').values_list('event_type', flat=True))
+
+    def emit(self, count, group_id=None):
+        for index in range(count):
+            outbox.record_event('item.updated', group_id or self.group.id, self.grocery_list.id, payload={'n': index})
+
+    def test_mutations_record_events(self):
+        """Test that item and membership changes each write their outbox events."""
+        self.client.post(reverse('groceryitem-list'), {'grocery_list_id': self.grocery_list.id, 'name': 'Eggs'})
+        self.client.post(reverse('groceryitem-toggle-purchased', args=[self.item.id]))
+        self.client.post(reverse('group-add-member', args=[self.group.id]), {'user_id': self.other.id})
+        self.client.post(reverse('groceryitem-bulk-delete'), {'item_ids': [self.item.id]}, format='json')
+
+        self.assertEqual(self.events(), ['item.created', 'item.purchased', 'member.added', 'item.deleted'])
+        created = OutboxEvent.objects.order_by('id').first()
+        self.assertEqual(created.group_id, self.group.id)
+        self.assertEqual(created.grocery_list_id, self.grocery_list.id)
+        self.assertEqual(created.actor_id, self.user.id)
+        self.assertEqual(created.payload['name'], 'Eggs')
+
+    def test_rejected_mutation_records_nothing(self):
+        """Test that an update refused by its precondition leaves no event behind."""
+        response = self.client.patch(
+            reverse('groceryitem-detail', args=[self.item.id]),
+            {'name': 'Oat milk'},
+            HTTP_IF_MATCH='"999"'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(self.events(), [])
+
+    def test_dispatch_delivers_in_order(self):
+        """Test that the dispatcher drains the outbox in batches, oldest first."""
+        self.emit(5)
+        sink = outbox.CallableSink(self.sent.extend)
+
+        self.assertEqual(outbox.dispatch_batch(sink, batch_size=3), (3, 0))
+        self.assertEqual(outbox.dispatch_batch(sink, batch_size=3), (2, 0))
+        self.assertEqual([message['payload']['n'] for message in self.sent], [0, 1, 2, 3, 4])
+        self.assertFalse(OutboxEvent.objects.exclude(status=OutboxEvent.DELIVERED).exists())
+
+    def test_failed_delivery_holds_back_later_events_of_the_group(self):
+        """Test that a failed event is retried later and blocks only its own group."""
+        other_group = UserGroup.objects.create(name='Other', created_by=self.user)
+        self.emit(1)
+        failing = outbox.CallableSink(mock.Mock(side_effect=OSError('down')))
+
+        with self.assertLogs('apps.grocery.outbox', 'WARNING'):
+            self.assertEqual(outbox.dispatch_batch(failing), (0, 1))
+        first = OutboxEvent.objects.get()
+        self.assertEqual(first.attempts, 1)
+        self.assertGreater(first.next_attempt_at, timezone.now())
+        self.assertIn('down', first.last_error)
+
+        self.emit(1)
+        self.emit(1, group_id=other_group.id)
+        sink = outbox.CallableSink(self.sent.extend)
+        self.assertEqual(outbox.dispatch_batch(sink), (1, 0))
+        self.assertEqual([message['group_id'] for message in self.sent], [other_group.id])
+
+        OutboxEvent.objects.filter(pk=first.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(outbox.dispatch_batch(sink), (2, 0))
+        self.assertEqual([message['payload']['n'] for message in self.sent[1:]], [0, 0])
+        self.assertEqual(self.sent[1]['id'], first.id)
+
+    def test_events_are_numbered_per_group(self):
+        """Test that each group numbers its events from one and messages carry the number."""
+        other_group = UserGroup.objects.create(name='Other', created_by=self.user)
+        self.emit(2)
+        self.emit(1, group_id=other_group.id)
+        self.emit(1)
+
+        numbered = OutboxEvent.objects.order_by('id').values_list('group_id', 'sequence')
+        self.assertEqual(list(numbered), [(self.group.id, 1), (self.group.id, 2), (other_group.id, 1), (self.group.id, 3)])
+        outbox.dispatch_batch(outbox.CallableSink(self.sent.extend))
+        self.assertEqual([message['sequence'] for message in self.sent], [1, 2, 1, 3])
+
+    def test_dispatch_follows_sequence_and_stops_at_gap(self):
+        """Test that a group's events go out in sequence order, up to the first one missing from the batch."""
+        self.emit(3)
+        first, second, third = OutboxEvent.objects.order_by('id')
+        OutboxEvent.objects.filter(pk=first.pk).update(sequence=0)
+        OutboxEvent.objects.filter(pk=second.pk).update(sequence=first.sequence)
+        OutboxEvent.objects.filter(pk=first.pk).update(sequence=second.sequence)
+        sink = outbox.CallableSink(self.sent.extend)
+
+        self.assertEqual(outbox.dispatch_batch(sink, batch_size=1), (0, 0))
+        self.assertEqual(outbox.dispatch_batch(sink, batch_size=2), (1, 0))
+        self.assertEqual(outbox.dispatch_batch(sink), (2, 0))
+        self.assertEqual([message['id'] for message in self.sent], [second.id, first.id, third.id])
+
+    def test_event_fails_after_max_attempts(self):
+        """Test that an event stops being retried, and stops blocking, after MAX_ATTEMPTS."""
+        self.emit(2)
+        OutboxEvent.objects.filter(id=OutboxEvent.objects.order_by('id')[0].id).update(
+            attempts=outbox.MAX_ATTEMPTS - 1
+        )
+        failing = outbox.CallableSink(mock.Mock(side_effect=OSError('down')))
+        with self.assertLogs('apps.grocery.outbox', 'WARNING'):
+            outbox.dispatch_batch(failing, batch_size=1)
+
+        first, second = OutboxEvent.objects.order_by('id')
+        self.assertEqual(first.status, OutboxEvent.FAILED)
+        self.assertEqual(outbox.dispatch_batch(outbox.CallableSink(self.sent.extend)), (1, 0))
+        self.assertEqual(self.sent[0]['id'], second.id)
+
+    def test_file_sink_writes_json_lines(self):
+        """Test that the file sink appends one JSON document per event."""
+        self.client.post(reverse('groceryitem-toggle-purchased', args=[self.item.id]))
+        handle, path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+
+        with override_settings(OUTBOX_SINK={'BACKEND': 'apps.grocery.outbox.FileSink', 'OPTIONS': {'path': path}}):
+            call_command('dispatch_outbox', stdout=StringIO())
+
+        with open(path) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual([line['type'] for line in lines], ['item.purchased'])
+        self.assertEqual(lines[0]['payload']['id'], self.item.id)
+
+    def test_http_sink_posts_to_stand_in(self):
+        """Test that the HTTP sink delivers batches to the local stand-in receiver."""
+        server = ThreadingHTTPServer(('127.0.0.1', 0), outbox.StandInHandler)
+        server.on_events = self.sent.extend
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.emit(2)
+
+        sink = outbox.HttpSink(f'http://127.0.0.1:{server.server_port}/', timeout=5)
+        self.assertEqual(outbox.dispatch_batch(sink), (2, 0))
+        self.assertEqual([message['payload']['n'] for message in self.sent], [0, 1])
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Needs a database that allows concurrent writers.')
+class OutboxOrderingTests(TransactionTestCase):
+
+    def test_group_numbers_wait_for_commit(self):
+        """Test that a writer numbering events waits until an earlier writer to the group commits."""
+        user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass123')
+        group = UserGroup.objects.create(name='Test Family', created_by=user)
+
+        def write():
+            try:
+                with transaction.atomic():
+                    outbox.record_event('item.updated', group.id, payload={'n': 1})
+            finally:
+                connections.close_all()
+
+        with transaction.atomic():
+            outbox.record_event('item.updated', group.id, payload={'n': 0})
+            writer = threading.Thread(target=write)
+            writer.start()
+            writer.join(0.5)
+            self.assertTrue(writer.is_alive())
+        writer.join(10)
+
+        events = OutboxEvent.objects.order_by('id')
+        self.assertEqual([(event.payload['n'], event.sequence) for event in events], [(0, 1), (1, 2)])
+
+
+class StapleTemplateTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.group = UserGroup.objects.create(name='Test Family', created_by=self.user)
+        GroupMembership.objects.create(user=self.user, group=self.group)
+        self.grocery_list = self.group.grocery_list
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(reverse('stapletemplate-list'), {
+            'group': self.group.id,
+            'name': 'Weekly shop',
+            'items': [
+                {'name': 'Milk', 'quantity': '2', 'category': 'dairy'},
+                {'name': 'Bread', 'category': 'bakery'},
+                {'name': 'Eggs', 'category': 'dairy', 'notes': 'Free range'},
+                {'name': 'Coffee', 'category': 'pantry'},
+            ]
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.template = StapleTemplate.objects.get(id=response.data['id'])
+
+    def apply(self, template_id=None):
+        return self.client.post(
+            reverse('grocerylist-apply-template', args=[self.grocery_list.id]),
+            {'template_id': template_id or self.template.id}
+        )
+
+    def test_apply_skips_items_already_active(self):
+        """Test that applying a template adds only the staples not already active on the list."""
+        GroceryItem.objects.create(grocery_list=self.grocery_list, name='MILK', added_by=self.user)
+        GroceryItem.objects.create(
+            grocery_list=self.grocery_list, name='Bread', is_purchased=True, added_by=self.user
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.apply()
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created_count'], 3)
+        self.assertEqual(response.data['skipped_count'], 1)
+        self.assertEqual([item['name'] for item in response.data['items']], ['Bread', 'Eggs', 'Coffee'])
+        eggs = GroceryItem.objects.get(name='Eggs')
+        self.assertEqual((eggs.category, eggs.notes, eggs.added_by), ('dairy', 'Free range', self.user))
+        inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "grocery_items"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(OutboxEvent.objects.filter(event_type='item.created').count(), 3)
+
+    def test_apply_twice_adds_nothing(self):
+        """Test that reapplying a template skips everything it already added."""
+        self.apply()
+        response = self.apply()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['created_count'], 0)
+        self.assertEqual(self.grocery_list.items.count(), 4)
+
+    def test_apply_without_insert_returning(self):
+        """Test the bulk_create fallback for backends that cannot return inserted rows."""
+        GroceryItem.objects.create(grocery_list=self.grocery_list, name='Coffee', added_by=self.user)
+
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            response = self.apply()
+
+        self.assertEqual(response.data['created_count'], 3)
+        self.assertEqual([item['name'] for item in response.data['items']], ['Milk', 'Bread', 'Eggs'])
+
+    def test_apply_matches_normalized_names_and_sets_merge_keys(self):
+        """Test that staples match active items by normalized name and new items can be merged into."""
+        response = self.client.post(reverse('stapletemplate-list'), {
+            'group': self.group.id,
+            'name': 'Deli',
+            'items': [{'name': 'Olive oil'}, {'name': 'Éclairs'}, {'name': 'Feta  Cheese'}]
+        }, format='json')
+        GroceryItem.objects.create(grocery_list=self.grocery_list, name='Olive  OIL', added_by=self.user)
+        GroceryItem.objects.create(grocery_list=self.grocery_list, name='ÉCLAIRS', added_by=self.user)
+
+        applied = self.apply(response.data['id'])
+        self.assertEqual([item['name'] for item in applied.data['items']], ['Feta  Cheese'])
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            applied = self.apply(response.data['id'])
+        self.assertEqual(applied.data['created_count'], 0)
+        self.assertEqual(self.grocery_list.items.get(name='Feta  Cheese').merge_key, 'feta cheese')
+
+        merged = self.client.post(
+            reverse('groceryitem-list'),
+            {'grocery_list_id': self.grocery_list.id, 'name': 'feta cheese', 'merge': True}
+        )
+        self.assertEqual(merged.status_code, status.HTTP_200_OK)
+
+    def test_template_of_another_group_is_not_found(self):
+        """Test that a list cannot be filled from another group's template."""
+        other_group = UserGroup.objects.create(name='Other', created_by=self.user)
+        GroupMembership.objects.create(user=self.user, group=other_group)
+        other = StapleTemplate.objects.create(group=other_group, name='Party')
+
+        self.assertEqual(self.apply(other.id).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_template_validation(self):
+        """Test that templates reject duplicate items and groups the user is not in."""
+        stranger = User.objects.create_user(username='stranger', email='s@example.com', password='testpass123')
+        foreign = UserGroup.objects.create(name='Foreign', created_by=stranger)
+        url = reverse('stapletemplate-list')
+
+        duplicate = self.client.post(url, {
+            'group': self.group.id,
+            'name': 'Dupes',
+            'items': [{'name': 'Milk'}, {'name': ' milk '}]
+        }, format='json')
+        not_member = self.client.post(url, {'group': foreign.id, 'name': 'Theirs', 'items': []}, format='json')
+
+        self.assertEqual(duplicate.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('items', duplicate.data)
+        self.assertEqual(not_member.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('group', not_member.data)
+
+    def test_update_replaces_items(self):
+        """Test that updating a template's items replaces them."""
+        response = self.client.patch(
+            reverse('stapletemplate-detail', args=[self.template.id]),
+            {'items': [{'name': 'Tea', 'category': 'beverages'}]},
+            format='json'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['name'] for item in response.data['items']], ['Tea'])
+        self.assertEqual(self.template.items.get().normalized_name, 'tea')
+
+
+class WarmUpTests(TestCase):
+    databases = '__all__'
+
+    def test_warm_up_command_runs_every_step(self):
+        """Test that warm_up reports each step, including opening connections."""
+        out = StringIO()
+        call_command('warm_up', stdout=out)
+
+        output = out.getvalue()
+        for step in ['urls', 'models', 'serializers', 'api settings', 'translations', 'connections']:
+            self.assertIn(step, output)
+        self.assertIn('Warmed up in', output)
+
+    def test_serializers_are_built(self):
+        """Test that every project serializer that can be built without arguments is."""
+        [(name, count, _)] = warmup.warm_up([('serializers', warmup.build_serializers)])
+        self.assertEqual(name, 'serializers')
+        self.assertGreaterEqual(count, 20)
+
+    def test_parse_import_times(self):
+        """Test parsing python -X importtime output."""
+        output = (
+            'import time: self [us] | cumulative | imported package\n'
+            'import time:       120 |        120 |     _io\n'
+            'import time:      2092 |       3837 |   rest_framework.fields\n'
+            'import time:      5872 |     115653 | grocery_manager.sharding\n'
+        )
+        self.assertEqual(warmup.parse_import_times(output), [
+            ('_io', 120, 120, 2),
+            ('rest_framework.fields', 2092, 3837, 1),
+            ('grocery_manager.sharding', 5872, 115653, 0),
+        ])
+
+
+class StressHarnessTests(TestCase):
+
+    def test_percentiles(self):
+        """Test nearest-rank latency percentiles in milliseconds."""
+        result = stress.percentiles([n / 1000 for n in range(1, 101)])
+        self.assertAlmostEqual(result['p50'], 50)
+        self.assertAlmostEqual(result['p99'], 99)
+        self.assertAlmostEqual(result['max'], 100)
+
+    def test_invariants_catch_lost_updates_and_bad_purchases(self):
+        """Test that changes no reported request made are flagged."""
+        grocery_list, users = stress.create_scratch_list(members=2, items=3)
+        before = stress.snapshot(grocery_list)
+        first, second, third = GroceryItem.objects.filter(grocery_list=grocery_list).order_by('id')
+        samples = [('adjust', 200, 0.01, ('adjusted', first.id, Decimal(1)))]
+        GroceryItem.objects.filter(id=first.id).update(quantity=F('quantity') + 2)
+        GroceryItem.objects.filter(id=second.id).update(is_purchased=True)
+        third.delete()
+
+        violations = stress.check_invariants(grocery_list, before, samples)
+
+        self.assertIn(f'Item {first.id} has quantity 7.00, expected 6.00.', violations)
+        self.assertIn(f'Item {second.id} has inconsistent purchase fields.', violations)
+        self.assertIn('The list has 2 items, expected 3.', violations)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Needs a database that allows concurrent writers.')
+class ConcurrentListStressTests(TransactionTestCase):
+
+    def test_contended_list_stays_consistent(self):
+        """Test that racing toggles, adjustments and deletes from many threads keep the list consistent."""
+        grocery_list, users = stress.create_scratch_list(members=4, items=12)
+        report = stress.run_stress(grocery_list, users, threads=6, operations=25, seed=1)
+
+        self.assertEqual(report['violations'], [])
+        self.assertEqual(report['errors'], 0)
+        self.assertEqual(report['requests'], 150)
+        self.assertIn('p99', report['latency_ms']['all'])
+        self.assertIsNotNone(report['lock_waits'])
+
+    def test_processes(self):
+        """Test running the workers in several processes."""
+        grocery_list, users = stress.create_scratch_list(members=4, items=12)
+        out = StringIO()
+        with mock.patch('apps.grocery.management.commands.stress_list.create_scratch_list') as create:
+            create.return_value = grocery_list, users
+            call_command(
+                'stress_list', '--processes', '2', '--threads', '3', '--operations', '15', stdout=out
+            )
+
+        self.assertIn('90 requests', out.getvalue())
+        self.assertIn('All invariants held.', out.getvalue())
+
+
+class ListActivityFeedTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.other = User.objects.create_user(username='other', email='other@example.com', password='testpass123')
+        self.group = UserGroup.objects.create(name='Test Family', created_by=self.user)
+        GroupMembership.objects.create(user=self.user, group=self.group)
+        self.grocery_list = self.group.grocery_list
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('grocerylist-activity', args=[self.grocery_list.id])
+
+    def test_feed_records_who_did_what(self):
+        """Test that adding, buying and deleting an item show up newest first, after the item is gone."""
+        response = self.client.post(
+            reverse('groceryitem-list'), {'grocery_list_id': self.grocery_list.id, 'name': 'Milk'}, format='json'
+        )
+        item_id = response.data['id']
+        self.client.post(reverse('groceryitem-toggle-purchased', args=[item_id]))
+        self.client.delete(reverse('groceryitem-detail', args=[item_id]))
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['results']
+        self.assertEqual([entry['verb'] for entry in results], ['item.deleted', 'item.purchased', 'item.created'])
+        self.assertTrue(all(entry['item_id'] == item_id and entry['item_name'] == 'Milk' for entry in results))
+        self.assertEqual(results[0]['actor']['username'], 'testuser')
+
+    def test_bulk_actions_insert_activity_once(self):
+        """Test that a bulk delete writes all its activity rows with one INSERT."""
+        items = GroceryItem.objects.bulk_create([
+            GroceryItem(grocery_list=self.grocery_list, name=f'Item {index}', added_by=self.user)
+            for index in range(4)
+        ])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse('groceryitem-bulk-delete'), {'item_ids': [item.id for item in items]}, format='json'
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        inserts = [query for query in queries.captured_queries if 'INSERT INTO "grocery_list_activities"' in query['sql']]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(ListActivity.objects.filter(grocery_list=self.grocery_list, verb='item.deleted').count(), 4)
+
+    def test_keyset_pagination_without_items_table(self):
+        """Test that the feed pages by id and never reads the items table."""
+        ListActivity.objects.bulk_create([
+            ListActivity(grocery_list=self.grocery_list, verb='item.created', item_id=index, item_name=f'Item {index}')
+            for index in range(5)
+        ])
+
+        names = []
+        url = f'{self.url}?page_size=2'
+        with CaptureQueriesContext(connection) as queries:
+            while url:
+                response = self.client.get(url)
+                names += [entry['item_name'] for entry in response.data['results']]
+                url = response.data['next']
+
+        self.assertEqual(names, [f'Item {index}' for index in reversed(range(5))])
+        for query in queries.captured_queries:
+            self.assertNotIn('grocery_items', query['sql'])
+            self.assertNotIn('COUNT(', query['sql'])
+
+    def test_non_member_cannot_read_feed(self):
+        """Test that the feed is only visible to the list's group."""
+        self.client.force_authenticate(user=self.other)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,193 @@
+"""
+Streaming import and export of grocery list items as CSV or NDJSON.
+
+Exports are fed by a server-side cursor and imports are parsed line by line
+and inserted in batches, so memory use does not grow with the file size.
+"""
+import codecs
+import csv
+import json
+from datetime import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from .autocomplete import record_item_names
+from .merging import claim_merge_keys
+from .models import GroceryItem
+from .outbox import item_events, record_events
+from .serializers import GroceryItemCreateSerializer
+from grocery_manager.sharding import current_shard
+
+EXPORT_CHUNK_SIZE = 500
+IMPORT_BATCH_SIZE = 500
+MAX_REPORTED_ERRORS = 50
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+EXPORT_COLUMNS = [
+    'id', 'name', 'quantity', 'category', 'notes', 'is_purchased',
+    'purchased_at', 'purchased_by', 'added_by', 'created_at',
+]
+EXPORT_LOOKUPS = [
+    'id', 'name', 'quantity', 'category', 'notes', 'is_purchased',
+    'purchased_at', 'purchased_by__username', 'added_by__username', 'created_at',
+]
+IMPORT_FIELDS = ['name', 'quantity', 'category', 'notes']
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def get_format(value, filename=None):
+    """
+    Resolve the requested file format, falling back to the file extension.
+    """
+    if not value and filename:
+        value = filename.rsplit('.', 1)[-1] if '.' in filename else ''
+        if value in ('jsonl', 'json'):
+            value = 'ndjson'
+    value = (value or 'csv').lower()
+    if value not in CONTENT_TYPES:
+        raise ImportFormatError(f"Unsupported format '{value}'. Use one of: {', '.join(CONTENT_TYPES)}.")
+    return value
+
+
+def export_rows(grocery_list):
+    # Bound to the list's database: the rows are read while the response
+    # streams, after the request's shard has been reset.
+    return (
+        GroceryItem.objects.using(grocery_list._state.db)
+        .filter(grocery_list=grocery_list)
+        .order_by('id')
+        .values_list(*EXPORT_LOOKUPS)
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+
+
+class _Echo:
+    """
+    Pseudo-buffer whose write() hands the formatted line straight back.
+    """
+    def write(self, value):
+        return value
+
+
+def _export_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _chunked(lines):
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) >= EXPORT_CHUNK_SIZE:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def _csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        yield writer.writerow([_export_value(value) for value in row])
+
+
+def _ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_COLUMNS, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def stream_export(grocery_list, file_format):
+    rows = export_rows(grocery_list)
+    lines = _csv_lines(rows) if file_format == 'csv' else _ndjson_lines(rows)
+    return _chunked(lines)
+
+
+def _read_records(upload, file_format):
+    """
+    Yield (line_number, record) pairs; record is None when a line can't be parsed.
+    """
+    lines = codecs.iterdecode(upload, 'utf-8-sig')
+    if file_format == 'csv':
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield line_number, record if isinstance(record, dict) else None
+
+
+def import_upload(grocery_list, upload, file_format, user):
+    """
+    Validate and insert every row of ``upload`` in batches of IMPORT_BATCH_SIZE.
+
+    Invalid rows are skipped and reported; valid rows are committed together.
+    """
+    created_count = 0
+    error_count = 0
+    errors = []
+    batch = []
+    events = []
+
+    def flush():
+        GroceryItem.objects.bulk_create(batch)
+        claim_merge_keys(batch)
+        record_item_names(grocery_list.group_id, [item.name for item in batch])
+        events.extend(item_events('item.created', batch, user))
+        batch.clear()
+
+    with transaction.atomic(using=current_shard()):
+        try:
+            for line_number, record in _read_records(upload, file_format):
+                if record is None:
+                    row_errors = {'detail': ['Could not parse line.']}
+                else:
+                    data = {
+                        field: record[field] for field in IMPORT_FIELDS
+                        if record.get(field) not in (None, '')
+                    }
+                    serializer = GroceryItemCreateSerializer(data=data)
+                    if serializer.is_valid():
+                        batch.append(GroceryItem(
+                            grocery_list=grocery_list,
+                            added_by=user,
+                            **serializer.validated_data
+                        ))
+                        created_count += 1
+                        if len(batch) >= IMPORT_BATCH_SIZE:
+                            flush()
+                        continue
+                    row_errors = serializer.errors
+                error_count += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({'line': line_number, 'errors': row_errors})
+        except (UnicodeDecodeError, csv.Error) as exc:
+            raise ImportFormatError(f'Could not read file: {exc}') from exc
+        if batch:
+            flush()
+        # Recorded last: numbering the events locks the group's sequence.
+        record_events(events)
+
+    return {
+        'detail': f'Imported {created_count} items.',
+        'created_count': created_count,
+        'error_count': error_count,
+        'errors': errors,
+    }
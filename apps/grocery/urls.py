@@ -1,10 +1,11 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import GroceryListViewSet, GroceryItemViewSet
+from .views import GroceryListViewSet, GroceryItemViewSet, StapleTemplateViewSet
 
 router = DefaultRouter()
 router.register(r'lists', GroceryListViewSet, basename='grocerylist')
 router.register(r'items', GroceryItemViewSet, basename='groceryitem')
+router.register(r'templates', StapleTemplateViewSet, basename='stapletemplate')
 
 urlpatterns = [
     path('', include(router.urls)),
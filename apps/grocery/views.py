@@ -1,19 +1,67 @@
-from rest_framework import viewsets, permissions, status
+from decimal import Decimal
+from rest_framework import viewsets, permissions, serializers, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.views import APIView
+from django.db import DataError, transaction
+from django.db.models import Count, F, Prefetch
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from .models import GroceryList, GroceryItem
+from .models import GroceryList, GroceryItem, ListActivity, StapleTemplate
 from .serializers import (
     GroceryListSerializer,
     GroceryListDetailSerializer,
     GroceryItemSerializer,
+    ListActivitySerializer,
+    MyGroceryItemSerializer,
     GroceryItemCreateSerializer,
     GroceryItemUpdateSerializer,
+    BulkItemCreateSerializer,
     MarkPurchasedSerializer,
-    BulkItemIdsSerializer
+    AdjustQuantitySerializer,
+    BulkItemIdsSerializer,
+    ItemNameSuggestionSerializer,
+    AutocompleteQuerySerializer,
+    AnalyticsQuerySerializer,
+    ItemPredictionSerializer,
+    SuggestionsQuerySerializer,
+    StapleTemplateSerializer,
+    ApplyTemplateSerializer,
+    BootstrapGroupSerializer
 )
-from apps.usergroups.models import UserGroup
+from .autocomplete import record_item_names, suggest_item_names
+from .idempotency import idempotent
+from .merging import claim_merge_keys, merge_items
+from .outbox import build_event, item_events, record_event, record_events
+from .predictions import due_items
+from .staples import copy_template
+from .rollups import apply_purchase_facts, group_analytics, lock_purchase_state, purchase_facts, update_rollups
+from .pagination import ActivityCursorPagination, ItemCursorPagination
+from .concurrency import (
+    PreconditionFailed,
+    VersionETagMixin,
+    check_if_match,
+    conditional_response,
+    save_or_fail
+)
+from .transfer import CONTENT_TYPES, ImportFormatError, get_format, import_upload, stream_export
+from apps.usergroups.deletion import schedule_deletion
+from grocery_manager.sharding import (
+    ShardRoutingMixin,
+    ShardedRows,
+    check_groups_writable,
+    current_shard,
+    gather,
+    groups_by_shard,
+    is_sharded,
+    locate,
+    order_rows,
+    shard_for_group
+)
+from grocery_manager.throttling import GroupThrottleMixin
+from apps.usergroups.models import UserGroup, GroupMembership
+from apps.users.serializers import UserSerializer
 
 
 class IsGroupMember(permissions.BasePermission):
@@ -22,34 +70,74 @@ class IsGroupMember(permissions.BasePermission):
             return obj.group.members.filter(id=request.user.id).exists()
         if isinstance(obj, GroceryItem):
             return obj.grocery_list.group.members.filter(id=request.user.id).exists()
+        if isinstance(obj, StapleTemplate):
+            return obj.group.members.filter(id=request.user.id).exists()
         return False
 
 
-class GroceryListViewSet(viewsets.ModelViewSet):
+_quantity_field = GroceryItem._meta.get_field('quantity')
+PURCHASE_FIELDS = ['is_purchased', 'purchased_at', 'purchased_by', 'merge_key']
+MAX_QUANTITY = (
+    Decimal(10) ** (_quantity_field.max_digits - _quantity_field.decimal_places)
+    - Decimal(10) ** -_quantity_field.decimal_places
+)
+
+
+def first_id(values):
+    if isinstance(values, (list, tuple)) and values:
+        return values[0]
+    return None
+
+
+def merge_requested(request):
+    value = request.data.get('merge', request.query_params.get('merge', False))
+    return serializers.BooleanField().run_validation(value)
+
+
+class GroceryListViewSet(ShardRoutingMixin, GroupThrottleMixin, VersionETagMixin, viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated, IsGroupMember]
     
+    def get_shard(self, request):
+        if pk := self.kwargs.get('pk'):
+            return locate(GroceryList, pk)
+        if group_id := self.kwargs.get('group_id'):
+            return shard_for_group(group_id)
+        return None
+    
+    def get_throttle_group_id(self, obj):
+        return obj.group_id
+    
     def get_queryset(self):
         return GroceryList.objects.filter(
-            group__members=self.request.user
-        ).select_related('group').prefetch_related('items')
+            group__members=self.request.user,
+            detached_at__isnull=True
+        ).select_related('group')
     
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return GroceryListDetailSerializer
         return GroceryListSerializer
     
+    def destroy(self, request, *args, **kwargs):
+        job = self.perform_destroy(self.get_object())
+        return Response({'detail': 'Deletion queued.', 'job_id': job.id}, status=status.HTTP_202_ACCEPTED)
+    
+    def perform_destroy(self, instance):
+        check_if_match(self.request, instance)
+        
+        def detach():
+            GroceryList.objects.filter(pk=instance.pk).update(detached_at=timezone.now())
+            record_event('list.deleted', instance.group_id, instance.id, self.request.user)
+        
+        return schedule_deletion(instance, user=self.request.user, detach=detach)
+    
     @action(detail=False, methods=['get'], url_path='by-group/(?P<group_id>[^/.]+)')
     def by_group(self, request, group_id=None):
-        group = get_object_or_404(
-            UserGroup.objects.filter(members=request.user),
-            id=group_id
-        )
-        grocery_list, created = GroceryList.objects.get_or_create(
-            group=group,
-            defaults={'name': f"{group.name}'s Grocery List"}
-        )
+        # Lists are provisioned when the group is created, so this stays a
+        # side-effect-free read.
+        grocery_list = get_object_or_404(self.get_queryset(), group_id=group_id)
         serializer = GroceryListDetailSerializer(grocery_list)
-        return Response(serializer.data)
+        return conditional_response(request, serializer.data)
     
     @action(detail=True, methods=['get'])
     def active_items(self, request, pk=None):
@@ -64,18 +152,124 @@ class GroceryListViewSet(viewsets.ModelViewSet):
         return Response(GroceryItemSerializer(items, many=True).data)
     
     @action(detail=True, methods=['post'])
+    @idempotent
     def clear_purchased(self, request, pk=None):
         grocery_list = self.get_object()
-        deleted_count, _ = grocery_list.items.filter(is_purchased=True).delete()
+        with transaction.atomic(using=current_shard()):
+            # Rows are locked in id order, so overlapping bulk requests can't deadlock.
+            purchased = list(grocery_list.items.filter(is_purchased=True).select_for_update().order_by('pk'))
+            deleted_count, _ = GroceryItem.objects.filter(id__in=[item.id for item in purchased]).delete()
+            record_events(item_events('item.deleted', purchased, request.user))
         return Response({'detail': f'Deleted {deleted_count} purchased items.', 'deleted_count': deleted_count})
+    
+    @action(detail=True, methods=['post'])
+    @idempotent
+    def apply_template(self, request, pk=None):
+        grocery_list = self.get_object()
+        serializer = ApplyTemplateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        template = get_object_or_404(
+            StapleTemplate.objects.annotate(items_count=Count('items')),
+            id=serializer.validated_data['template_id'],
+            group_id=grocery_list.group_id
+        )
+        
+        with transaction.atomic(using=current_shard()):
+            item_ids = copy_template(template, grocery_list, request.user)
+            items = list(
+                GroceryItem.objects.filter(id__in=item_ids).select_related('grocery_list', 'added_by').order_by('id')
+            )
+            record_item_names(grocery_list.group_id, [item.name for item in items])
+            record_events(item_events('item.created', items, request.user))
+        
+        return Response({
+            'detail': f'Added {len(items)} items from {template.name}.',
+            'created_count': len(items),
+            'skipped_count': template.items_count - len(items),
+            'items': GroceryItemSerializer(items, many=True).data
+        }, status=status.HTTP_201_CREATED if items else status.HTTP_200_OK)
+    
+    @action(detail=True, methods=['get'], pagination_class=ActivityCursorPagination)
+    def activity(self, request, pk=None):
+        grocery_list = self.get_object()
+        activities = ListActivity.objects.filter(grocery_list=grocery_list).select_related('actor')
+        page = self.paginate_queryset(activities)
+        return self.get_paginated_response(ListActivitySerializer(page, many=True).data)
+    
+    @action(detail=True, methods=['get'])
+    def analytics(self, request, pk=None):
+        grocery_list = self.get_object()
+        serializer = AnalyticsQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        data = group_analytics(
+            grocery_list.group_id,
+            weeks=serializer.validated_data['weeks'],
+            top_items=serializer.validated_data['top']
+        )
+        return conditional_response(request, data)
+    
+    @action(detail=True, methods=['get'])
+    def suggestions(self, request, pk=None):
+        grocery_list = self.get_object()
+        serializer = SuggestionsQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        items = due_items(grocery_list, **serializer.validated_data)
+        return Response(ItemPredictionSerializer(items, many=True).data)
+    
+    @action(detail=True, methods=['get'])
+    def export(self, request, pk=None):
+        grocery_list = self.get_object()
+        try:
+            file_format = get_format(request.query_params.get('file_format'))
+        except ImportFormatError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        response = StreamingHttpResponse(
+            stream_export(grocery_list, file_format),
+            content_type=CONTENT_TYPES[file_format]
+        )
+        response['Content-Disposition'] = f'attachment; filename="grocery-list-{grocery_list.id}.{file_format}"'
+        return response
+    
+    @action(detail=True, methods=['post'], url_path='import', url_name='import')
+    def import_items(self, request, pk=None):
+        grocery_list = self.get_object()
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'detail': 'file is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            file_format = get_format(request.query_params.get('file_format'), upload.name)
+            result = import_upload(grocery_list, upload, file_format, request.user)
+        except ImportFormatError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result)
 
 
-class GroceryItemViewSet(viewsets.ModelViewSet):
+class GroceryItemViewSet(ShardRoutingMixin, GroupThrottleMixin, VersionETagMixin, viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated, IsGroupMember]
     
+    def get_shard(self, request):
+        # Bulk actions run on the shard of their first item; items of the
+        # user's groups on other shards are left alone, as if not found.
+        data = request.data if hasattr(request.data, 'get') else {}
+        if pk := self.kwargs.get('pk'):
+            return locate(GroceryItem, pk)
+        if item_id := first_id(data.get('item_ids')):
+            return locate(GroceryItem, item_id)
+        if list_id := data.get('grocery_list_id') or request.query_params.get('list_id'):
+            return locate(GroceryList, list_id)
+        if group_id := request.query_params.get('group_id'):
+            return shard_for_group(group_id)
+        return None
+    
+    def get_throttle_group_id(self, obj):
+        return obj.grocery_list.group_id
+    
     def get_queryset(self):
         queryset = GroceryItem.objects.filter(
-            grocery_list__group__members=self.request.user
+            grocery_list__group__members=self.request.user,
+            grocery_list__detached_at__isnull=True
         ).select_related('grocery_list', 'added_by', 'purchased_by')
         
         # Apply filters
@@ -97,36 +291,110 @@ class GroceryItemViewSet(viewsets.ModelViewSet):
             return GroceryItemUpdateSerializer
         return GroceryItemSerializer
     
+    @idempotent
     def create(self, request, *args, **kwargs):
         grocery_list_id = request.data.get('grocery_list_id') or request.query_params.get('list_id')
         if not grocery_list_id:
             return Response({'detail': 'grocery_list_id is required.'}, status=status.HTTP_400_BAD_REQUEST)
         
         grocery_list = get_object_or_404(
-            GroceryList.objects.filter(group__members=request.user),
+            GroceryList.objects.filter(group__members=request.user, detached_at__isnull=True),
             id=grocery_list_id
         )
+        self.check_group_throttles(request, grocery_list.group_id)
+        check_groups_writable([grocery_list.group_id])
         
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.save(grocery_list=grocery_list, added_by=request.user)
+        merge = merge_requested(request)
+        
+        try:
+            with transaction.atomic(using=current_shard()):
+                if merge:
+                    [(item_id, created)] = merge_items(grocery_list, [serializer.validated_data], request.user)
+                else:
+                    serializer.save(grocery_list=grocery_list, added_by=request.user)
+                    item_id, created = serializer.instance.id, True
+                record_item_names(grocery_list.group_id, [serializer.validated_data['name']])
+                item = GroceryItem.objects.select_related('grocery_list').get(id=item_id)
+                record_events(item_events('item.created' if created else 'item.merged', [item], request.user))
+        except DataError:
+            return Response({'detail': 'Merged quantity is out of range.'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response(
+            GroceryItemSerializer(item).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
+    
+    @action(detail=False, methods=['post'])
+    @idempotent
+    def bulk_create(self, request):
+        serializer = BulkItemCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        
+        grocery_list = get_object_or_404(
+            GroceryList.objects.filter(group__members=request.user, detached_at__isnull=True),
+            id=data['grocery_list_id']
+        )
+        self.check_group_throttles(request, grocery_list.group_id)
+        check_groups_writable([grocery_list.group_id])
         
-        item = GroceryItem.objects.get(id=serializer.instance.id)
-        return Response(GroceryItemSerializer(item).data, status=status.HTTP_201_CREATED)
+        try:
+            with transaction.atomic(using=current_shard()):
+                if data['merge']:
+                    results = merge_items(grocery_list, data['items'], request.user)
+                else:
+                    created = GroceryItem.objects.bulk_create([
+                        GroceryItem(grocery_list=grocery_list, added_by=request.user, **item)
+                        for item in data['items']
+                    ])
+                    claim_merge_keys(created)
+                    results = [(item.id, True) for item in created]
+                record_item_names(grocery_list.group_id, [item['name'] for item in data['items']])
+                items = list(GroceryItem.objects.filter(
+                    id__in=[item_id for item_id, _ in results]
+                ).select_related('grocery_list', 'added_by', 'purchased_by'))
+                created_ids = {item_id for item_id, created in results if created}
+                record_events(
+                    item_events('item.created', [item for item in items if item.id in created_ids], request.user)
+                    + item_events('item.merged', [item for item in items if item.id not in created_ids], request.user)
+                )
+        except DataError:
+            return Response({'detail': 'Merged quantity is out of range.'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        created_count = len(created_ids)
+        return Response({
+            'detail': f'Added {len(results)} items.',
+            'created_count': created_count,
+            'merged_count': len(results) - created_count,
+            'items': GroceryItemSerializer(items, many=True).data
+        }, status=status.HTTP_201_CREATED)
+    
+    def perform_destroy(self, instance):
+        # Built before deleting, which clears instance.pk.
+        events = item_events('item.deleted', [instance], self.request.user)
+        with transaction.atomic(using=current_shard()):
+            if check_if_match(self.request, instance):
+                deleted, _ = GroceryItem.objects.filter(pk=instance.pk, version=instance.version).delete()
+                if not deleted:
+                    raise PreconditionFailed()
+            else:
+                instance.delete()
+            record_events(events)
     
     @action(detail=True, methods=['post'])
     def toggle_purchased(self, request, pk=None):
         item = self.get_object()
-        item.is_purchased = not item.is_purchased
-        
-        if item.is_purchased:
-            item.purchased_at = timezone.now()
-            item.purchased_by = request.user
-        else:
-            item.purchased_at = None
-            item.purchased_by = None
-        
-        item.save()
+        conditional = check_if_match(request, item)
+        with transaction.atomic(using=current_shard()):
+            lock_purchase_state(item)
+            before = purchase_facts(item)
+            item.set_purchased(not item.is_purchased, request.user)
+            save_or_fail(item, PURCHASE_FIELDS, conditional)
+            claim_merge_keys([item])
+            update_rollups(before, purchase_facts(item))
+            record_events(item_events('item.purchased' if item.is_purchased else 'item.unpurchased', [item], request.user))
         return Response(GroceryItemSerializer(item).data)
     
     @action(detail=True, methods=['post'])
@@ -134,34 +402,215 @@ class GroceryItemViewSet(viewsets.ModelViewSet):
         item = self.get_object()
         serializer = MarkPurchasedSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
+        conditional = check_if_match(request, item)
+        
+        with transaction.atomic(using=current_shard()):
+            lock_purchase_state(item)
+            before = purchase_facts(item)
+            item.set_purchased(serializer.validated_data['is_purchased'], request.user)
+            save_or_fail(item, PURCHASE_FIELDS, conditional)
+            claim_merge_keys([item])
+            update_rollups(before, purchase_facts(item))
+            record_events(item_events('item.purchased' if item.is_purchased else 'item.unpurchased', [item], request.user))
+        return Response(GroceryItemSerializer(item).data)
+    
+    @action(detail=True, methods=['post'])
+    def adjust_quantity(self, request, pk=None):
+        item = self.get_object()
+        serializer = AdjustQuantitySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        delta = serializer.validated_data['delta']
+        at_zero = serializer.validated_data['at_zero']
+        conditional = check_if_match(request, item)
         
-        item.is_purchased = serializer.validated_data['is_purchased']
-        if item.is_purchased:
-            item.purchased_at = timezone.now()
-            item.purchased_by = request.user
+        # Bounds are checked by the UPDATE itself so concurrent adjustments
+        # can neither overflow the column nor drive the quantity below zero.
+        items = GroceryItem.objects.filter(pk=item.pk)
+        if delta > 0:
+            bounded = items.filter(quantity__lte=MAX_QUANTITY - delta)
         else:
-            item.purchased_at = None
-            item.purchased_by = None
+            bounded = items.filter(quantity__gte=-delta)
+        if conditional:
+            bounded = bounded.filter(version=item.version)
         
-        item.save()
+        with transaction.atomic(using=current_shard()):
+            lock_purchase_state(item)
+            before = purchase_facts(item)
+            updated = bounded.update(
+                quantity=F('quantity') + delta,
+                updated_at=timezone.now(),
+                version=F('version') + 1
+            )
+            if not updated:
+                if conditional and not items.filter(version=item.version).exists():
+                    raise PreconditionFailed()
+                return Response(
+                    {'detail': f'Quantity must stay between 0 and {MAX_QUANTITY}.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            # The row is locked, so the stored quantity moved by exactly delta.
+            item.quantity += delta
+            update_rollups(before, purchase_facts(item))
+            events = [build_event(
+                'item.quantity_adjusted',
+                item.grocery_list.group_id,
+                item.grocery_list_id,
+                request.user,
+                {'id': item.pk, 'name': item.name, 'delta': delta}
+            )]
+            if at_zero == 'delete' and items.filter(quantity=0).delete()[0]:
+                record_events(events + item_events('item.deleted', [item], request.user))
+                return Response(status=status.HTTP_204_NO_CONTENT)
+            if at_zero == 'purchase' and items.filter(quantity=0, is_purchased=False).update(
+                is_purchased=True,
+                purchased_at=timezone.now(),
+                purchased_by=request.user,
+                merge_key=None,
+                version=F('version') + 1
+            ):
+                purchased = items.select_related('grocery_list').get()
+                update_rollups(None, purchase_facts(purchased))
+                events += item_events('item.purchased', [purchased], request.user)
+            record_events(events)
+            # Read back while the row is still locked; once committed another
+            # request may delete it.
+            item = items.select_related('added_by', 'purchased_by').get()
         return Response(GroceryItemSerializer(item).data)
     
     @action(detail=False, methods=['post'])
+    @idempotent
     def bulk_mark_purchased(self, request):
         serializer = BulkItemIdsSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        items = self.get_queryset().filter(id__in=serializer.validated_data['item_ids'])
-        updated_count = items.update(is_purchased=True, purchased_at=timezone.now(), purchased_by=request.user)
+        items = self.get_queryset().filter(
+            id__in=serializer.validated_data['item_ids'],
+            is_purchased=False
+        )
+        now = timezone.now()
+        with transaction.atomic(using=current_shard()):
+            # Only unpurchased rows transition, and they are locked (in id
+            # order) so each purchase is counted in the rollups exactly once.
+            pending = list(items.select_for_update(of=('self',)).order_by('pk'))
+            check_groups_writable({item.grocery_list.group_id for item in pending})
+            updated_count = GroceryItem.objects.filter(id__in=[item.id for item in pending]).update(
+                is_purchased=True,
+                purchased_at=now,
+                purchased_by=request.user,
+                merge_key=None,
+                version=F('version') + 1
+            )
+            for item in pending:
+                item.is_purchased, item.purchased_at, item.purchased_by = True, now, request.user
+                item.version += 1
+            apply_purchase_facts(added=[purchase_facts(item) for item in pending])
+            record_events(item_events('item.purchased', pending, request.user))
         
         return Response({'detail': f'Marked {updated_count} items as purchased.', 'updated_count': updated_count})
     
     @action(detail=False, methods=['post'])
+    @idempotent
     def bulk_delete(self, request):
         serializer = BulkItemIdsSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
         items = self.get_queryset().filter(id__in=serializer.validated_data['item_ids'])
-        deleted_count, _ = items.delete()
+        with transaction.atomic(using=current_shard()):
+            doomed = list(items.select_for_update(of=('self',)).order_by('pk'))
+            check_groups_writable({item.grocery_list.group_id for item in doomed})
+            deleted_count, _ = GroceryItem.objects.filter(id__in=[item.id for item in doomed]).delete()
+            record_events(item_events('item.deleted', doomed, request.user))
+        
+        return Response({'detail': f'Deleted {deleted_count} items.', 'deleted_count': deleted_count})
+    
+    @action(detail=False, methods=['get'], pagination_class=ItemCursorPagination)
+    def mine(self, request):
+        # Active items across all of the user's groups. Membership is resolved
+        # in a subquery so the items scan can use (grocery_list, is_purchased, created_at);
+        # when sharded, each shard holding some of the groups is paged and the
+        # pages merged in cursor order.
+        group_ids = GroupMembership.objects.filter(user=request.user).values('group_id')
+        placed = None
+        if group_id := request.query_params.get('group_id'):
+            group_ids = group_ids.filter(group_id=group_id)
+        elif is_sharded():
+            placed = groups_by_shard(gather(lambda: group_ids.values_list('group_id', flat=True)))
+        
+        def items():
+            ids = group_ids if placed is None else placed[current_shard()]
+            queryset = GroceryItem.objects.filter(
+                grocery_list_id__in=GroceryList.objects.filter(group_id__in=ids, detached_at__isnull=True).values('id'),
+                is_purchased=False
+            ).select_related('grocery_list', 'added_by', 'purchased_by')
+            if category := request.query_params.get('category'):
+                queryset = queryset.filter(category=category)
+            return queryset
         
-        return Response({'detail': f'Deleted {deleted_count} items.', 'deleted_count': deleted_count})
\ No newline at end of file
+        page = self.paginate_queryset(items() if placed is None else ShardedRows(items, placed))
+        return self.get_paginated_response(MyGroceryItemSerializer(page, many=True).data)
+    
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        query = AutocompleteQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        group_id = query.validated_data['group_id']
+        
+        if not GroupMembership.objects.filter(user=request.user, group_id=group_id).exists():
+            return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        
+        suggestions = suggest_item_names(group_id, query.validated_data['q'], query.validated_data['limit'])
+        return Response(ItemNameSuggestionSerializer(suggestions, many=True).data)
+
+
+class StapleTemplateViewSet(ShardRoutingMixin, viewsets.ModelViewSet):
+    permission_classes = [permissions.IsAuthenticated, IsGroupMember]
+    serializer_class = StapleTemplateSerializer
+    
+    def get_shard(self, request):
+        if pk := self.kwargs.get('pk'):
+            return locate(StapleTemplate, pk)
+        data = request.data if hasattr(request.data, 'get') else {}
+        if group_id := data.get('group') or request.query_params.get('group_id'):
+            return shard_for_group(group_id)
+        return None
+    
+    def get_queryset(self):
+        queryset = StapleTemplate.objects.filter(
+            group__members=self.request.user
+        ).prefetch_related('items')
+        if group_id := self.request.query_params.get('group_id'):
+            queryset = queryset.filter(group_id=group_id)
+        return queryset
+    
+    def perform_create(self, serializer):
+        check_groups_writable([serializer.validated_data['group'].pk])
+        serializer.save()
+
+
+class BootstrapView(APIView):
+    """
+    Everything the app needs at start-up: the user, their groups with member
+    counts, and each group's list with its active items. Always two queries
+    per shard, however many groups the user belongs to.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get_groups(self, user):
+        active_items = GroceryItem.objects.filter(
+            is_purchased=False
+        ).select_related('added_by', 'purchased_by').order_by('-created_at')
+        return UserGroup.objects.filter(
+            id__in=GroupMembership.objects.filter(user=user).values('group_id')
+        ).annotate(
+            members_count=Count('memberships')
+        ).order_by('-created_at').select_related('created_by', 'grocery_list').prefetch_related(
+            Prefetch('grocery_list__items', queryset=active_items, to_attr='active_items')
+        )
+    
+    def get(self, request):
+        groups = gather(lambda: list(self.get_groups(request.user)))
+        data = {
+            'user': UserSerializer(request.user).data,
+            'groups': BootstrapGroupSerializer(order_rows(groups, ['-created_at']), many=True).data,
+        }
+        return conditional_response(request, data)
\ No newline at end of file
@@ -1,5 +1,12 @@
 from django.contrib import admin
-from .models import UserGroup, GroupMembership
+from django.db.models import Count
+from django.urls import reverse
+from django.utils.html import format_html
+from .models import DeletionJob, GroupPlacement, UserGroup, GroupMembership
+
+# Groups with more members than this link to the paginated membership
+# changelist instead of rendering every membership inline.
+INLINE_MEMBERS_LIMIT = 50
 
 
 class GroupMembershipInline(admin.TabularInline):
@@ -12,17 +19,59 @@ class GroupMembershipInline(admin.TabularInline):
 class UserGroupAdmin(admin.ModelAdmin):
     list_display = ['name', 'created_by', 'members_count', 'created_at']
     list_filter = ['created_at']
+    list_select_related = ['created_by']
     search_fields = ['name', 'description']
     raw_id_fields = ['created_by']
+    readonly_fields = ['memberships_link']
     inlines = [GroupMembershipInline]
+    show_full_result_count = False
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(_members_count=Count('memberships'))
+    
+    def get_inlines(self, request, obj):
+        if obj is not None and obj._members_count > INLINE_MEMBERS_LIMIT:
+            return []
+        return super().get_inlines(request, obj)
     
     def members_count(self, obj):
-        return obj.members.count()
+        return obj._members_count
     members_count.short_description = 'Members'
+    members_count.admin_order_field = '_members_count'
+    
+    def memberships_link(self, obj):
+        if obj.pk is None:
+            return '-'
+        url = reverse('admin:usergroups_groupmembership_changelist')
+        return format_html('<a href="{}?group__id__exact={}">View {} members</a>', url, obj.pk, obj._members_count)
+    memberships_link.short_description = 'Memberships'
 
 
 @admin.register(GroupMembership)
 class GroupMembershipAdmin(admin.ModelAdmin):
+    # Filtering by group goes through search or the link on the group page
+    # (?group__id__exact=); a `group` list_filter would load every group.
     list_display = ['user', 'group', 'joined_at']
-    list_filter = ['joined_at', 'group']
-    raw_id_fields = ['user', 'group']
\ No newline at end of file
+    list_filter = ['joined_at']
+    list_select_related = ['user', 'group']
+    search_fields = ['group__name', 'user__username', 'user__email']
+    raw_id_fields = ['user', 'group']
+    show_full_result_count = False
+
+
+@admin.register(DeletionJob)
+class DeletionJobAdmin(admin.ModelAdmin):
+    list_display = ['model', 'object_id', 'status', 'deleted_count', 'requested_by', 'created_at', 'started_at', 'finished_at']
+    list_filter = ['status', 'model']
+    list_select_related = ['requested_by']
+    readonly_fields = [
+        'model', 'object_id', 'status', 'deleted_count', 'requested_by', 'created_at', 'started_at', 'finished_at'
+    ]
+
+
+@admin.register(GroupPlacement)
+class GroupPlacementAdmin(admin.ModelAdmin):
+    list_display = ['group_id', 'shard', 'moving', 'updated_at']
+    list_filter = ['shard', 'moving']
+    search_fields = ['=group_id']
+    readonly_fields = ['group_id', 'shard', 'moving', 'updated_at']
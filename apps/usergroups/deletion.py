@@ -0,0 +1,131 @@
+"""
+Batched deletion of groups and grocery lists.
+
+Django's collector loads every cascaded row into memory and deletes them in
+one transaction. Instead the request only detaches the target in a short
+transaction (a group loses its memberships and a list is marked detached, so
+either disappears for every member) and queues a DeletionJob. The
+``resume_deletions`` command then removes the children in bounded batches,
+each committed on its own, recording progress on the job so an interrupted
+run can be picked up again.
+"""
+from datetime import timedelta
+
+from django.apps import apps
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import DeletionJob
+from grocery_manager.sharding import current_shard
+
+BATCH_SIZE = 500
+# A started job not updated for this long is taken to have been interrupted.
+STALE_AFTER = timedelta(minutes=10)
+
+
+def schedule_deletion(instance, user=None, detach=None):
+    """
+    Queue the deletion of ``instance`` and its cascaded children.
+
+    ``detach`` runs in the same transaction that records the job and should
+    make the object unreachable for clients.
+    """
+    with transaction.atomic(using=current_shard()):
+        job = DeletionJob.objects.create(
+            model=instance._meta.label_lower,
+            object_id=instance.pk,
+            requested_by=user
+        )
+        if detach is not None:
+            detach()
+    return job
+
+
+def delete_in_batches(instance, user=None, detach=None, batch_size=BATCH_SIZE):
+    """
+    Detach ``instance`` and delete it with its cascaded children in batches,
+    without waiting for a worker.
+    """
+    job = schedule_deletion(instance, user=user, detach=detach)
+    if claim_job(job):
+        run_deletion_job(job, batch_size=batch_size)
+    return job
+
+
+def claim_job(job):
+    """
+    Mark ``job`` as started by this worker; False if another worker got to
+    it first.
+    """
+    now = timezone.now()
+    claimed = DeletionJob.objects.filter(pk=job.pk, updated_at=job.updated_at).update(started_at=now, updated_at=now)
+    if claimed:
+        job.started_at = job.updated_at = now
+    return bool(claimed)
+
+
+def run_pending_jobs(batch_size=BATCH_SIZE, stale_after=STALE_AFTER):
+    """
+    Run the queued jobs, and resume started ones left alone for
+    ``stale_after``, oldest first. Returns the number finished.
+    """
+    jobs = DeletionJob.objects.filter(status=DeletionJob.Status.PENDING).filter(
+        Q(started_at__isnull=True) | Q(updated_at__lte=timezone.now() - stale_after)
+    ).order_by('created_at')
+    finished = 0
+    for job in list(jobs):
+        if claim_job(job):
+            run_deletion_job(job, batch_size=batch_size)
+            finished += 1
+    return finished
+
+
+def run_deletion_job(job, batch_size=BATCH_SIZE):
+    """
+    Delete the job's target, children first; safe to run again after a failure.
+    """
+    model = apps.get_model(job.model)
+    _delete_children(job, model, job.object_id, batch_size)
+    with transaction.atomic(using=current_shard()):
+        deleted, _ = model._base_manager.filter(pk=job.object_id).delete()
+        _record(job, deleted)
+        job.status = DeletionJob.Status.DONE
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'finished_at', 'updated_at'])
+
+
+def _cascades(model):
+    return [
+        relation for relation in model._meta.related_objects
+        if relation.on_delete is models.CASCADE and not relation.many_to_many
+    ]
+
+
+def _delete_children(job, model, pk, batch_size):
+    for relation in _cascades(model):
+        child_model = relation.related_model
+        manager = child_model._base_manager
+        children = manager.filter(**{relation.field.attname: pk}).order_by().values_list('pk', flat=True)
+        nested = bool(_cascades(child_model))
+        while True:
+            ids = list(children[:batch_size])
+            if not ids:
+                break
+            if nested:
+                for child_id in ids:
+                    _delete_children(job, child_model, child_id, batch_size)
+            # Children without cascades of their own are fast-deleted with a
+            # single DELETE ... WHERE id IN (...) per batch.
+            with transaction.atomic(using=current_shard()):
+                deleted, _ = manager.filter(pk__in=ids).delete()
+                _record(job, deleted)
+
+
+def _record(job, deleted):
+    if deleted:
+        DeletionJob.objects.filter(pk=job.pk).update(
+            deleted_count=F('deleted_count') + deleted,
+            updated_at=timezone.now()
+        )
+        job.deleted_count += deleted
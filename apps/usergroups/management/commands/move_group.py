@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.usergroups.models import UserGroup
+from grocery_manager.sharding import move_group, shards
+
+
+class Command(BaseCommand):
+    help = 'Move a group, with its list, items and history, to another shard.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('group_id', type=int)
+        parser.add_argument('shard', choices=shards())
+
+    def handle(self, *args, **options):
+        try:
+            moved = move_group(options['group_id'], options['shard'])
+        except UserGroup.DoesNotExist:
+            raise CommandError(f"Group {options['group_id']} does not exist.")
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved group {options['group_id']} to {options['shard']} ({moved} rows)."
+        ))
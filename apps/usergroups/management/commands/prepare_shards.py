@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from grocery_manager.sharding import copy_users, reserve_id_range, shards
+
+
+class Command(BaseCommand):
+    help = 'Set up shard id ranges and copy users to the shards. Safe to run again.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shard', choices=shards(), help='Only prepare this shard.')
+
+    def handle(self, *args, **options):
+        for alias in [options['shard']] if options['shard'] else shards():
+            reserve_id_range(alias)
+            copied = copy_users(alias) if alias != DEFAULT_DB_ALIAS else 0
+            self.stdout.write(f'{alias}: id range reserved, {copied} users copied.')
+        self.stdout.write(self.style.SUCCESS('Shards prepared.'))
@@ -0,0 +1,39 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from apps.usergroups.deletion import BATCH_SIZE, STALE_AFTER, run_pending_jobs
+from grocery_manager.sharding import shards, use_shard
+
+
+class Command(BaseCommand):
+    help = 'Run queued group and grocery list deletions in batches, and finish interrupted ones.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--shard', choices=shards(), help='Only run jobs on this shard.')
+        parser.add_argument(
+            '--min-age', type=int, default=int(STALE_AFTER.total_seconds() // 60),
+            help='Skip started jobs updated in the last N minutes; they may still be running.'
+        )
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new jobs.')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds between polls with --loop.')
+
+    def handle(self, *args, **options):
+        aliases = [options['shard']] if options['shard'] else shards()
+        stale_after = timedelta(minutes=options['min_age'])
+        # Each shard queues its own jobs; every pass runs them all in turn.
+        finished = 0
+        while True:
+            pass_finished = 0
+            for alias in aliases:
+                with use_shard(alias):
+                    pass_finished += run_pending_jobs(options['batch_size'], stale_after)
+            finished += pass_finished
+            if not options['loop']:
+                break
+            if not pass_finished:
+                time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'Finished {finished} deletion jobs.'))
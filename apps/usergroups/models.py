@@ -50,6 +50,65 @@ class GroupMembership(models.Model):
         db_table = 'group_memberships'
         unique_together = ['user', 'group']
         ordering = ['-joined_at']
+        indexes = [
+            models.Index(fields=['group', 'joined_at'], name='membership_group_joined_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.user.username} in {self.group.name}"
\ No newline at end of file
+        return f"{self.user.username} in {self.group.name}"
+
+
+class DeletionJob(models.Model):
+    """
+    Tracks the batched removal of a group or grocery list and its children.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        DONE = 'done', 'Done'
+
+    # The target row is going away, so it is referenced by label and id.
+    model = models.CharField(max_length=100)
+    object_id = models.PositiveBigIntegerField()
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    deleted_count = models.PositiveIntegerField(default=0)
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='deletion_jobs'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Set when a worker takes the job; updated_at then tracks its progress.
+    started_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'deletion_jobs'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='deletion_job_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} #{self.object_id} ({self.status})"
+
+
+class GroupPlacement(models.Model):
+    """
+    The shard holding a group that no longer lives on the shard its id was
+    allocated from. Kept on the default database; see grocery_manager.sharding.
+    """
+    group_id = models.PositiveBigIntegerField(primary_key=True)
+    shard = models.CharField(max_length=100)
+    # Writes to the group are refused while move_group copies it.
+    moving = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'group_placements'
+
+    def __str__(self):
+        return f"Group {self.group_id} on {self.shard}"
@@ -0,0 +1,11 @@
+from rest_framework.pagination import CursorPagination
+
+
+class MembershipCursorPagination(CursorPagination):
+    """
+    Keyset pagination over a group's memberships, most recent first.
+    """
+    ordering = ('-joined_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
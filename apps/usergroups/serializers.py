@@ -22,14 +22,10 @@ class UserGroupSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_by', 'created_at', 'updated_at']
     
     def get_members_count(self, obj):
-        return obj.members.count()
-
-
-class UserGroupDetailSerializer(UserGroupSerializer):
-    memberships = GroupMembershipSerializer(many=True, read_only=True)
-    
-    class Meta(UserGroupSerializer.Meta):
-        fields = UserGroupSerializer.Meta.fields + ['memberships']
+        # UserGroupViewSet annotates the count; freshly created groups aren't annotated.
+        if hasattr(obj, 'members_count'):
+            return obj.members_count
+        return obj.memberships.count()
 
 
 class AddMemberSerializer(serializers.Serializer):
@@ -39,4 +35,11 @@ class AddMemberSerializer(serializers.Serializer):
         from apps.users.models import User
         if not User.objects.filter(id=value).exists():
             raise serializers.ValidationError("User not found.")
-        return value
\ No newline at end of file
+        return value
+
+
+class BulkMembersSerializer(serializers.Serializer):
+    user_ids = serializers.ListField(child=serializers.IntegerField(), min_length=1, max_length=500)
+    
+    def validate_user_ids(self, value):
+        return list(dict.fromkeys(value))
\ No newline at end of file
@@ -1,9 +1,23 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import skipUnless
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APITestCase, APIClient
-from .models import UserGroup, GroupMembership
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from .admin import INLINE_MEMBERS_LIMIT
+from .deletion import delete_in_batches
+from .models import DeletionJob, GroupPlacement, UserGroup, GroupMembership
+from apps.grocery.models import GroceryItem, GroceryList, ItemNameStat, OutboxEvent
 from apps.users.models import User
+from grocery_manager.sharding import SHARD_ID_SPAN, GroupMoving, check_groups_writable, move_group, new_group_shard, use_shard
 
 
 class UserGroupModelTests(TestCase):
@@ -93,6 +107,7 @@ class UserGroupAPITests(APITestCase):
         group = UserGroup.objects.get(id=response.data['id'])
         self.assertIn(self.user, group.members.all())
         self.assertEqual(group.created_by, self.user)
+        self.assertEqual(group.grocery_list.name, "My Family's Grocery List")
 
     def test_delete_group(self):
         """Test deleting a group."""
@@ -103,5 +118,482 @@ class UserGroupAPITests(APITestCase):
         url = reverse('group-detail', kwargs={'pk': group.pk})
         response = self.client.delete(url)
         
-        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
-        self.assertFalse(UserGroup.objects.filter(id=group.id).exists())
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertFalse(GroupMembership.objects.filter(group=group).exists())
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        
+        call_command('resume_deletions', stdout=StringIO())
+        self.assertFalse(UserGroup.objects.filter(id=group.id).exists())
+
+class UserGroupAdminTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='admin',
+            email='admin@example.com',
+            password='adminpass123'
+        )
+        self.client.force_login(self.admin)
+
+    def add_group(self, name, members):
+        group = UserGroup.objects.create(name=name, created_by=self.admin)
+        for index in range(members):
+            user = User.objects.create_user(username=f'{name}-{index}', email=f'{name}-{index}@example.com')
+            GroupMembership.objects.create(user=user, group=group)
+        return group
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_changelists_do_not_query_per_row(self):
+        """Test that group and membership changelists use a fixed number of queries."""
+        self.add_group('first', 2)
+        group_url = reverse('admin:usergroups_usergroup_changelist')
+        membership_url = reverse('admin:usergroups_groupmembership_changelist')
+        group_queries, _ = self.count_queries(group_url)
+        membership_queries, _ = self.count_queries(membership_url)
+
+        for index in range(3):
+            self.add_group(f'group{index}', 2)
+        self.assertEqual(self.count_queries(group_url)[0], group_queries)
+        self.assertEqual(self.count_queries(membership_url)[0], membership_queries)
+
+    def test_large_group_links_to_memberships(self):
+        """Test that large groups link to the filtered membership changelist."""
+        group = self.add_group('big', INLINE_MEMBERS_LIMIT + 1)
+        _, response = self.count_queries(reverse('admin:usergroups_usergroup_change', args=[group.pk]))
+        self.assertContains(response, f'?group__id__exact={group.pk}')
+        self.assertNotContains(response, 'memberships-TOTAL_FORMS')
+
+        _, response = self.count_queries(
+            reverse('admin:usergroups_groupmembership_changelist') + f'?group__id__exact={group.pk}'
+        )
+        self.assertContains(response, 'big-0')
+
+
+class GroupMembersAPITests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def add_group(self, name, extra_members):
+        group = UserGroup.objects.create(name=name, created_by=self.user)
+        GroupMembership.objects.create(user=self.user, group=group)
+        for index in range(extra_members):
+            member = User.objects.create_user(username=f'{name}-{index}', email=f'{name}-{index}@example.com')
+            GroupMembership.objects.create(user=member, group=group)
+        return group
+
+    def test_list_uses_annotated_counts_without_prefetching_members(self):
+        """Test that the group list runs a fixed number of queries and reports member counts."""
+        self.add_group('home', 2)
+        with self.assertNumQueries(2):
+            self.client.get(reverse('group-list'))
+
+        self.add_group('house', 5)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('group-list'))
+        counts = {group['name']: group['members_count'] for group in response.data['results']}
+        self.assertEqual(counts, {'home': 3, 'house': 6})
+
+    def test_detail_does_not_embed_members(self):
+        """Test that a group's detail reports its member count without listing the members."""
+        group = self.add_group('crowd', 20)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('group-detail', kwargs={'pk': group.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['members_count'], 21)
+        self.assertNotIn('memberships', response.data)
+
+    def test_members_endpoint_is_paginated(self):
+        """Test walking a large group's members page by page."""
+        group = self.add_group('shared', 6)
+        url = reverse('group-members', kwargs={'pk': group.pk}) + '?page_size=3'
+
+        usernames = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 3)
+            usernames.extend(row['user']['username'] for row in response.data['results'])
+            url = response.data['next']
+
+        self.assertEqual(len(usernames), 7)
+        self.assertEqual(len(set(usernames)), 7)
+
+    def test_members_endpoint_requires_membership(self):
+        """Test that non-members cannot list a group's members."""
+        group = self.add_group('private', 1)
+        outsider = User.objects.create_user(username='outsider', email='outsider@example.com')
+        self.client.force_authenticate(user=outsider)
+        response = self.client.get(reverse('group-members', kwargs={'pk': group.pk}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class BulkMembershipAPITests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.others = [
+            User.objects.create_user(username=f'member{index}', email=f'member{index}@example.com')
+            for index in range(3)
+        ]
+        self.group = UserGroup.objects.create(name='Shared House', created_by=self.user)
+        GroupMembership.objects.create(user=self.user, group=self.group)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_bulk_add_reports_per_user_results(self):
+        """Test adding many users at once with per-user outcomes."""
+        url = reverse('group-bulk-add-members', kwargs={'pk': self.group.pk})
+        user_ids = [self.others[0].id, self.others[1].id, self.user.id, 999999, self.others[0].id]
+        response = self.client.post(url, {'user_ids': user_ids}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['added_count'], 2)
+        self.assertEqual(
+            [row['status'] for row in response.data['results']],
+            ['added', 'added', 'already_member', 'not_found']
+        )
+        self.assertEqual(self.group.members.count(), 3)
+
+    def test_bulk_add_uses_constant_queries(self):
+        """Test that the number of queries doesn't depend on how many users are added."""
+        url = reverse('group-bulk-add-members', kwargs={'pk': self.group.pk})
+        with CaptureQueriesContext(connection) as few:
+            self.client.post(url, {'user_ids': [self.others[0].id]}, format='json')
+        with CaptureQueriesContext(connection) as many:
+            self.client.post(url, {'user_ids': [user.id for user in self.others]}, format='json')
+        self.assertEqual(len(few), len(many))
+
+    def test_bulk_remove(self):
+        """Test removing several members in one call."""
+        for other in self.others:
+            GroupMembership.objects.create(user=other, group=self.group)
+
+        url = reverse('group-bulk-remove-members', kwargs={'pk': self.group.pk})
+        user_ids = [self.others[0].id, self.others[1].id, 999999]
+        response = self.client.post(url, {'user_ids': user_ids}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['removed_count'], 2)
+        self.assertEqual(
+            [row['status'] for row in response.data['results']],
+            ['removed', 'removed', 'not_member']
+        )
+        self.assertEqual(set(self.group.members.all()), {self.user, self.others[2]})
+
+
+
+class BatchedDeletionTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.group = UserGroup.objects.create(name='Shared House', created_by=self.user)
+        GroupMembership.objects.create(user=self.user, group=self.group)
+        self.grocery_list = self.group.grocery_list
+        GroceryItem.objects.bulk_create([
+            GroceryItem(grocery_list=self.grocery_list, name=f'Item {index}', added_by=self.user)
+            for index in range(7)
+        ])
+        ItemNameStat.objects.create(
+            group=self.group, normalized_name='milk', name='Milk', use_count=1, last_used_at=self.group.created_at
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_delete_group_removes_children_and_records_job(self):
+        """Test that deleting a group removes its list, items and stats and records progress."""
+        response = self.client.delete(reverse('group-detail', kwargs={'pk': self.group.pk}))
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertTrue(GroceryItem.objects.exists())
+        out = StringIO()
+        call_command('resume_deletions', stdout=out)
+        self.assertIn('Finished 1 deletion jobs.', out.getvalue())
+        self.assertFalse(UserGroup.objects.filter(id=self.group.id).exists())
+        self.assertFalse(GroceryList.objects.filter(id=self.grocery_list.id).exists())
+        self.assertFalse(GroceryItem.objects.exists())
+        self.assertFalse(ItemNameStat.objects.exists())
+        job = DeletionJob.objects.get(pk=response.data['job_id'])
+        self.assertEqual(job.status, DeletionJob.Status.DONE)
+        self.assertEqual(job.model, 'usergroups.usergroup')
+        self.assertIsNotNone(job.started_at)
+        # 7 items + 1 list + 1 stat + the group; the membership went at detach.
+        self.assertEqual(job.deleted_count, 10)
+
+    def test_items_are_deleted_in_bounded_batches(self):
+        """Test that no single DELETE statement covers more than one batch of items."""
+        with CaptureQueriesContext(connection) as queries:
+            delete_in_batches(self.grocery_list, batch_size=3)
+
+        item_deletes = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('DELETE FROM "grocery_items" WHERE "grocery_items"."id" IN')
+        ]
+        self.assertEqual(len(item_deletes), 3)
+        self.assertFalse(GroceryItem.objects.exists())
+        self.assertTrue(UserGroup.objects.filter(id=self.group.id).exists())
+
+    def test_deleted_list_is_hidden_until_removed(self):
+        """Test that a list queued for deletion and its items disappear at once and go when the job runs."""
+        list_url = reverse('grocerylist-detail', kwargs={'pk': self.grocery_list.pk})
+        item = GroceryItem.objects.first()
+
+        response = self.client.delete(list_url)
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(self.client.get(list_url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(reverse('grocerylist-list')).data['results'], [])
+        self.assertEqual(self.client.get(reverse('groceryitem-list')).data['results'], [])
+        self.assertEqual(self.client.get(reverse('groceryitem-mine')).data['results'], [])
+        response = self.client.get(reverse('groceryitem-detail', kwargs={'pk': item.pk}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.post(reverse('groceryitem-list'), {'grocery_list_id': self.grocery_list.id, 'name': 'Eggs'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertIsNone(self.client.get(reverse('bootstrap')).data['groups'][0]['grocery_list'])
+        self.assertEqual(GroceryItem.objects.count(), 7)
+
+        call_command('resume_deletions', stdout=StringIO())
+        self.assertFalse(GroceryList.objects.filter(id=self.grocery_list.id).exists())
+        self.assertFalse(GroceryItem.objects.exists())
+        self.assertTrue(UserGroup.objects.filter(id=self.group.id).exists())
+
+    def test_started_job_is_left_to_its_worker(self):
+        """Test that the command skips a job another worker started recently but resumes a stale one."""
+        GroupMembership.objects.filter(group=self.group).delete()
+        job = DeletionJob.objects.create(model='usergroups.usergroup', object_id=self.group.id)
+        DeletionJob.objects.filter(pk=job.pk).update(started_at=timezone.now())
+
+        out = StringIO()
+        call_command('resume_deletions', stdout=out)
+        self.assertIn('Finished 0 deletion jobs.', out.getvalue())
+
+        DeletionJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        call_command('resume_deletions', stdout=out)
+        self.assertIn('Finished 1 deletion jobs.', out.getvalue())
+        self.assertFalse(UserGroup.objects.filter(id=self.group.id).exists())
+
+    def test_resume_finishes_interrupted_job(self):
+        """Test that the resume command completes a job left pending."""
+        GroupMembership.objects.filter(group=self.group).delete()
+        job = DeletionJob.objects.create(model='usergroups.usergroup', object_id=self.group.id)
+
+        out = StringIO()
+        call_command('resume_deletions', '--min-age', '0', stdout=out)
+
+        self.assertIn('Finished 1 deletion jobs.', out.getvalue())
+        job.refresh_from_db()
+        self.assertEqual(job.status, DeletionJob.Status.DONE)
+        self.assertFalse(UserGroup.objects.filter(id=self.group.id).exists())
+        self.assertFalse(GroceryItem.objects.exists())
+
+
+@skipUnless(len(settings.DATABASES) > 1, 'Sharding tests need more than one database.')
+@override_settings(GROCERY_SHARDS=sorted(settings.DATABASES, key=lambda alias: alias != 'default'))
+class ShardingTests(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        call_command('prepare_shards', stdout=StringIO())
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.home = new_group_shard(self.user)
+        self.other = next(alias for alias in settings.GROCERY_SHARDS if alias != self.home)
+
+    def create_group(self, name='Shared House'):
+        response = self.client.post(reverse('group-list'), {'name': name}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+
+    def add_item(self, list_id, name='Milk'):
+        return self.client.post(reverse('groceryitem-list'), {'grocery_list_id': list_id, 'name': name}, format='json')
+
+    def test_users_are_copied_to_every_shard(self):
+        """Test that saving a user copies it to the other shards."""
+        for alias in settings.GROCERY_SHARDS:
+            self.assertTrue(User.objects.using(alias).filter(pk=self.user.pk, username='testuser').exists())
+
+    def test_group_rows_stay_on_one_shard(self):
+        """Test that a new group, its list and its items are created on the same shard."""
+        group_id = self.create_group()
+        grocery_list = GroceryList.objects.using(self.home).get(group_id=group_id)
+        self.assertFalse(UserGroup.objects.using(self.other).filter(pk=group_id).exists())
+        self.assertEqual(group_id // SHARD_ID_SPAN, settings.GROCERY_SHARDS.index(self.home))
+
+        response = self.add_item(grocery_list.id)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(GroceryItem.objects.using(self.home).filter(pk=response.data['id']).exists())
+
+        response = self.client.get(reverse('groceryitem-detail', args=[response.data['id']]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['name'], 'Milk')
+
+    def test_my_groups_are_read_from_every_shard(self):
+        """Test that the group list and bootstrap include groups from all shards."""
+        self.create_group('Home')
+        with use_shard(self.other):
+            away = UserGroup.objects.create(name='Away', created_by=self.user)
+            GroupMembership.objects.create(user=self.user, group=away)
+
+        response = self.client.get(reverse('group-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([group['name'] for group in response.data['results']], ['Away', 'Home'])
+
+        response = self.client.get(reverse('bootstrap'))
+        self.assertEqual([group['name'] for group in response.data['groups']], ['Away', 'Home'])
+
+        response = self.client.get(reverse('group-detail', args=[away.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_my_items_are_paged_across_shards(self):
+        """Test that my items merge every shard's items in cursor order, page by page."""
+        home_list = GroceryList.objects.using(self.home).get(group_id=self.create_group('Home'))
+        with use_shard(self.other):
+            away = UserGroup.objects.create(name='Away', created_by=self.user)
+            GroupMembership.objects.create(user=self.user, group=away)
+            away_list = away.grocery_list
+        names = []
+        for index in range(3):
+            for grocery_list in (home_list, away_list):
+                name = f'{grocery_list.group.name} {index}'
+                self.assertEqual(self.add_item(grocery_list.id, name).status_code, status.HTTP_201_CREATED)
+                names.append(name)
+
+        seen = []
+        url = reverse('groceryitem-mine') + '?page_size=4'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen += [item['name'] for item in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(seen, names[::-1])
+
+        response = self.client.get(reverse('groceryitem-list'))
+        self.assertEqual(sorted(item['name'] for item in response.data['results']), sorted(names))
+
+    def test_export_reads_the_lists_shard(self):
+        """Test that exporting a list on a non-default shard streams its items."""
+        alias = next(alias for alias in settings.GROCERY_SHARDS if alias != 'default')
+        with use_shard(alias):
+            group = UserGroup.objects.create(name='Away', created_by=self.user)
+            GroupMembership.objects.create(user=self.user, group=group)
+            list_id = group.grocery_list.id
+        self.assertEqual(self.add_item(list_id).status_code, status.HTTP_201_CREATED)
+
+        response = self.client.get(reverse('grocerylist-export', args=[list_id]), {'file_format': 'csv'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('Milk', lines[1])
+
+    def test_move_group(self):
+        """Test that moving a group carries its rows over and lookups follow it."""
+        source, target = settings.GROCERY_SHARDS[:2]
+        with use_shard(source):
+            group = UserGroup.objects.create(name='Shared House', created_by=self.user)
+            GroupMembership.objects.create(user=self.user, group=group)
+            list_id = group.grocery_list.id
+        item_id = self.add_item(list_id).data['id']
+
+        out = StringIO()
+        call_command('move_group', str(group.id), target, stdout=out)
+
+        self.assertIn(f'Moved group {group.id} to {target}', out.getvalue())
+        self.assertFalse(UserGroup.objects.using(source).filter(pk=group.id).exists())
+        self.assertFalse(OutboxEvent.objects.using(source).filter(group_id=group.id).exists())
+        self.assertTrue(GroceryItem.objects.using(target).filter(pk=item_id, grocery_list_id=list_id).exists())
+        self.assertEqual(OutboxEvent.objects.using(target).filter(group_id=group.id).count(), 1)
+        self.assertEqual(GroupPlacement.objects.get(group_id=group.id).shard, target)
+
+        response = self.client.get(reverse('group-detail', args=[group.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.post(reverse('groceryitem-toggle-purchased', args=[item_id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.add_item(list_id, 'Bread')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(GroceryItem.objects.using(target).filter(pk=response.data['id']).exists())
+        self.assertEqual(response.data['id'] // SHARD_ID_SPAN, 1)
+
+    def test_writes_are_refused_while_moving(self):
+        """Test that a group being moved rejects writes but still serves reads."""
+        group_id = self.create_group()
+        list_id = GroceryList.objects.using(self.home).get(group_id=group_id).id
+        item_id = self.add_item(list_id).data['id']
+        GroupPlacement.objects.create(group_id=group_id, shard=self.home, moving=True)
+
+        response = self.add_item(list_id, 'Bread')
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        response = self.client.post(reverse('groceryitem-toggle-purchased', args=[item_id]))
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        response = self.client.get(reverse('groceryitem-detail', args=[item_id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_move_to_current_shard_fails(self):
+        """Test that moving a group to the shard it is on is an error."""
+        group_id = self.create_group()
+        with self.assertRaises(CommandError):
+            call_command('move_group', str(group_id), self.home, stdout=StringIO())
+
+
+@skipUnless(
+    len(settings.DATABASES) > 1 and connection.vendor == 'postgresql',
+    'Needs several databases that allow concurrent writers.'
+)
+@override_settings(GROCERY_SHARDS=sorted(settings.DATABASES, key=lambda alias: alias != 'default'))
+class MoveGroupLockingTests(TransactionTestCase):
+    databases = '__all__'
+
+    def test_move_waits_for_writes_under_way(self):
+        """Test that a move copies a write that passed the check before it started, and refuses later ones."""
+        call_command('prepare_shards', stdout=StringIO())
+        user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass123')
+        source, target = settings.GROCERY_SHARDS[:2]
+        with use_shard(source):
+            group = UserGroup.objects.create(name='Shared House', created_by=user)
+            grocery_list = group.grocery_list
+
+        def move():
+            try:
+                move_group(group.id, target)
+            finally:
+                for alias in connections:
+                    connections[alias].close()
+
+        with use_shard(source), transaction.atomic(using=source):
+            check_groups_writable([group.id])
+            mover = threading.Thread(target=move)
+            mover.start()
+            mover.join(0.5)
+            self.assertTrue(mover.is_alive())
+            item = GroceryItem.objects.create(grocery_list=grocery_list, name='Milk', added_by=user)
+        mover.join(10)
+
+        self.assertFalse(mover.is_alive())
+        self.assertTrue(GroceryItem.objects.using(target).filter(pk=item.pk).exists())
+        self.assertFalse(GroceryItem.objects.using(source).filter(pk=item.pk).exists())
+        with use_shard(source), transaction.atomic(using=source):
+            with self.assertRaises(GroupMoving):
+                check_groups_writable([group.id])
@@ -1,33 +1,80 @@
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef
 from django.shortcuts import get_object_or_404
+from .deletion import schedule_deletion
 from .models import UserGroup, GroupMembership
+from .pagination import MembershipCursorPagination
 from .serializers import (
     UserGroupSerializer,
-    UserGroupDetailSerializer,
     AddMemberSerializer,
+    BulkMembersSerializer,
     GroupMembershipSerializer
 )
 from apps.users.models import User
+from apps.grocery.models import GroceryList
+from apps.grocery.outbox import build_event, record_event, record_events
+from grocery_manager.sharding import ShardRoutingMixin, current_shard, new_group_shard, shard_for_group
+from grocery_manager.throttling import GroupThrottleMixin
 
 
-class UserGroupViewSet(viewsets.ModelViewSet):
+class UserGroupViewSet(ShardRoutingMixin, GroupThrottleMixin, viewsets.ModelViewSet):
+    serializer_class = UserGroupSerializer
     permission_classes = [permissions.IsAuthenticated]
     
+    def get_shard(self, request):
+        if pk := self.kwargs.get('pk'):
+            return shard_for_group(pk)
+        if self.action == 'create':
+            return new_group_shard(request.user)
+        return None
+    
+    def get_throttle_group_id(self, obj):
+        return obj.pk
+    
     def get_queryset(self):
+        # Members are never embedded, however large the group; clients page
+        # through them with the members action.
         return UserGroup.objects.filter(
-            members=self.request.user
-        ).prefetch_related('members', 'memberships__user')
-    
-    def get_serializer_class(self):
-        if self.action == 'retrieve':
-            return UserGroupDetailSerializer
-        return UserGroupSerializer
+            id__in=GroupMembership.objects.filter(user=self.request.user).values('group_id')
+        ).select_related('created_by').annotate(
+            members_count=Count('memberships')
+        ).order_by('-created_at')
     
     def perform_create(self, serializer):
-        group = serializer.save(created_by=self.request.user)
-        GroupMembership.objects.create(user=self.request.user, group=group)
+        with transaction.atomic(using=current_shard()):
+            group = serializer.save(created_by=self.request.user)
+            GroupMembership.objects.create(user=self.request.user, group=group)
+            grocery_list = GroceryList.for_group(group)
+            record_event('group.created', group.id, grocery_list.id, self.request.user, {'name': group.name})
+    
+    def perform_update(self, serializer):
+        with transaction.atomic(using=current_shard()):
+            group = serializer.save()
+            record_event('group.updated', group.id, actor=self.request.user, payload={'name': group.name})
+    
+    def destroy(self, request, *args, **kwargs):
+        job = self.perform_destroy(self.get_object())
+        return Response({'detail': 'Deletion queued.', 'job_id': job.id}, status=status.HTTP_202_ACCEPTED)
+    
+    def perform_destroy(self, instance):
+        # Dropping the memberships hides the group from everyone right away;
+        # the list and items behind it are then removed in batches by
+        # resume_deletions.
+        def detach():
+            GroupMembership.objects.filter(group=instance).delete()
+            record_event('group.deleted', instance.id, actor=self.request.user)
+        
+        return schedule_deletion(instance, user=self.request.user, detach=detach)
+    
+    @action(detail=True, methods=['get'], pagination_class=MembershipCursorPagination)
+    def members(self, request, pk=None):
+        group = self.get_object()
+        memberships = GroupMembership.objects.filter(group=group).select_related('user')
+        page = self.paginate_queryset(memberships)
+        return self.get_paginated_response(GroupMembershipSerializer(page, many=True).data)
     
     @action(detail=True, methods=['post'])
     def add_member(self, request, pk=None):
@@ -43,7 +90,9 @@ class UserGroupViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        membership = GroupMembership.objects.create(user=user, group=group)
+        with transaction.atomic(using=current_shard()):
+            membership = GroupMembership.objects.create(user=user, group=group)
+            record_event('member.added', group.id, actor=request.user, payload={'user_id': user.id})
         return Response(GroupMembershipSerializer(membership).data, status=status.HTTP_201_CREATED)
     
     @action(detail=True, methods=['delete'], url_path='remove_member/(?P<user_id>[^/.]+)')
@@ -55,9 +104,74 @@ class UserGroupViewSet(viewsets.ModelViewSet):
         if not membership:
             return Response({'detail': 'User is not a member of this group.'}, status=status.HTTP_404_NOT_FOUND)
         
-        membership.delete()
+        with transaction.atomic(using=current_shard()):
+            membership.delete()
+            record_event('member.removed', group.id, actor=request.user, payload={'user_id': user.id})
         return Response(status=status.HTTP_204_NO_CONTENT)
     
+    @action(detail=True, methods=['post'])
+    def bulk_add_members(self, request, pk=None):
+        group = self.get_object()
+        serializer = BulkMembersSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user_ids = serializer.validated_data['user_ids']
+        
+        with transaction.atomic(using=current_shard()):
+            # One query resolves which users exist and which are already members.
+            found = dict(
+                User.objects.using(current_shard()).filter(id__in=user_ids).annotate(
+                    is_member=Exists(GroupMembership.objects.filter(group=group, user=OuterRef('pk')))
+                ).values_list('id', 'is_member')
+            )
+            to_add = [user_id for user_id in user_ids if found.get(user_id) is False]
+            GroupMembership.objects.bulk_create(
+                [GroupMembership(group=group, user_id=user_id) for user_id in to_add],
+                ignore_conflicts=True
+            )
+            record_events([
+                build_event('member.added', group.id, actor=request.user, payload={'user_id': user_id})
+                for user_id in to_add
+            ])
+        
+        results = [
+            {
+                'user_id': user_id,
+                'status': 'not_found' if user_id not in found else 'already_member' if found[user_id] else 'added'
+            }
+            for user_id in user_ids
+        ]
+        return Response({
+            'detail': f'Added {len(to_add)} members.',
+            'added_count': len(to_add),
+            'results': results
+        })
+    
+    @action(detail=True, methods=['post'])
+    def bulk_remove_members(self, request, pk=None):
+        group = self.get_object()
+        serializer = BulkMembersSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user_ids = serializer.validated_data['user_ids']
+        
+        with transaction.atomic(using=current_shard()):
+            memberships = GroupMembership.objects.filter(group=group, user_id__in=user_ids)
+            member_ids = set(memberships.select_for_update().values_list('user_id', flat=True))
+            memberships.delete()
+            record_events([
+                build_event('member.removed', group.id, actor=request.user, payload={'user_id': user_id})
+                for user_id in user_ids if user_id in member_ids
+            ])
+        
+        results = [
+            {'user_id': user_id, 'status': 'removed' if user_id in member_ids else 'not_member'}
+            for user_id in user_ids
+        ]
+        return Response({
+            'detail': f'Removed {len(member_ids)} members.',
+            'removed_count': len(member_ids),
+            'results': results
+        })
+    
     @action(detail=True, methods=['post'])
     def leave(self, request, pk=None):
         group = self.get_object()
@@ -66,5 +180,7 @@ class UserGroupViewSet(viewsets.ModelViewSet):
         if not membership:
             return Response({'detail': 'You are not a member of this group.'}, status=status.HTTP_400_BAD_REQUEST)
         
-        membership.delete()
+        with transaction.atomic(using=current_shard()):
+            membership.delete()
+            record_event('member.removed', group.id, actor=request.user, payload={'user_id': request.user.id})
         return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
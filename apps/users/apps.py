@@ -1,7 +1,15 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.users'
     verbose_name = 'Users'
+
+    def ready(self):
+        from grocery_manager import sharding
+
+        User = self.get_model('User')
+        post_save.connect(sharding.replicate_user, sender=User, dispatch_uid='replicate_user')
+        post_delete.connect(sharding.remove_user_replicas, sender=User, dispatch_uid='remove_user_replicas')
@@ -1,5 +1,24 @@
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import OpClass
 from django.db import models
+from django.db.models.functions import Lower
+
+
+class PatternOpsIndex(models.Index):
+    """
+    Expression index built with ``text_pattern_ops`` on PostgreSQL, so it can
+    serve `LIKE 'prefix%'` regardless of the database collation. Other
+    backends get a plain index.
+    """
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().create_sql(model, schema_editor, using=using, **kwargs)
+        index = models.Index(
+            *[OpClass(expression, name='text_pattern_ops') for expression in self.expressions],
+            name=self.name
+        )
+        return index.create_sql(model, schema_editor, using=using, **kwargs)
 
 
 class User(AbstractUser):
@@ -13,6 +32,11 @@ class User(AbstractUser):
     class Meta:
         db_table = 'users'
         ordering = ['-created_at']
+        indexes = [
+            # Back the case-insensitive exact and prefix lookups of user search.
+            PatternOpsIndex(Lower('username'), name='users_username_lower_idx'),
+            PatternOpsIndex(Lower('email'), name='users_email_lower_idx'),
+        ]
 
     def __str__(self):
-        return self.email
\ No newline at end of file
+        return self.email
@@ -13,4 +13,9 @@ class UserMinimalSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'first_name', 'last_name']
-        read_only_fields = fields
\ No newline at end of file
+        read_only_fields = fields
+
+
+class UserSearchSerializer(serializers.Serializer):
+    q = serializers.CharField(min_length=2, max_length=254, trim_whitespace=True)
+    limit = serializers.IntegerField(min_value=1, max_value=20, required=False, default=10)
\ No newline at end of file
@@ -1,7 +1,11 @@
+from unittest import mock
+from django.core.cache import cache
 from django.test import TestCase
 from django.urls import reverse
 from rest_framework import status
+from rest_framework.settings import api_settings
 from rest_framework.test import APITestCase, APIClient
+from rest_framework.throttling import ScopedRateThrottle
 from .models import User
 
 
@@ -57,3 +61,63 @@ class UserAPITests(APITestCase):
         url = reverse('user-list')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class UserSearchAPITests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        for username in ['alice', 'Alicia', 'alfred', 'bob']:
+            User.objects.create_user(username=username, email=f'{username.lower()}@example.com')
+        User.objects.create_user(username='ally', email='Bobby@Example.org')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('user-search')
+        cache.clear()
+
+    def test_prefix_search_on_username_and_email(self):
+        """Test case-insensitive prefix matching on username and email."""
+        response = self.client.get(self.url, {'q': 'ALI'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([user['username'] for user in response.data], ['alice', 'Alicia'])
+
+        response = self.client.get(self.url, {'q': 'bob'})
+        self.assertEqual({user['username'] for user in response.data}, {'bob', 'ally'})
+
+    def test_prefixes_with_punctuation(self):
+        """Test that punctuation in the prefix is matched literally."""
+        User.objects.create_user(username='john.smith', email='js@example.com')
+        User.objects.create_user(username='johnsmith', email='jane@example.net')
+
+        response = self.client.get(self.url, {'q': 'john.'})
+        self.assertEqual([user['username'] for user in response.data], ['john.smith'])
+
+        response = self.client.get(self.url, {'q': 'jane@ex'})
+        self.assertEqual([user['username'] for user in response.data], ['johnsmith'])
+
+        response = self.client.get(self.url, {'q': 'jo%'})
+        self.assertEqual(response.data, [])
+
+    def test_exact_matches_come_first_and_limit_applies(self):
+        """Test that an exact username or email match is ranked first within the limit."""
+        response = self.client.get(self.url, {'q': 'bobby@example.org'})
+        self.assertEqual([user['username'] for user in response.data], ['ally'])
+
+        response = self.client.get(self.url, {'q': 'al', 'limit': 2})
+        self.assertEqual(len(response.data), 2)
+
+    def test_short_queries_are_rejected(self):
+        """Test that single-character queries are not allowed."""
+        response = self.client.get(self.url, {'q': 'a'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_search_is_throttled(self):
+        """Test that the search endpoint is rate limited."""
+        rates = {**api_settings.DEFAULT_THROTTLE_RATES, 'user_search': '2/min'}
+        with mock.patch.object(ScopedRateThrottle, 'THROTTLE_RATES', rates):
+            responses = [self.client.get(self.url, {'q': 'al'}) for _ in range(3)]
+        self.assertEqual(responses[-1].status_code, status.HTTP_429_TOO_MANY_REQUESTS)
@@ -1,16 +1,40 @@
 from rest_framework import viewsets, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.throttling import ScopedRateThrottle
+from django.db.models import Q
+from django.db.models.functions import Lower
 from .models import User
-from .serializers import UserSerializer
+from .serializers import UserSerializer, UserMinimalSerializer, UserSearchSerializer
 
 
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
+    throttle_scope = None
 
     @action(detail=False, methods=['get'])
     def me(self, request):
         serializer = self.get_serializer(request.user)
-        return Response(serializer.data)
\ No newline at end of file
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'], throttle_classes=[ScopedRateThrottle], throttle_scope='user_search')
+    def search(self, request):
+        query = UserSearchSerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        term = query.validated_data['q'].lower()
+        limit = query.validated_data['limit']
+
+        users = User.objects.annotate(username_lower=Lower('username'), email_lower=Lower('email'))
+        exact = list(users.filter(Q(username_lower=term) | Q(email_lower=term)).order_by('id')[:limit])
+        # Prefix matches are taken unordered so the scan can stop at the limit.
+        matches = exact
+        if len(matches) < limit:
+            # LIKE 'term%', served by the text_pattern_ops indexes on User.
+            prefixed = users.filter(
+                Q(username_lower__startswith=term) | Q(email_lower__startswith=term)
+            ).exclude(id__in=[user.id for user in exact]).order_by()[:limit - len(exact)]
+            matches = exact + sorted(prefixed, key=lambda user: user.username_lower)
+
+        return Response(UserMinimalSerializer(matches, many=True).data)
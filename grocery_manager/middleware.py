@@ -0,0 +1,160 @@
+"""
+Content-negotiated response compression.
+
+Works like Django's GZipMiddleware, but also offers Brotli and Zstandard
+when the optional ``brotli`` / ``zstandard`` packages are installed, picks
+the best encoding the client accepts, and skips responses smaller than
+``COMPRESSION_MIN_SIZE``. Streaming responses are compressed chunk by chunk,
+flushing after each one so clients still receive data incrementally.
+Strong ETags are weakened, as Django does, and the conditional request
+handling in apps.grocery.concurrency accepts weak tags, so revalidation keeps
+working.
+"""
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_sequence, compress_string
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Random bytes mixed into gzip output against BREACH, as in GZipMiddleware.
+GZIP_MAX_RANDOM_BYTES = 100
+# Fast levels suit per-request compression of dynamic JSON.
+BROTLI_QUALITY = 4
+ZSTD_LEVEL = 3
+
+re_coding = re.compile(r'^\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*$')
+
+
+class GzipCodec:
+    name = 'gzip'
+
+    def compress(self, data):
+        return compress_string(data, max_random_bytes=GZIP_MAX_RANDOM_BYTES)
+
+    def compress_stream(self, chunks):
+        return compress_sequence(chunks, max_random_bytes=GZIP_MAX_RANDOM_BYTES)
+
+
+class BrotliCodec:
+    name = 'br'
+
+    def compress(self, data):
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+
+    def compress_stream(self, chunks):
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+
+
+class ZstdCodec:
+    name = 'zstd'
+
+    def compress(self, data):
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+
+    def compress_stream(self, chunks):
+        compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        for chunk in chunks:
+            data = compressor.compress(chunk) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+CODECS = {codec.name: codec for codec in (GzipCodec(), BrotliCodec(), ZstdCodec())}
+INSTALLED = {'gzip': True, 'br': brotli is not None, 'zstd': zstandard is not None}
+
+
+def accepted_encodings(header):
+    """
+    Encodings named in an Accept-Encoding header with a non-zero q-value.
+    """
+    accepted = set()
+    for part in header.split(','):
+        match = re_coding.match(part)
+        if not match:
+            continue
+        try:
+            quality = float(match.group(2) or 1)
+        except ValueError:
+            continue
+        if quality > 0:
+            accepted.add(match.group(1).lower())
+    return accepted
+
+
+def negotiate(header, preference):
+    """
+    The first encoding in ``preference`` that is installed and accepted.
+    """
+    accepted = accepted_encodings(header)
+    for name in preference:
+        if INSTALLED.get(name) and (name in accepted or '*' in accepted):
+            return CODECS[name]
+    return None
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compress responses with zstd, Brotli or gzip according to Accept-Encoding.
+    """
+
+    def process_response(self, request, response):
+        min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+        if not response.streaming and len(response.content) < min_size:
+            return response
+
+        if response.has_header('Content-Encoding'):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        preference = getattr(settings, 'COMPRESSION_ENCODINGS', ['zstd', 'br', 'gzip'])
+        if response.streaming and response.is_async:
+            # Async chunks are compressed independently, as Django does, which
+            # relies on gzip members being concatenable.
+            preference = [name for name in preference if name == 'gzip']
+        codec = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''), preference)
+        if codec is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                original_iterator = response.streaming_content
+
+                async def compress_wrapper():
+                    async for chunk in original_iterator:
+                        yield codec.compress(chunk)
+
+                response.streaming_content = compress_wrapper()
+            else:
+                response.streaming_content = codec.compress_stream(response.streaming_content)
+            del response.headers['Content-Length']
+        else:
+            compressed = codec.compress(response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(response.content))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = codec.name
+
+        return response
@@ -0,0 +1,217 @@
+"""
+Opt-in slow-query log.
+
+With ``SLOW_QUERY_LOG_ENABLED``, SlowQueryMiddleware installs a
+``connection.execute_wrapper`` for each request. Queries slower than
+``SLOW_QUERY_THRESHOLD_MS`` are logged with the view that ran them and a
+fingerprint of their normalized SQL. For a sample of slow SELECTs the plan
+is captured too (``EXPLAIN (ANALYZE, BUFFERS)`` on PostgreSQL). Entries go to
+a small SQLite file, separate from the application database and capped at
+``SLOW_QUERY_LOG_MAX_ROWS``; ``manage.py slow_queries`` reports on it.
+"""
+import hashlib
+import logging
+import random
+import re
+import sqlite3
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+EXPLAIN_PREFIXES = {
+    'postgresql': 'EXPLAIN (ANALYZE, BUFFERS) ',
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+}
+# Trim the store back to its cap once every this many writes.
+TRIM_EVERY = 100
+
+re_string = re.compile(r"'(?:[^']|'')*'")
+re_number = re.compile(r'\b\d+(?:\.\d+)?\b')
+re_in_list = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?)\s*,?)+\)', re.IGNORECASE)
+re_space = re.compile(r'\s+')
+
+_state = threading.local()
+
+
+def normalize_sql(sql):
+    """
+    SQL with literals and placeholders collapsed, so queries differing only
+    in their values (or IN-list lengths) normalize alike.
+    """
+    sql = re_string.sub('?', sql)
+    sql = re_number.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = re_in_list.sub('IN (...)', sql)
+    return re_space.sub(' ', sql).strip()
+
+
+def fingerprint(normalized_sql):
+    return hashlib.sha1(normalized_sql.encode()).hexdigest()[:16]
+
+
+class SlowQueryStore:
+    """
+    Bounded SQLite store for slow-query entries.
+    """
+
+    def __init__(self, path=None, max_rows=None):
+        self.path = path or settings.SLOW_QUERY_LOG_PATH
+        self.max_rows = max_rows or settings.SLOW_QUERY_LOG_MAX_ROWS
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def connect(self):
+        db = sqlite3.connect(self.path, timeout=5)
+        db.execute(
+            'CREATE TABLE IF NOT EXISTS slow_queries ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, fingerprint TEXT NOT NULL, sql TEXT NOT NULL, '
+            'duration_ms REAL NOT NULL, origin TEXT NOT NULL, alias TEXT NOT NULL, explain TEXT, '
+            'created_at REAL NOT NULL)'
+        )
+        db.execute('CREATE INDEX IF NOT EXISTS slow_queries_fingerprint ON slow_queries (fingerprint)')
+        return db
+
+    def add(self, fingerprint, sql, duration_ms, origin, alias, explain=None):
+        with self._lock:
+            self._writes += 1
+            trim = self._writes % TRIM_EVERY == 0
+        with self.connect() as db:
+            db.execute(
+                'INSERT INTO slow_queries (fingerprint, sql, duration_ms, origin, alias, explain, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (fingerprint, sql, duration_ms, origin, alias, explain, time.time())
+            )
+            if trim:
+                db.execute(
+                    'DELETE FROM slow_queries WHERE id <= (SELECT MAX(id) FROM slow_queries) - ?',
+                    (self.max_rows,)
+                )
+        db.close()
+
+    def summary(self, since=0, limit=20):
+        """
+        Entries since ``since`` (a timestamp) grouped by fingerprint, slowest total first.
+        """
+        with self.connect() as db:
+            rows = db.execute(
+                'SELECT fingerprint, COUNT(*), SUM(duration_ms), MAX(duration_ms), MAX(created_at), '
+                'GROUP_CONCAT(DISTINCT origin), '
+                '(SELECT sql FROM slow_queries s WHERE s.fingerprint = q.fingerprint ORDER BY id DESC LIMIT 1), '
+                '(SELECT explain FROM slow_queries s WHERE s.fingerprint = q.fingerprint AND explain IS NOT NULL '
+                'ORDER BY id DESC LIMIT 1) '
+                'FROM slow_queries q WHERE created_at >= ? GROUP BY fingerprint '
+                'ORDER BY SUM(duration_ms) DESC LIMIT ?',
+                (since, limit)
+            ).fetchall()
+        db.close()
+        keys = ['fingerprint', 'count', 'total_ms', 'max_ms', 'last_seen', 'origins', 'sql', 'explain']
+        return [dict(zip(keys, row)) for row in rows]
+
+    def clear(self):
+        with self.connect() as db:
+            db.execute('DELETE FROM slow_queries')
+        db.close()
+
+
+class SlowQueryLogger:
+    """
+    ``execute_wrapper`` that times each query and records the slow ones.
+    """
+
+    def __init__(self, store, origin, threshold_ms, sample_rate):
+        self.store = store
+        self.origin = origin
+        self.threshold_ms = threshold_ms
+        self.sample_rate = sample_rate
+
+    def __call__(self, execute, sql, params, many, context):
+        if getattr(_state, 'explaining', False):
+            return execute(sql, params, many, context)
+        failed = True
+        start = time.perf_counter()
+        try:
+            result = execute(sql, params, many, context)
+            failed = False
+            return result
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            if duration_ms >= self.threshold_ms:
+                self.record(sql, params, many, context, duration_ms, can_explain=not failed)
+
+    def record(self, sql, params, many, context, duration_ms, can_explain=True):
+        connection = context['connection']
+        normalized = normalize_sql(sql)
+        key = fingerprint(normalized)
+        explain = None
+        if (
+            can_explain and not many
+            and normalized[:6].upper() == 'SELECT'
+            and 'FOR UPDATE' not in normalized.upper()
+            and random.random() < self.sample_rate
+        ):
+            explain = self.explain(connection, sql, params)
+        logger.warning(
+            'Slow query %s (%.1f ms) in %s: %s', key, duration_ms, self.origin, normalized[:500]
+        )
+        try:
+            self.store.add(key, normalized, duration_ms, self.origin, connection.alias, explain)
+        except sqlite3.Error:
+            logger.exception('Could not write to the slow-query log')
+
+    def explain(self, connection, sql, params):
+        prefix = EXPLAIN_PREFIXES.get(connection.vendor)
+        if prefix is None or connection.needs_rollback:
+            return None
+        _state.explaining = True
+        try:
+            # The savepoint keeps a failing EXPLAIN from breaking the request's transaction.
+            with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+                cursor.execute(prefix + sql, params)
+                return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+        except Exception:
+            logger.exception('Could not EXPLAIN slow query')
+            return None
+        finally:
+            _state.explaining = False
+
+
+class SlowQueryMiddleware:
+    """
+    Logs slow queries made while handling each request, when enabled.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'SLOW_QUERY_LOG_ENABLED', False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.store = SlowQueryStore()
+
+    def __call__(self, request):
+        origin = request.method
+        with ExitStack() as stack:
+            loggers = []
+            for connection in connections.all():
+                query_logger = SlowQueryLogger(
+                    self.store,
+                    origin,
+                    settings.SLOW_QUERY_THRESHOLD_MS,
+                    settings.SLOW_QUERY_EXPLAIN_SAMPLE_RATE
+                )
+                loggers.append(query_logger)
+                stack.enter_context(connection.execute_wrapper(query_logger))
+            request._slow_query_loggers = loggers
+            return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Queries from here on are attributed to the resolved view; DRF's
+        # route names include the action (e.g. groceryitem-toggle-purchased).
+        match = request.resolver_match
+        origin = f'{request.method} {match.view_name if match else request.path}'
+        for query_logger in getattr(request, '_slow_query_loggers', ()):
+            query_logger.origin = origin
@@ -26,6 +26,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'corsheaders',
     'apps.users',
@@ -36,6 +37,8 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'grocery_manager.middleware.CompressionMiddleware',
+    'grocery_manager.querylog.SlowQueryMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -73,9 +76,25 @@ DATABASES = {
         'PASSWORD': os.getenv('DB_PASSWORD', 'postgres'),
         'HOST': os.getenv('DB_HOST', 'localhost'),
         'PORT': os.getenv('DB_PORT', '5432'),
+        # Persistent connections, so the ones workers open at start-up
+        # (gunicorn.conf.py) serve their requests.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Extra databases for group shards, as "alias=database_name" pairs; each uses
+# the default connection settings with its own database name.
+for shard in filter(None, os.getenv('DB_SHARDS', '').split(',')):
+    alias, _, name = shard.partition('=')
+    DATABASES[alias.strip()] = {**DATABASES['default'], 'NAME': name.strip()}
+
+# Databases groups are spread over, in a fixed order: each one's position
+# determines the ids it allocates (see grocery_manager.sharding).
+GROCERY_SHARDS = os.getenv('GROCERY_SHARDS', 'default').split(',')
+
+DATABASE_ROUTERS = ['grocery_manager.sharding.ShardRouter']
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -118,8 +137,66 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
+    'DEFAULT_THROTTLE_CLASSES': [
+        'grocery_manager.throttling.UserBucketThrottle',
+        'grocery_manager.throttling.ActionBucketThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'user_search': '60/min',
+        # Token buckets (grocery_manager.throttling): the count is also the burst size.
+        'user': '1200/min',
+        'group': '600/min',
+        'action.toggle_purchased': '120/min',
+        'action.mark_purchased': '120/min',
+        'action.adjust_quantity': '240/min',
+        'action.bulk_create': '30/min',
+        'action.bulk_mark_purchased': '30/min',
+        'action.bulk_delete': '30/min',
+        'action.clear_purchased': '30/min',
+        'action.import_items': '10/min',
+        'action.apply_template': '30/min',
+        'action.bulk_add_members': '30/min',
+        'action.bulk_remove_members': '30/min',
+    },
 }
 
+# Where throttle buckets live: 'local' (per process) or 'cache' (shared
+# through THROTTLE_CACHE_ALIAS; use a shared cache with several workers).
+THROTTLE_STORE = os.getenv('THROTTLE_STORE', 'local')
+THROTTLE_CACHE_ALIAS = os.getenv('THROTTLE_CACHE_ALIAS', 'default')
+
+# Response compression (grocery_manager.middleware): encodings in order of
+# preference; 'br' and 'zstd' need the optional brotli / zstandard packages.
+COMPRESSION_ENCODINGS = ['zstd', 'br', 'gzip']
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '1024'))
+
+# Slow-query log (grocery_manager.querylog), off unless SLOW_QUERY_LOG=true.
+# A sample of slow SELECTs also gets its plan captured with EXPLAIN.
+SLOW_QUERY_LOG_ENABLED = os.getenv('SLOW_QUERY_LOG', 'False').lower() == 'true'
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', '200'))
+SLOW_QUERY_EXPLAIN_SAMPLE_RATE = float(os.getenv('SLOW_QUERY_EXPLAIN_SAMPLE_RATE', '0.1'))
+SLOW_QUERY_LOG_PATH = os.getenv('SLOW_QUERY_LOG_PATH', str(BASE_DIR / 'slow_queries.sqlite3'))
+SLOW_QUERY_LOG_MAX_ROWS = int(os.getenv('SLOW_QUERY_LOG_MAX_ROWS', '10000'))
+
+# How long responses to requests sent with an Idempotency-Key are replayed.
+IDEMPOTENCY_KEY_TTL_HOURS = int(os.getenv('IDEMPOTENCY_KEY_TTL_HOURS', '24'))
+
+# Where manage.py dispatch_outbox delivers grocery and membership events
+# (apps.grocery.outbox): a JSON-lines file by default, or POSTed to
+# OUTBOX_HTTP_URL when that is set.
+OUTBOX_SINK = {
+    'BACKEND': 'apps.grocery.outbox.FileSink',
+    'OPTIONS': {'path': os.getenv('OUTBOX_FILE_PATH', str(BASE_DIR / 'outbox_events.jsonl'))},
+}
+if os.getenv('OUTBOX_HTTP_URL'):
+    OUTBOX_SINK = {
+        'BACKEND': 'apps.grocery.outbox.HttpSink',
+        'OPTIONS': {'url': os.getenv('OUTBOX_HTTP_URL')},
+    }
+
+# What adjust_quantity does when an item reaches zero: 'keep', 'delete' or 'purchase'.
+GROCERY_QUANTITY_AT_ZERO = os.getenv('GROCERY_QUANTITY_AT_ZERO', 'keep')
+
 CORS_ALLOWED_ORIGINS = [
     'http://localhost:3000', 
     'http://127.0.0.1:3000'
@@ -133,12 +210,20 @@ CORS_ALLOW_HEADERS = [
     'authorization',
     'content-type',
     'dnt',
+    'idempotency-key',
+    'if-match',
+    'if-none-match',
     'origin',
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
 ]
 
+CORS_EXPOSE_HEADERS = [
+    'etag',
+    'idempotent-replayed',
+]
+
 CSRF_TRUSTED_ORIGINS = [
     'http://localhost:3000',
     'http://127.0.0.1:3000',
@@ -0,0 +1,563 @@
+"""
+Group-keyed horizontal sharding.
+
+Each group's rows (the group itself, its memberships, list, items and
+everything derived from them) live together on one of the databases named in
+``GROCERY_SHARDS``, so every join the views make stays on one database.
+Users stay on ``default`` and are copied to each shard, because group rows
+reference them.
+
+Each shard allocates ids from its own range of ``SHARD_ID_SPAN`` values,
+chosen by its position in ``GROCERY_SHARDS`` (``prepare_shards`` sets this
+up). An id therefore names the shard it was created on, and rows keep their
+ids when ``move_group`` moves their group to another shard. A GroupPlacement
+row on ``default`` records each group that lives somewhere else. Lookups by
+id try the id's own shard first and fall back to the others.
+
+ShardRouter sends queries on sharded models to the database of the instance
+they concern, or else to the shard selected with ``use_shard``. API views
+select it per request through ShardRoutingMixin. Reads across the user's
+groups page through each shard holding some of them and merge the pages
+(``ShardedRows``). With a single shard everything routes to ``default``.
+"""
+import heapq
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from functools import cmp_to_key
+from itertools import groupby, islice
+from operator import attrgetter
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Q
+from django.db.models.deletion import Collector
+from django.db.models.constants import OnConflict
+from rest_framework import permissions, status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+SHARDED_APPS = {'usergroups', 'grocery'}
+# Ids per shard. A shard's range follows from its position in GROCERY_SHARDS,
+# so shards may be appended but never reordered.
+SHARD_ID_SPAN = 2 ** 40
+COPY_BATCH_SIZE = 1000
+
+_current = ContextVar('grocery_shard', default=None)
+
+
+def shards():
+    return list(getattr(settings, 'GROCERY_SHARDS', [DEFAULT_DB_ALIAS]))
+
+
+def is_sharded():
+    return len(shards()) > 1
+
+
+def current_shard():
+    return _current.get() or DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def use_shard(alias):
+    """
+    Route queries on sharded models without an instance to ``alias``.
+    """
+    token = _current.set(alias)
+    try:
+        yield alias
+    finally:
+        _current.reset(token)
+
+
+def gather(func, aliases=None):
+    """
+    Call ``func`` on each shard in turn and concatenate the lists it returns.
+    """
+    results = []
+    for alias in aliases or shards():
+        with use_shard(alias):
+            results.extend(func())
+    return results
+
+
+def order_rows(rows, ordering):
+    """
+    Sort model instances in place by ``ordering`` (field names, ``-`` for
+    descending), as ORDER BY would have.
+    """
+    for term in reversed(ordering):
+        rows.sort(key=attrgetter(term.lstrip('-')), reverse=term.startswith('-'))
+    return rows
+
+
+def _ordering_key(ordering):
+    """
+    A sort key putting model instances in ``ordering``, with nulls sorting
+    as the largest values, as on PostgreSQL.
+    """
+    terms = [(attrgetter(term.lstrip('-')), term.startswith('-')) for term in ordering]
+
+    def compare(a, b):
+        for value, descending in terms:
+            x, y = value(a), value(b)
+            if x == y:
+                continue
+            less = y is None if (x is None) != (y is None) else x < y
+            return (1 if less else -1) if descending else (-1 if less else 1)
+        return 0
+
+    return cmp_to_key(compare)
+
+
+class ShardedRows:
+    """
+    The rows of the queryset ``build`` returns on each of ``aliases``, merged
+    in its ordering, with the primary key breaking ties. Supports what the
+    paginators use (``order_by``, ``filter``, ``count`` and bounded slices);
+    a slice reads no more than its stop from each shard and merges those.
+    Rows found on two shards, as while their group is moved, appear once.
+    """
+    ordered = True
+
+    def __init__(self, build, aliases=None, ordering=None, filters=None):
+        self.build = build
+        self.aliases = shards() if aliases is None else list(aliases)
+        self.ordering = ordering
+        self.filters = filters or {}
+
+    def _clone(self, **changes):
+        kwargs = {'aliases': self.aliases, 'ordering': self.ordering, 'filters': self.filters}
+        return type(self)(self.build, **{**kwargs, **changes})
+
+    def order_by(self, *ordering):
+        return self._clone(ordering=list(ordering))
+
+    def filter(self, **kwargs):
+        return self._clone(filters={**self.filters, **kwargs})
+
+    def _queryset(self):
+        queryset = self.build().filter(**self.filters)
+        ordering = list(self.ordering or queryset.query.order_by or queryset.model._meta.ordering)
+        pk_name = queryset.model._meta.pk.name
+        if not {'pk', '-pk', pk_name, f'-{pk_name}'} & set(ordering):
+            ordering.append('pk')
+        return queryset.order_by(*ordering), ordering
+
+    def count(self):
+        return sum(gather(lambda: [self._queryset()[0].count()], self.aliases))
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice) or index.stop is None or index.step not in (None, 1):
+            raise TypeError('ShardedRows only supports bounded slices.')
+        start = index.start or 0
+        if index.stop <= start:
+            return []
+        runs, ordering = [], None
+        for alias in self.aliases:
+            with use_shard(alias):
+                queryset, ordering = self._queryset()
+                runs.append(list(queryset[:index.stop]))
+        if ordering is None:
+            return []
+        merged = heapq.merge(*runs, key=_ordering_key(ordering))
+        rows = (next(copies) for _, copies in groupby(merged, key=attrgetter('pk')))
+        return list(islice(rows, start, index.stop))
+
+
+def is_sharded_model(model):
+    opts = model._meta
+    return opts.app_label in SHARDED_APPS and opts.model_name != 'groupplacement'
+
+
+def sharded_models():
+    return [
+        model for app_label in sorted(SHARDED_APPS)
+        for model in apps.get_app_config(app_label).get_models()
+        if is_sharded_model(model)
+    ]
+
+
+def _as_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def home_shard(pk):
+    """
+    The shard whose id range contains ``pk``.
+    """
+    aliases = shards()
+    pk = _as_id(pk)
+    index = pk // SHARD_ID_SPAN if pk is not None else 0
+    return aliases[index] if 0 <= index < len(aliases) else DEFAULT_DB_ALIAS
+
+
+def locate(model, pk):
+    """
+    The shard holding ``model`` row ``pk``: the one its id was allocated on,
+    unless its group has since moved.
+    """
+    home = home_shard(pk)
+    pk = _as_id(pk)
+    if not is_sharded() or pk is None:
+        return home
+    for alias in [home] + [alias for alias in shards() if alias != home]:
+        if model._base_manager.using(alias).filter(pk=pk).exists():
+            return alias
+    return home
+
+
+def _placements():
+    return apps.get_model('usergroups', 'GroupPlacement').objects.using(DEFAULT_DB_ALIAS)
+
+
+def shard_for_group(group_id):
+    if not is_sharded() or _as_id(group_id) is None:
+        return home_shard(group_id)
+    placed = _placements().filter(group_id=group_id).values_list('shard', flat=True).first()
+    return placed or home_shard(group_id)
+
+
+def groups_by_shard(group_ids):
+    """
+    Map each shard to those of ``group_ids`` that live on it.
+    """
+    group_ids = set(group_ids)
+    placed = {}
+    if is_sharded():
+        placed = dict(_placements().filter(group_id__in=group_ids).values_list('group_id', 'shard'))
+    by_shard = {}
+    for group_id in sorted(group_ids):
+        by_shard.setdefault(placed.get(group_id) or home_shard(group_id), []).append(group_id)
+    return by_shard
+
+
+def new_group_shard(user):
+    """
+    Where a group ``user`` creates goes: the groups one user creates stay
+    together, and users are spread evenly over the shards.
+    """
+    aliases = shards()
+    return aliases[user.pk % len(aliases)]
+
+
+class GroupMoving(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'This group is being moved; try again shortly.'
+    default_code = 'group_moving'
+
+
+def _share_lock_groups(group_ids):
+    """
+    Key-share lock the rows of ``group_ids`` on the current shard until the
+    transaction ends. Writers don't block each other this way, but
+    ``move_group`` locking a group for update waits for them.
+    """
+    connection = connections[current_shard()]
+    if connection.vendor != 'postgresql' or not connection.in_atomic_block:
+        return
+    opts = apps.get_model('usergroups', 'UserGroup')._meta
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT 1 FROM {qn(opts.db_table)} WHERE {qn(opts.pk.column)} = ANY(%s) FOR KEY SHARE',
+            [[int(group_id) for group_id in group_ids]]
+        )
+
+
+def check_groups_writable(group_ids):
+    """
+    Refuse writes to groups that are being moved, or have just moved off the
+    current shard. The groups stay locked against a move until the writer's
+    transaction ends, so a move either sees its write or is seen by it.
+    """
+    if not is_sharded():
+        return
+    group_ids = list(group_ids)
+    _share_lock_groups(group_ids)
+    # Once the lock is had, a move that held it may have finished already.
+    placements = _placements().filter(group_id__in=group_ids)
+    if placements.filter(Q(moving=True) | ~Q(shard=current_shard())).exists():
+        raise GroupMoving()
+
+
+def group_id_of(obj):
+    if obj._meta.label_lower == 'usergroups.usergroup':
+        return obj.pk
+    if hasattr(obj, 'group_id'):
+        return obj.group_id
+    return obj.grocery_list.group_id
+
+
+class ShardRouter:
+    """
+    Sends sharded models to their instance's shard or the current one;
+    everything else is left to the default routing.
+    """
+
+    def _route(self, model, hints):
+        if not is_sharded_model(model):
+            return None
+        instance = hints.get('instance')
+        if instance is not None and is_sharded_model(type(instance)) and instance._state.db:
+            return instance._state.db
+        return current_shard()
+
+    def db_for_read(self, model, **hints):
+        return self._route(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Users exist on every shard, so only two sharded rows must share one.
+        if is_sharded_model(type(obj1)) and is_sharded_model(type(obj2)):
+            return obj1._state.db == obj2._state.db
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if model_name == 'groupplacement':
+            return db == DEFAULT_DB_ALIAS
+        return None
+
+
+class ShardRoutingMixin:
+    """
+    Runs a view's queries on the shard its request is about, as picked by
+    ``get_shard``, and refuses writes to groups that are being moved; a
+    write request runs in one transaction on its shard.
+    Requests no single shard is picked for ``list`` rows from every shard,
+    a page from each merged into one.
+    """
+
+    def get_shard(self, request):
+        return None
+
+    def dispatch(self, request, *args, **kwargs):
+        with ExitStack() as self._write_transaction:
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if is_sharded():
+            self._shard_token = _current.set(self.get_shard(request))
+            if request.method not in permissions.SAFE_METHODS:
+                # Writes commit together at the end of the request, holding
+                # the locks check_groups_writable takes until then.
+                self._write_transaction.enter_context(transaction.atomic(using=current_shard()))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_shard_token', None)
+        if token is not None:
+            _current.reset(token)
+            self._shard_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        if not is_sharded() or _current.get() is not None:
+            return super().list(request, *args, **kwargs)
+
+        rows = ShardedRows(lambda: self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(rows[:rows.count()], many=True).data)
+
+    def check_object_permissions(self, request, obj):
+        super().check_object_permissions(request, obj)
+        if request.method not in permissions.SAFE_METHODS:
+            check_groups_writable([group_id_of(obj)])
+
+
+class ShardedCommand(BaseCommand):
+    """
+    A management command run on every shard in turn, or on the one named
+    with ``--shard``.
+    """
+
+    def create_parser(self, prog_name, subcommand, **kwargs):
+        parser = super().create_parser(prog_name, subcommand, **kwargs)
+        parser.add_argument('--shard', choices=shards(), help='Only run on this shard.')
+        return parser
+
+    def execute(self, *args, **options):
+        for alias in [options['shard']] if options.get('shard') else shards():
+            with use_shard(alias):
+                super().execute(*args, **options)
+            options['skip_checks'] = True
+
+
+def _insert_rows(model, rows, alias, upsert=False):
+    """
+    Insert ``rows`` into ``alias`` as they are, keeping primary keys and
+    timestamps (a raw insert, as loaddata does).
+    """
+    fields = model._meta.concrete_fields
+    copies = [model(**{field.attname: getattr(row, field.attname) for field in fields}) for row in rows]
+    connection = connections[alias]
+    batch_size = max(min(connection.ops.bulk_batch_size(fields, copies), COPY_BATCH_SIZE), 1)
+    conflict = {}
+    if upsert:
+        conflict = {
+            'on_conflict': OnConflict.UPDATE,
+            'unique_fields': [model._meta.pk],
+            'update_fields': [field for field in fields if not field.primary_key],
+        }
+    for start in range(0, len(copies), batch_size):
+        model._base_manager.using(alias)._insert(
+            copies[start:start + batch_size], fields=fields, raw=True, using=alias, **conflict
+        )
+
+
+def copy_users(alias, user_ids=None):
+    """
+    Upsert users from ``default`` into shard ``alias``: those in
+    ``user_ids``, or all of them.
+    """
+    User = get_user_model()
+    users = User.objects.using(DEFAULT_DB_ALIAS).order_by('pk')
+    if user_ids is not None:
+        users = users.filter(pk__in=list(user_ids))
+    copied = 0
+    batch = []
+    for user in users.iterator(chunk_size=COPY_BATCH_SIZE):
+        batch.append(user)
+        if len(batch) >= COPY_BATCH_SIZE:
+            _insert_rows(User, batch, alias, upsert=True)
+            copied += len(batch)
+            batch = []
+    if batch:
+        _insert_rows(User, batch, alias, upsert=True)
+        copied += len(batch)
+    return copied
+
+
+def replicate_user(sender, instance, raw=False, using=None, **kwargs):
+    if raw or using != DEFAULT_DB_ALIAS:
+        return
+    for alias in shards():
+        if alias != DEFAULT_DB_ALIAS:
+            _insert_rows(sender, [instance], alias, upsert=True)
+
+
+def remove_user_replicas(sender, instance, using=None, **kwargs):
+    if using != DEFAULT_DB_ALIAS:
+        return
+    for alias in shards():
+        if alias != DEFAULT_DB_ALIAS:
+            sender._base_manager.using(alias).filter(pk=instance.pk).delete()
+
+
+def _sequence_tables(alias):
+    return [
+        (model._meta.db_table, model._meta.pk.column) for model in sharded_models()
+        if model._meta.auto_field is not None and model._meta.managed
+    ]
+
+
+def reserve_id_range(alias):
+    """
+    Start every sharded table's ids on ``alias`` within the shard's range,
+    after the highest id already used there.
+    """
+    index = shards().index(alias)
+    start, end = index * SHARD_ID_SPAN, (index + 1) * SHARD_ID_SPAN
+    connection = connections[alias]
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        for table, column in _sequence_tables(alias):
+            in_range = f'SELECT MAX({qn(column)}) FROM {qn(table)} WHERE {qn(column)} < %s'
+            if connection.vendor == 'postgresql':
+                # Inserting explicit ids leaves sequences alone, so the first
+                # shard's never need moving.
+                if start:
+                    cursor.execute(
+                        f'SELECT setval(pg_get_serial_sequence(%s, %s), GREATEST(%s, ({in_range})))',
+                        [table, column, start, end]
+                    )
+            elif connection.vendor == 'sqlite':
+                cursor.execute(f'SELECT MAX(%s, COALESCE(({in_range}), 0))', [start, end])
+                seq = cursor.fetchone()[0]
+                cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s', [seq, table])
+                if not cursor.rowcount:
+                    cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [table, seq])
+            else:
+                raise NotImplementedError(f'Id ranges are not supported on {connection.vendor}.')
+
+
+def _loose_rows(alias, group_id):
+    """
+    Rows that refer to the group by a plain ``group_id`` rather than a foreign key.
+    """
+    for model in sharded_models():
+        field = next((f for f in model._meta.concrete_fields if f.attname == 'group_id'), None)
+        if field is not None and not field.is_relation:
+            yield model, model._base_manager.using(alias).filter(group_id=group_id)
+
+
+def move_group(group_id, target):
+    """
+    Copy group ``group_id`` and all its rows to shard ``target``, point its
+    placement there, then delete it from the shard it was on. Writes to the
+    group are refused until the copy is done, and the copy starts once
+    writes already under way have committed. Returns the number of rows moved.
+    """
+    UserGroup = apps.get_model('usergroups', 'UserGroup')
+    User = get_user_model()
+    source = shard_for_group(group_id)
+    if source == target:
+        raise ValueError(f'Group {group_id} is already on {target}.')
+
+    placements = _placements()
+    placements.update_or_create(group_id=group_id, defaults={'shard': source, 'moving': True})
+    try:
+        with transaction.atomic(using=source):
+            # Waits for writers that got past check_groups_writable before the
+            # group was marked as moving; later ones see the mark and back off.
+            group = UserGroup.objects.using(source).select_for_update().get(pk=group_id)
+            collector = Collector(using=source)
+            collector.collect([group])
+            collector.sort()
+            # Collected in deletion order, so referenced rows are inserted first
+            # by going backwards; fast-deleted querysets hold leaf rows.
+            tables = [(model, sorted(rows, key=lambda row: row.pk)) for model, rows in reversed(collector.data.items())]
+            tables += [(qs.model, list(qs.order_by('pk'))) for qs in collector.fast_deletes]
+            loose = [(model, list(qs.order_by('pk'))) for model, qs in _loose_rows(source, group_id)]
+            if connections[target].vendor == 'sqlite':
+                # SQLite never allocates an id below a table's largest, so ids
+                # from a later shard's range would carry the target into it.
+                end = (shards().index(target) + 1) * SHARD_ID_SPAN
+                if any(row.pk >= end for _, rows in tables + loose for row in rows):
+                    raise ValueError(
+                        f'On SQLite, group {group_id} cannot move to {target}, a shard before the one its ids came from.'
+                    )
+
+            user_ids = {
+                getattr(row, field.attname)
+                for model, rows in tables for row in rows
+                for field in model._meta.concrete_fields
+                if field.is_relation and field.related_model is User and getattr(row, field.attname) is not None
+            }
+            with transaction.atomic(using=target):
+                # Drop what an earlier, interrupted move may have left behind.
+                UserGroup.objects.using(target).filter(pk=group_id).delete()
+                for model, qs in _loose_rows(target, group_id):
+                    qs.delete()
+                copy_users(target, user_ids)
+                for model, rows in tables + loose:
+                    _insert_rows(model, rows, target)
+    except BaseException:
+        placements.filter(group_id=group_id).update(moving=False)
+        raise
+
+    placements.filter(group_id=group_id).update(shard=target, moving=False)
+    with transaction.atomic(using=source):
+        collector.delete()
+        for model, qs in _loose_rows(source, group_id):
+            qs.delete()
+    return sum(len(rows) for _, rows in tables + loose)
@@ -0,0 +1,214 @@
+"""
+Token-bucket rate limiting for the API.
+
+Throttles use GCRA (the generic cell rate algorithm), which is a token
+bucket kept as a single number per key: the "theoretical arrival time"
+(TAT) at which the bucket will be full again. A rate of ``N/period``
+refills one token every ``period / N`` seconds and allows bursts of ``N``.
+
+Counters live in a pluggable store selected by ``THROTTLE_STORE``:
+``'local'`` keeps them in process memory, ``'cache'`` shares them between
+workers through the Django cache named by ``THROTTLE_CACHE_ALIAS`` using
+atomic ``add``/``incr``.
+
+Rates come from ``REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']``: ``user`` for
+every request, ``group`` for writes to one group, and ``action.<name>`` for
+individual viewset actions.
+"""
+import math
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from rest_framework import permissions
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+@lru_cache(maxsize=None)
+def parse_rate(rate):
+    """
+    ``'120/min'`` -> ``(120, 60)``, in DRF's rate format.
+    """
+    count, period = rate.split('/')
+    return int(count), DURATIONS[period[0]]
+
+
+class LocalBucketStore:
+    """
+    Per-process bucket state guarded by a lock.
+    """
+    max_keys = 100000
+
+    def __init__(self):
+        self._tats = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key, now, interval, burst):
+        """
+        Take one token from ``key``'s bucket. Returns 0 if allowed, otherwise
+        the seconds until a token is available.
+        """
+        with self._lock:
+            tat = max(self._tats.get(key, now), now) + interval
+            allowed_at = tat - burst * interval
+            if allowed_at > now:
+                return allowed_at - now
+            if len(self._tats) >= self.max_keys:
+                # Buckets whose TAT has passed are full; forgetting them is lossless.
+                self._tats = {k: v for k, v in self._tats.items() if v > now}
+            self._tats[key] = tat
+            return 0
+
+
+class CacheBucketStore:
+    """
+    Bucket state shared through a Django cache, as integer milliseconds.
+
+    Each check is an atomic ``incr`` of the TAT plus a ``touch`` to keep the
+    key alive; a rejected request gives its token back with ``decr``.
+    """
+
+    def __init__(self, alias='default'):
+        self.cache = caches[alias]
+
+    def consume(self, key, now, interval, burst):
+        key = f'throttle:{key}'
+        now_ms = int(now * 1000)
+        step = max(int(interval * 1000), 1)
+        window = step * burst
+        timeout = math.ceil(window / 1000) + 1
+
+        if self.cache.add(key, now_ms + step, timeout):
+            return 0
+        try:
+            tat = self.cache.incr(key, step)
+        except ValueError:
+            # Expired between add() and incr().
+            self.cache.set(key, now_ms + step, timeout)
+            return 0
+        if tat < now_ms + step:
+            # The bucket had refilled completely; restart it from now. Racing
+            # requests may each do this, which only errs on the permissive side.
+            self.cache.set(key, now_ms + step, timeout)
+            return 0
+        if tat - now_ms > window:
+            self.cache.decr(key, step)
+            return (tat - now_ms - window) / 1000
+        self.cache.touch(key, timeout)
+        return 0
+
+
+_store = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        if getattr(settings, 'THROTTLE_STORE', 'local') == 'cache':
+            _store = CacheBucketStore(getattr(settings, 'THROTTLE_CACHE_ALIAS', 'default'))
+        else:
+            _store = LocalBucketStore()
+    return _store
+
+
+def _reset_store(setting, **kwargs):
+    global _store
+    if setting in ('THROTTLE_STORE', 'THROTTLE_CACHE_ALIAS'):
+        _store = None
+
+
+setting_changed.connect(_reset_store)
+
+
+class BucketThrottle(BaseThrottle):
+    """
+    Base class: subclasses pick the rate scope and the bucket key.
+    """
+    timer = time.time
+    THROTTLE_RATES = api_settings.DEFAULT_THROTTLE_RATES
+    scope = None
+
+    def get_scope(self, request, view):
+        return self.scope
+
+    def get_key(self, request, view):
+        raise NotImplementedError('.get_key() must be overridden')
+
+    def consume(self, scope, key):
+        self.wait_seconds = 0
+        rate = self.THROTTLE_RATES.get(scope)
+        if rate is None or key is None:
+            return True
+        count, period = parse_rate(rate)
+        self.wait_seconds = get_store().consume(f'{scope}:{key}', self.timer(), period / count, count)
+        return not self.wait_seconds
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(request, view)
+        if scope is None:
+            return True
+        return self.consume(scope, self.get_key(request, view))
+
+    def wait(self):
+        return self.wait_seconds or None
+
+
+class UserBucketThrottle(BucketThrottle):
+    """
+    Every request, per authenticated user (or client address).
+    """
+    scope = 'user'
+
+    def get_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return f'anon:{self.get_ident(request)}'
+
+
+class ActionBucketThrottle(UserBucketThrottle):
+    """
+    Per user and viewset action, for actions with an ``action.<name>`` rate.
+    """
+
+    def get_scope(self, request, view):
+        action = getattr(view, 'action', None)
+        return f'action.{action}' if action else None
+
+
+class GroupBucketThrottle(BucketThrottle):
+    """
+    Writes to one group, whoever makes them. Checked by GroupThrottleMixin
+    once the view knows the group.
+    """
+    scope = 'group'
+
+    def allow_group(self, request, group_id):
+        return self.consume(self.scope, group_id)
+
+
+class GroupThrottleMixin:
+    """
+    Applies group throttles to unsafe requests on a single object, and to
+    any other write whose view calls ``check_group_throttles`` itself.
+    """
+    group_throttle_classes = [GroupBucketThrottle]
+
+    def get_throttle_group_id(self, obj):
+        raise NotImplementedError('.get_throttle_group_id() must be overridden')
+
+    def check_group_throttles(self, request, group_id):
+        for throttle_class in self.group_throttle_classes:
+            throttle = throttle_class()
+            if not throttle.allow_group(request, group_id):
+                self.throttled(request, throttle.wait())
+
+    def check_object_permissions(self, request, obj):
+        super().check_object_permissions(request, obj)
+        if request.method not in permissions.SAFE_METHODS:
+            self.check_group_throttles(request, self.get_throttle_group_id(obj))
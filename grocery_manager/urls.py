@@ -16,10 +16,12 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from apps.grocery.views import BootstrapView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/users/', include('apps.users.urls')),
     path('api/usergroups/', include('apps.usergroups.urls')),
     path('api/grocery/', include('apps.grocery.urls')),
+    path('api/bootstrap/', BootstrapView.as_view(), name='bootstrap'),
 ]
@@ -0,0 +1,167 @@
+"""
+Worker warm-up.
+
+A fresh worker otherwise does a lot of one-off work on its first requests:
+compiling URL patterns, filling in model metadata, building serializer
+fields, importing DRF's configured classes, loading translation catalogs
+and connecting to the database. ``warm_up`` does that work up front. Run it
+in the gunicorn master with ``preload_app`` so forked workers share the
+result, then ``connect`` in each worker; gunicorn.conf.py does both.
+
+``manage.py warm_up`` reports how long each step takes, and with
+``--import-times`` the slowest imports at start-up.
+"""
+import importlib
+import logging
+import os
+import re
+import subprocess
+import sys
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from django.urls import URLResolver, get_resolver
+from django.utils import translation
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+
+logger = logging.getLogger(__name__)
+
+re_import_time = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def load_urls():
+    """
+    Compile every URL pattern and build the reverse lookup tables.
+    """
+    resolver = get_resolver()
+    resolver.reverse_dict  # Built on first access, as are the compiled patterns below.
+    count = 0
+    pending = [resolver]
+    while pending:
+        resolver = pending.pop()
+        for pattern in resolver.url_patterns:
+            pattern.pattern.regex
+            count += 1
+            if isinstance(pattern, URLResolver):
+                pending.append(pattern)
+    return count
+
+
+def load_models():
+    """
+    Fill each model's field caches, including the reverse relations that
+    are otherwise found by scanning every model on first use.
+    """
+    models = apps.get_models()
+    for model in models:
+        model._meta.get_fields()
+    return len(models)
+
+
+def build_serializers():
+    """
+    Build the fields of every serializer defined in a project app's
+    serializers module. Serializers that need arguments to construct are
+    skipped.
+    """
+    count = 0
+    for app_config in apps.get_app_configs():
+        if not app_config.path.startswith(str(settings.BASE_DIR)):
+            continue
+        try:
+            module = importlib.import_module(f'{app_config.name}.serializers')
+        except ModuleNotFoundError:
+            continue
+        for value in vars(module).values():
+            if not (
+                isinstance(value, type) and issubclass(value, serializers.BaseSerializer)
+                and value.__module__ == module.__name__
+            ):
+                continue
+            try:
+                value(context={}).fields
+            except Exception as exc:
+                logger.debug('Skipped warming %s: %s', value.__qualname__, exc)
+                continue
+            count += 1
+    return count
+
+
+def load_api_settings():
+    """
+    Import the classes named in REST_FRAMEWORK, which DRF does on first use.
+    """
+    for name in api_settings.defaults:
+        getattr(api_settings, name)
+    return len(api_settings.defaults)
+
+
+def load_translations():
+    with translation.override(settings.LANGUAGE_CODE):
+        translation.gettext('Not found.')
+    return 1
+
+
+def connect(aliases=None):
+    """
+    Open a connection to each database. Connections belong to a thread and
+    must not cross a fork, so call this in the worker that will use them.
+    """
+    aliases = aliases or list(connections)
+    for alias in aliases:
+        connections[alias].ensure_connection()
+    return len(aliases)
+
+
+STEPS = [
+    ('urls', load_urls),
+    ('models', load_models),
+    ('serializers', build_serializers),
+    ('api settings', load_api_settings),
+    ('translations', load_translations),
+]
+
+
+def warm_up(steps=STEPS):
+    """
+    Run each warm-up step. Returns ``(name, count, seconds)`` per step.
+    """
+    timings = []
+    for name, step in steps:
+        start = time.perf_counter()
+        count = step()
+        timings.append((name, count, time.perf_counter() - start))
+    return timings
+
+
+def parse_import_times(output):
+    """
+    ``(module, self_us, cumulative_us, depth)`` for each line of
+    ``python -X importtime`` output.
+    """
+    rows = []
+    for line in output.splitlines():
+        match = re_import_time.match(line)
+        if match:
+            rows.append((match.group(4), int(match.group(1)), int(match.group(2)), len(match.group(3)) // 2))
+    return rows
+
+
+def measure_imports():
+    """
+    Import times of a fresh interpreter that sets up Django and loads the
+    URLconf, as a worker does before its first request.
+    """
+    code = (
+        'import django; django.setup(); '
+        'from django.urls import get_resolver; get_resolver().url_patterns'
+    )
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', settings.SETTINGS_MODULE)}
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        capture_output=True, text=True, env=env, check=True
+    )
+    return parse_import_times(result.stderr)
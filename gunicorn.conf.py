@@ -0,0 +1,51 @@
+"""
+Gunicorn settings: ``gunicorn -c gunicorn.conf.py``.
+
+The application is loaded and warmed up in the master (see
+grocery_manager.warmup) before workers are forked, so each worker starts
+with URL resolvers, model metadata and serializer fields already built, in
+memory shared copy-on-write. Workers then open their database connections
+before accepting requests.
+"""
+import gc
+import multiprocessing
+import os
+
+wsgi_app = 'grocery_manager.wsgi:application'
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+preload_app = True
+
+
+def log_timings(log, timings):
+    for name, count, seconds in timings:
+        log.info('Warmed up %s (%d) in %.1f ms', name, count, seconds * 1000)
+
+
+def when_ready(server):
+    if not server.cfg.preload_app:
+        return
+    from grocery_manager.warmup import warm_up
+
+    log_timings(server.log, warm_up())
+    # Keep the collector from touching (and so copying) the master's objects
+    # in every worker.
+    gc.freeze()
+
+
+def pre_fork(server, worker):
+    if server.cfg.preload_app:
+        from django.db import connections
+
+        # A connection opened while loading must not be shared by the workers.
+        connections.close_all()
+
+
+def post_worker_init(worker):
+    from grocery_manager.warmup import STEPS, connect, warm_up
+
+    steps = [('connections', connect)]
+    if not worker.cfg.preload_app:
+        steps = STEPS + steps
+    log_timings(worker.log, warm_up(steps))